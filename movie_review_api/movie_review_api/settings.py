@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -60,9 +61,10 @@ TEMPLATES = [
 
 
 REST_FRAMEWORK = {
+    # Token first: API clients are resolved from the token cache without touching the session
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'reviews.authentication.CachingTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -70,11 +72,23 @@ REST_FRAMEWORK = {
 
     ],
 
+    # orjson-backed JSON, MessagePack when the msgpack package is installed (see reviews/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'reviews.renderers.FastJSONRenderer',
+        *(['reviews.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'reviews.throttling.TokenBucketThrottle',
+    ],
 }
 
 MIDDLEWARE = [
+    'reviews.middleware.PerformanceMiddleware',
+    'reviews.middleware.CompressionMiddleware',
+    'reviews.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,15 +108,166 @@ WSGI_APPLICATION = 'movie_review_api.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'movie_review_db',
-        'USER': 'reviewer',
-        'PASSWORD': 'reviewr01',
-        'HOST': 'localhost',
-        'PORT': '3306',
+        'NAME': os.environ.get('DB_NAME', 'movie_review_db'),
+        'USER': os.environ.get('DB_USER', 'reviewer'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'reviewr01'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '3306'),
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        }
+        },
+        # Keep connections open between requests; check them before reuse so a dropped one is replaced
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica-a:3306,replica-b (see reviews/routers.py)
+for index, address in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'USER': os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# CI and local test runs can use SQLite instead of the MySQL instance (DB_ENGINE=sqlite). The
+# 'replica' alias mirrors it and only receives reads when DB_SQLITE_REPLICA=1 (or in routing tests).
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_SQLITE_REPLICA_PATH', BASE_DIR / 'db.sqlite3'),
+            'TEST': {'MIRROR': 'default'},
+        },
     }
+
+DATABASE_ROUTERS = ['reviews.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+if os.environ.get('DB_ENGINE') == 'sqlite' and os.environ.get('DB_SQLITE_REPLICA') != '1':
+    DATABASE_REPLICAS = []
+# Seconds a client's reads stay on the primary after it writes, so it reads its own writes
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '5'))
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# In-process by default; set REDIS_URL to share the cache between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Response cache for movie detail and the review/comment listings (see reviews/cache.py)
+REVIEWS_CACHE = {
+    'ENABLED': True,
+    'TIMEOUT': 60,  # Seconds a cached response is served as fresh
+    'STALE_TIMEOUT': 300,  # Further seconds it may be served while one request refreshes it
+    'LOCK_TIMEOUT': 10,
+    # ETags and 304s need version counters shared by every worker: by default (None) they are only
+    # sent with a shared cache such as Redis. CONDITIONAL_GET=1 forces them on for a single process
+    # with the local-memory cache.
+    'CONDITIONAL': {'1': True, '0': False}.get(os.environ.get('CONDITIONAL_GET', '')),
+}
+
+# Request metrics (see reviews/middleware.py); exposed at /api/metrics/
+REVIEWS_METRICS = {
+    'ENABLED': os.environ.get('METRICS', '1') == '1',
+    'SAMPLE_RATE': float(os.environ.get('METRICS_SAMPLE_RATE', '1.0')),
+    'SLOW_REQUEST_MS': 500,
+    'DUPLICATE_QUERY_THRESHOLD': 5,
+}
+
+# Write-behind likes and movie view counts (see reviews/writebehind.py)
+REVIEWS_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('WRITE_BEHIND', '') == '1',
+    'BACKEND': 'cache' if os.environ.get('REDIS_URL') else 'memory',  # 'cache' survives worker crashes
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Search backend: 'fulltext' (MySQL FULLTEXT), 'index' (built-in inverted index) or 'auto'
+REVIEWS_SEARCH = {
+    'BACKEND': os.environ.get('SEARCH_BACKEND', 'auto'),
+}
+
+# Leaderboard tuning (see reviews/leaderboards.py)
+REVIEWS_LEADERBOARDS = {
+    'PRIOR_WEIGHT': 10,  # Reviews' worth of the global mean every movie starts with
+    'TRENDING_HALF_LIFE_HOURS': 24,
+    'TRENDING_WINDOW_DAYS': 7,
+    'REVIEW_WEIGHT': 3,
+    'LIKE_WEIGHT': 1,
+}
+
+# Request throttling (see reviews/throttling.py): token buckets of N requests refilled at N per
+# period, per user (or IP address when anonymous) for each scope. 'user' and 'anon' apply to every
+# request; the others to the endpoints that name them. Put the cache on Redis to share the buckets.
+REVIEWS_THROTTLE = {
+    'ENABLED': os.environ.get('THROTTLE', '1') == '1',
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
+    'RATES': {
+        'anon': '120/min',
+        'user': '1200/min',
+        'register': '10/hour',
+        'token': '10/min',
+        'review_list': '300/min',
+        'review_create': '20/min',
+        'comment_create': '30/min',
+        'like': '120/min',
+    },
+}
+
+# Response compression (see reviews/compression.py): Brotli when the brotli package is installed
+# and the client accepts it, otherwise gzip, for bodies of MIN_SIZE bytes or more
+REVIEWS_COMPRESSION = {
+    'ENABLED': os.environ.get('COMPRESSION', '1') == '1',
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# Similar movies (see reviews/similarity.py), built by `python manage.py build_similar_movies`
+REVIEWS_SIMILARITY = {
+    'TOP_K': 20,
+    'LIKED_RATING': 4,  # Reviews rated at least this count as liking the movie
+    'MIN_CORATERS': 2,
+}
+
+# Background jobs (see reviews/jobs.py), run by `python manage.py run_jobs`. JOBS_EAGER=1 runs
+# each job in-process as soon as it is enqueued instead.
+REVIEWS_JOBS = {
+    'EAGER': os.environ.get('JOBS_EAGER', '0') == '1',
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+}
+
+# API token authentication (see reviews/authentication.py): resolved tokens are kept for TIMEOUT
+# seconds, per process ('memory') or in the shared cache ('cache'). Tokens older than
+# EXPIRES_AFTER seconds are rejected (None: never).
+REVIEWS_TOKEN_AUTH = {
+    'BACKEND': os.environ.get('TOKEN_AUTH_BACKEND', 'memory'),
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+    'EXPIRES_AFTER': int(os.environ['TOKEN_EXPIRES_AFTER']) if os.environ.get('TOKEN_EXPIRES_AFTER') else None,
+}
+
+# Per-user feeds (see reviews/feeds.py)
+REVIEWS_FEEDS = {
+    'FEED_LENGTH': 200,
+    'FANOUT_LIMIT': 1000,  # Movies with more followers are merged into feeds on read
 }
 
 # Password validation
@@ -1,3 +1,125 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-# Register your models here.
+from . import jobs, moderation
+from .models import Comment, Job, Like, Movie, Review
+
+
+def table_row_estimate(model, using):
+    # The planner's row estimate for the model's table, or None where the backend has none
+    connection = connections[using]
+    sql = {
+        'mysql': 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() '
+                 'AND TABLE_NAME = %s',
+        'postgresql': 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+    }.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+# Paginator that trusts the table statistics instead of running COUNT(*) over an unfiltered
+# changelist of a large table; filtered and searched changelists are still counted exactly
+class ApproximateCountPaginator(Paginator):
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = table_row_estimate(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
+
+
+# Shared changelist settings: approximate counts, no second full-table count for the
+# "x of y selected" line, and newest rows first along the primary key
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-pk',)
+
+
+# Admin actions run through moderation.run(): chunked transactions and raw cascades instead of
+# Django's delete_selected, which loads every related like and comment and sends a signal per row
+class ModeratedAdmin(LargeTableAdmin):
+    kind = None
+    actions = ['hide_selected', 'unhide_selected', 'delete_selected_in_bulk']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def moderate(self, request, queryset, action, verb):
+        report = {'changed': 0}
+        for report in moderation.run(self.kind, action, queryset):
+            pass
+        self.message_user(request, f'{verb} {report["changed"]} {self.kind}s.', messages.SUCCESS)
+
+    @admin.action(description='Hide selected %(verbose_name_plural)s')
+    def hide_selected(self, request, queryset):
+        self.moderate(request, queryset, 'hide', 'Hid')
+
+    @admin.action(description='Unhide selected %(verbose_name_plural)s')
+    def unhide_selected(self, request, queryset):
+        self.moderate(request, queryset, 'unhide', 'Unhid')
+
+    @admin.action(description='Delete selected %(verbose_name_plural)s', permissions=['delete'])
+    def delete_selected_in_bulk(self, request, queryset):
+        self.moderate(request, queryset, 'delete', 'Deleted')
+
+
+@admin.register(Movie)
+class MovieAdmin(LargeTableAdmin):
+    list_display = ('id', 'title', 'release_date', 'view_count')
+    search_fields = ('^title',)  # Prefix match on the unique title index
+    readonly_fields = ('normalized_title',)  # Derived from the title on save
+
+
+@admin.register(Review)
+class ReviewAdmin(ModeratedAdmin):
+    kind = 'review'
+    list_display = ('id', 'movie', 'user', 'rating', 'like_count', 'is_hidden', 'created_date')
+    list_select_related = ('movie', 'user')
+    list_filter = ('is_hidden',)
+    raw_id_fields = ('movie', 'user')
+    readonly_fields = ('like_count',)
+    search_fields = ('^movie__title', '=user__username', '=id')
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'review', 'created_date')
+    list_select_related = ('user', 'review__movie')
+    raw_id_fields = ('user', 'review')
+    search_fields = ('=user__username', '=review__id')
+
+
+@admin.register(Comment)
+class CommentAdmin(ModeratedAdmin):
+    kind = 'comment'
+    list_display = ('id', 'review', 'user', 'is_hidden', 'created_at')
+    list_select_related = ('review__movie', 'review__user', 'user')
+    list_filter = ('is_hidden',)
+    raw_id_fields = ('review', 'user')
+    search_fields = ('=user__username', '=review__id')
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('claimed_by', 'last_error', 'created_at')
+    actions = ['retry_selected']
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry_selected(self, request, queryset):
+        self.message_user(request, f'Queued {jobs.retry_failed(queryset)} jobs again.', messages.SUCCESS)
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ReviewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reviews'
+
+    def ready(self):
+        from . import metrics, signals, tasks  # noqa: F401  (connects the receivers, registers the job tasks)
+        connection_created.connect(metrics.install)
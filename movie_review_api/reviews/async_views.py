@@ -0,0 +1,210 @@
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import authentication, cache, conditional, throttling, writebehind
+from .filters import ReviewFilter
+from .models import Comment, Movie, Review
+from .pagination import CommentPagination, ReviewPagination
+from .serializers import CommentSerializer, MovieRatingSerializer, MovieSerializer, ReviewSerializer, parse_fields, \
+    values_columns
+from .views import REVIEW_LIST_FIELDS, add_like, movie_detail_options, movie_detail_queryset, remove_like
+
+# ASGI-native variants of the hottest endpoints, routed under /api/async/
+#
+# They return the same bodies as their sync counterparts and share their querysets, serializers,
+# pagination and response cache, but await the ORM, cache and authentication, so a request waiting
+# on the database or a slow client does not hold a worker thread. DRF views are sync-only, so these
+# are plain Django views that mirror DEFAULT_AUTHENTICATION_CLASSES and IsAuthenticated themselves.
+
+NOT_AUTHENTICATED = 'Authentication credentials were not provided.'
+
+
+async def authenticate(request):
+    # The owner of a 'Token <key>' header, else the session user. Returns (user, None) or (None, reason).
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'token' and key.strip():
+        try:
+            user, _ = await authentication.aresolve(key.strip())
+        except AuthenticationFailed as exc:
+            return None, exc.detail
+        request.user = user
+        return user, None
+
+    user = await request.auser()
+    if user.is_authenticated:
+        return user, None
+    return None, NOT_AUTHENTICATED
+
+
+def _csrf_failure(request):
+    # Like DRF's SessionAuthentication, only session-authenticated requests need a CSRF token
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+def async_api_view(methods, unauthenticated=(NOT_AUTHENTICATED, status.HTTP_401_UNAUTHORIZED), throttle_scope=None):
+    # Authenticates (the view receives the user), enforces CSRF for session users on unsafe
+    # methods, applies the same throttles as the sync views and turns 404s into JSON bodies
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            user, reason = await authenticate(request)
+            if user is None:
+                detail, code = unauthenticated if reason == NOT_AUTHENTICATED else (reason, status.HTTP_401_UNAUTHORIZED)
+                response = JsonResponse({'detail': detail}, status=code)
+                if code == status.HTTP_401_UNAUTHORIZED:
+                    response['WWW-Authenticate'] = 'Token'
+                return response
+            if request.method not in ('GET', 'HEAD', 'OPTIONS') and 'Authorization' not in request.headers:
+                failure = _csrf_failure(request)
+                if failure is not None:
+                    return failure
+            wait = await throttling.acheck(request, user, throttle_scope)
+            if wait:
+                return throttling.throttled_response(wait)
+            try:
+                return await view(request, user, *args, **kwargs)
+            except (Http404, NotFound) as exc:
+                return JsonResponse({'detail': str(exc)}, status=status.HTTP_404_NOT_FOUND)
+        return wrapper
+    return decorator
+
+
+async def paginate(request, queryset, pagination_class):
+    # Returns (rows, envelope) in the same shapes as the sync listings: page numbers by default,
+    # keyset with ?pagination=keyset or ?cursor=
+    paginator = pagination_class()
+    query = Request(request)
+    page_size = paginator.get_page_size(query)
+    queryset = queryset.order_by(*paginator.ordering)
+    url = request.build_absolute_uri()
+
+    if paginator.cursor_query_param in request.GET or request.GET.get(paginator.mode_query_param) == 'keyset':
+        position = paginator.decode_cursor(query)
+        if position is not None:
+            queryset = queryset.filter(paginator.seek(*position))
+        rows = [row async for row in queryset[:page_size + 1]]
+        next_link = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_link = replace_query_param(remove_query_param(url, paginator.mode_query_param),
+                                            paginator.cursor_query_param,
+                                            paginator.encode_cursor(paginator.position_of(rows[-1])))
+        return rows, {'next': next_link}
+
+    try:
+        page = int(request.GET.get(paginator.page_query_param) or 1)
+    except ValueError:
+        page = 0
+    count = await queryset.acount()
+    if not 1 <= page <= max(1, math.ceil(count / page_size)):
+        raise NotFound(paginator.invalid_page_message.format(page_number=page, message=''))
+    rows = [row async for row in queryset[(page - 1) * page_size:page * page_size]]
+    next_link = replace_query_param(url, paginator.page_query_param, page + 1) if page * page_size < count else None
+    if page == 1:
+        previous_link = None
+    elif page == 2:
+        previous_link = remove_query_param(url, paginator.page_query_param)
+    else:
+        previous_link = replace_query_param(url, paginator.page_query_param, page - 1)
+    return rows, {'count': count, 'next': next_link, 'previous': previous_link}
+
+
+# Async Movie Detail View
+@async_api_view(['GET'])
+async def movie_detail(request, user, movie_id):
+    fields, reviews_limit = movie_detail_options(request.GET)
+    # Same cache entry and validators as MovieDetailView, so either path warms the other
+    name = f'movie:{movie_id}:{reviews_limit}:{fields}'
+
+    async def compute():
+        movie = await movie_detail_queryset(reviews_limit).filter(pk=movie_id).afirst()
+        if movie is None:
+            raise Http404('No Movie matches the given query.')
+        return MovieSerializer(movie, context={'fields': fields}).data
+
+    async def build():
+        return JsonResponse(await cache.afetch(name, [('movie', movie_id)], compute))
+
+    response = await conditional.arespond(request, name, [('movie', movie_id)], build)
+    if writebehind.enabled():
+        await sync_to_async(writebehind.record_view)(movie_id)
+    return response
+
+
+# Async Review List View
+@async_api_view(['GET'], throttle_scope='review_list')
+async def review_list(request, user):
+    filterset = ReviewFilter(request.GET, queryset=Review.objects.filter(is_hidden=False)
+                             .select_related('user', 'movie').only(*REVIEW_LIST_FIELDS))
+    # Validating the movie choice may query, which the filter form only does synchronously
+    if not await sync_to_async(filterset.is_valid)():
+        return JsonResponse(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    movie = None
+    movie_title = request.GET.get('movie_title')
+    if movie_title:
+        movie = await Movie.objects.filter(title=movie_title).select_related('rating').afirst()
+    movie_id = movie.pk if movie else request.GET.get('movie', '')
+    depends_on = [('movie', int(movie_id))] if str(movie_id).isdigit() else [('reviews',)]
+    fields = parse_fields(request.GET)
+
+    async def compute():
+        rows, envelope = await paginate(request, filterset.qs.values(*values_columns(ReviewSerializer)),
+                                        ReviewPagination)
+        data = {**envelope, 'results': ReviewSerializer(rows, many=True, context={'fields': fields}).data}
+        if movie_title:
+            stats = getattr(movie, 'rating', None) if movie else None
+            data['movie_rating'] = MovieRatingSerializer(stats).data if stats else None
+        return data
+
+    async def build():
+        data = await cache.afetch(request.build_absolute_uri(), depends_on, compute)
+        if writebehind.enabled():
+            data = {**data, 'results': await sync_to_async(writebehind.overlay)(user, data['results'])}
+        return JsonResponse(data)
+
+    if writebehind.enabled():
+        return await build()
+    return await conditional.arespond(request, request.build_absolute_uri(), depends_on, build)
+
+
+# Async Comment List View
+@async_api_view(['GET'])
+async def comment_list(request, user, pk):
+    async def compute():
+        rows, envelope = await paginate(request, Comment.objects.filter(review_id=pk, is_hidden=False)
+                                        .values(*values_columns(CommentSerializer)), CommentPagination)
+        return {**envelope, 'results': CommentSerializer(rows, many=True).data}
+
+    return JsonResponse(await cache.afetch(request.build_absolute_uri(), [('comments', pk)], compute))
+
+
+# Async like and unlike
+# The write and its like_count update share one transaction, which Django only runs synchronously
+LIKE_UNAUTHENTICATED = ('Authentication required', status.HTTP_401_UNAUTHORIZED)
+
+
+@async_api_view(['POST'], unauthenticated=LIKE_UNAUTHENTICATED, throttle_scope='like')
+async def like_review(request, user, pk):
+    body, code = await sync_to_async(add_like)(user, pk)
+    return JsonResponse(body, status=code)
+
+
+@async_api_view(['POST'], unauthenticated=LIKE_UNAUTHENTICATED, throttle_scope='like')
+async def unlike_review(request, user, pk):
+    body, code = await sync_to_async(remove_like)(user, pk)
+    return JsonResponse(body, status=code)
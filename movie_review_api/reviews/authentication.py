@@ -0,0 +1,184 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# Token authentication with memoized token -> user resolution
+#
+# DRF's TokenAuthentication joins Token to User on every request. Here a resolved token (with its
+# user attached) is kept for TIMEOUT seconds, so warm requests authenticate without a query.
+# BACKEND decides where:
+#   'memory' - a bounded LRU per process (MAX_ENTRIES). Fastest, but another process only notices
+#              a revoked token or a deactivated user when its own entry expires.
+#   'cache'  - Django's cache (use Redis), shared by every process, so invalidation is immediate.
+# Entries are dropped when a token is deleted or rotated and whenever its user is saved (e.g.
+# deactivated). With EXPIRES_AFTER set, tokens older than that many seconds are rejected. A
+# TIMEOUT of 0 turns the cache off.
+
+DEFAULTS = {
+    'BACKEND': 'memory',
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 10000,
+    'EXPIRES_AFTER': None,
+}
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_TOKEN_AUTH', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires at, value)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > config('MAX_ENTRIES'):
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_memory = LRUCache()
+
+
+def _key(token_key):
+    # Cache keys never contain the credential itself
+    return 'reviews:auth:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+def expires_at(token):
+    lifetime = config('EXPIRES_AFTER')
+    return token.created + timedelta(seconds=lifetime) if lifetime else None
+
+
+def _entry_timeout(token):
+    expiry = expires_at(token)
+    if expiry is None:
+        return config('TIMEOUT')
+    return min(config('TIMEOUT'), (expiry - timezone.now()).total_seconds())
+
+
+def _check(token):
+    if not token.user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    expiry = expires_at(token)
+    if expiry is not None and expiry <= timezone.now():
+        raise AuthenticationFailed('Token has expired.')
+    return token.user, token
+
+
+def _remember(token):
+    timeout = _entry_timeout(token)
+    if timeout <= 0 or not token.user.is_active:
+        return
+    if config('BACKEND') == 'cache':
+        caches[config('CACHE_ALIAS')].set(_key(token.key), token, timeout=timeout)
+    else:
+        _memory.set(_key(token.key), token, timeout)
+
+
+def _recall(token_key):
+    if not config('TIMEOUT'):
+        return None
+    if config('BACKEND') == 'cache':
+        return caches[config('CACHE_ALIAS')].get(_key(token_key))
+    return _memory.get(_key(token_key))
+
+
+def resolve(token_key):
+    # (user, token) for a key, from the memo when warm; raises AuthenticationFailed
+    token = _recall(token_key)
+    if token is None:
+        try:
+            token = Token.objects.select_related('user').get(key=token_key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed('Invalid token.')
+        _remember(token)
+    return _check(token)
+
+
+async def aresolve(token_key):
+    if config('BACKEND') == 'cache' and config('TIMEOUT'):
+        token = await caches[config('CACHE_ALIAS')].aget(_key(token_key))
+    else:
+        token = _recall(token_key)
+    if token is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=token_key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed('Invalid token.')
+        if config('BACKEND') == 'cache':
+            timeout = _entry_timeout(token)
+            if timeout > 0 and token.user.is_active:
+                await caches[config('CACHE_ALIAS')].aset(_key(token.key), token, timeout=timeout)
+        else:
+            _remember(token)
+    return _check(token)
+
+
+def forget(*token_keys):
+    # Drops memoized tokens; runs after commit so a concurrent request cannot re-cache the old row
+    keys = [_key(token_key) for token_key in token_keys]
+
+    def drop():
+        if config('BACKEND') == 'cache':
+            caches[config('CACHE_ALIAS')].delete_many(keys)
+        else:
+            _memory.delete_many(keys)
+    transaction.on_commit(drop)
+
+
+# Issuing tokens
+
+def issue(user):
+    # The user's token, replacing it first if it has expired
+    token, created = Token.objects.get_or_create(user=user)
+    expiry = expires_at(token)
+    if not created and expiry is not None and expiry <= timezone.now():
+        return rotate(user)
+    return token
+
+
+def rotate(user):
+    # Replaces the user's token with a new key; the old key stops working immediately
+    with transaction.atomic():
+        Token.objects.filter(user=user).delete()
+        return Token.objects.create(user=user)
+
+
+# DRF authentication class: DEFAULT_AUTHENTICATION_CLASSES
+class CachingTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        return resolve(key)
@@ -0,0 +1,330 @@
+import asyncio
+import contextvars
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from . import cache, feeds, leaderboards, ratings, search, threads
+from .models import Comment, Like, Movie, Review
+
+# Benchmark harness
+#
+# seed() fills the (benchmark) database with a synthetic dataset using bulk inserts, and run()
+# drives every API route in-process through Django's WSGI or ASGI handler from several concurrent
+# clients, recording latency and the number of SQL queries each request issued.
+
+WORDS = ('great', 'boring', 'stunning', 'plot', 'acting', 'score', 'twist', 'ending', 'visuals',
+         'slow', 'funny', 'dark', 'classic', 'sequel', 'cast', 'script', 'shark', 'music')
+
+PASSWORD = 'benchmark-pass'
+
+
+@dataclass
+class Dataset:
+    user_ids: list
+    movie_ids: range
+    review_ids: range
+    comment_ids: range
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _id_range(model):
+    first = model.objects.order_by('pk').values_list('pk', flat=True).first()
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return range(first, last + 1) if first is not None else range(0)
+
+
+def load_dataset():
+    return Dataset(user_ids=list(User.objects.filter(username__startswith='bench').values_list('pk', flat=True)),
+                   movie_ids=_id_range(Movie), review_ids=_id_range(Review), comment_ids=_id_range(Comment))
+
+
+def seed(users=200, movies=1000, reviews=100000, likes=200000, comments=50000, batch_size=5000,
+         random_seed=1, log=print):
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+
+    User.objects.bulk_create([User(username=f'bench{i}', password=password) for i in range(users)],
+                             batch_size=batch_size)
+    user_ids = list(User.objects.filter(username__startswith='bench').values_list('pk', flat=True))
+    Movie.objects.bulk_create([Movie(title=f'Benchmark Movie {i}', normalized_title=f'benchmark movie {i}',
+                                     description=_text(rng, 12))
+                               for i in range(movies)], batch_size=batch_size)
+    cache.bump('titles', 'added')
+    movie_ids = list(Movie.objects.values_list('pk', flat=True))
+    log(f'Seeded {users} users and {movies} movies')
+
+    for start in range(0, reviews, batch_size):
+        Review.objects.bulk_create([
+            Review(movie_id=rng.choice(movie_ids), user_id=rng.choice(user_ids), rating=rng.randint(1, 5),
+                   review_content=_text(rng, 20))
+            for _ in range(min(batch_size, reviews - start))
+        ])
+    review_range = _id_range(Review)
+    log(f'Seeded {reviews} reviews')
+
+    seen = set()
+    for start in range(0, likes, batch_size):
+        batch = []
+        for _ in range(min(batch_size, likes - start)):
+            pair = (rng.choice(user_ids), rng.choice(review_range))
+            if pair not in seen:
+                seen.add(pair)
+                batch.append(Like(user_id=pair[0], review_id=pair[1]))
+        Like.objects.bulk_create(batch, ignore_conflicts=True)
+    like_counts = (Like.objects.filter(review=OuterRef('pk')).order_by().values('review')
+                   .annotate(total=Count('pk')).values('total'))
+    Review.objects.update(like_count=Coalesce(Subquery(like_counts), 0))
+    log(f'Seeded {len(seen)} likes')
+
+    for start in range(0, comments, batch_size):
+        Comment.objects.bulk_create([
+            Comment(review_id=rng.choice(review_range), user_id=rng.choice(user_ids), content=_text(rng, 8))
+            for _ in range(min(batch_size, comments - start))
+        ])
+    threads.set_root_paths(chunk_size=batch_size)
+    log(f'Seeded {comments} comments')
+
+    # Derived tables are built the way production rebuilds them
+    ratings.rebuild(batch_size=batch_size)
+    leaderboards.rebuild(from_history=True, chunk_size=batch_size)
+    if search.backend() == 'index':
+        search.rebuild(chunk_size=batch_size)
+    feeds.rebuild(chunk_size=batch_size)
+    log('Rebuilt rating aggregates, leaderboards, search index and feeds')
+
+
+# Scenarios: name -> (method, path builder, body builder)
+
+def _review(rng, data):
+    return rng.choice(data.review_ids)
+
+
+SCENARIOS = {
+    'review_list': ('get', lambda rng, data: '/api/reviews/', None),
+    'review_list_deep_page': ('get', lambda rng, data: '/api/reviews/?page=50', None),
+    'review_list_keyset': ('get', lambda rng, data: '/api/reviews/?pagination=keyset', None),
+    'review_filter': ('get', lambda rng, data: f'/api/reviews/?movie_title=Benchmark+Movie+'
+                                               f'{rng.randrange(len(data.movie_ids))}&rating={rng.randint(1, 5)}', None),
+    'review_detail': ('get', lambda rng, data: f'/api/reviews/{_review(rng, data)}/', None),
+    'my_reviews': ('get', lambda rng, data: '/api/my-reviews/', None),
+    'feed': ('get', lambda rng, data: '/api/feed/', None),
+    'movie_detail': ('get', lambda rng, data: f'/api/movies/{rng.choice(data.movie_ids)}/', None),
+    'comment_list': ('get', lambda rng, data: f'/api/reviews/{_review(rng, data)}/comments/', None),
+    'comment_tree': ('get', lambda rng, data: f'/api/reviews/{_review(rng, data)}/comments/tree/', None),
+    'comment_detail': ('get', lambda rng, data: f'/api/comments/{rng.choice(data.comment_ids)}/', None),
+    'search': ('get', lambda rng, data: f'/api/search/?q={rng.choice(WORDS)}', None),
+    'leaderboard': ('get', lambda rng, data: '/api/leaderboards/top-rated/', None),
+    'like': ('post', lambda rng, data: f'/api/reviews/{_review(rng, data)}/like/', None),
+    'unlike': ('post', lambda rng, data: f'/api/reviews/{_review(rng, data)}/unlike/', None),
+    'review_create': ('post', lambda rng, data: '/api/reviews/',
+                      lambda rng, data: {'movie_title': f'Benchmark Movie {rng.randrange(len(data.movie_ids))}',
+                                         'rating': rng.randint(1, 5), 'review_content': _text(rng, 20)}),
+    'comment_create': ('post', lambda rng, data: f'/api/reviews/{_review(rng, data)}/comments/',
+                       lambda rng, data: {'content': _text(rng, 8)}),
+    # ASGI-native variants (reviews/async_views.py)
+    'async_review_list': ('get', lambda rng, data: '/api/async/reviews/', None),
+    'async_review_filter': ('get', lambda rng, data: f'/api/async/reviews/?movie_title=Benchmark+Movie+'
+                                                     f'{rng.randrange(len(data.movie_ids))}&rating={rng.randint(1, 5)}',
+                            None),
+    'async_movie_detail': ('get', lambda rng, data: f'/api/async/movies/{rng.choice(data.movie_ids)}/', None),
+    'async_comment_list': ('get', lambda rng, data: f'/api/async/reviews/{_review(rng, data)}/comments/', None),
+    'async_like': ('post', lambda rng, data: f'/api/async/reviews/{_review(rng, data)}/like/', None),
+    'async_unlike': ('post', lambda rng, data: f'/api/async/reviews/{_review(rng, data)}/unlike/', None),
+}
+
+# Sync scenario -> its async variant, for --sync-vs-async
+ASYNC_PAIRS = {name: f'async_{name}' for name in ('review_list', 'review_filter', 'movie_detail', 'comment_list',
+                                                    'like', 'unlike')}
+
+
+# Query counting: a wrapper on every connection adds to whichever counter the current
+# request's context holds, which also follows ASGI requests into sync_to_async threads.
+
+_query_counter = contextvars.ContextVar('benchmark_query_counter', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_counter(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@dataclass
+class Sample:
+    latency: float
+    queries: int
+    status: int
+    size: int = 0  # Body bytes as sent (streaming responses count 0)
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    samples: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def summary(self):
+        latencies = sorted(sample.latency for sample in self.samples)
+        statuses = Counter(str(sample.status) for sample in self.samples)
+        return {
+            'requests': len(self.samples),
+            'errors': sum(count for status, count in statuses.items() if status >= '500'),
+            'statuses': dict(sorted(statuses.items())),
+            'throughput': round(len(self.samples) / self.elapsed, 2) if self.elapsed else 0.0,
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+            'queries_per_request': round(statistics.fmean(s.queries for s in self.samples), 2) if self.samples else 0,
+            'bytes_per_request': round(statistics.fmean(s.size for s in self.samples)) if self.samples else 0,
+        }
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def run(scenarios=None, requests=200, concurrency=8, interface='wsgi', random_seed=1, auth='session', headers=None):
+    # Returns {scenario name: summary dict}. With auth='token' the clients send an API token header;
+    # the plain Django like/unlike views still read their session. `headers` are sent with every
+    # request, e.g. {'Accept-Encoding': 'gzip'}.
+    data = load_dataset()
+    connection_created.connect(_install_counter)
+    for alias in connections:
+        _install_counter(connection=connections[alias])
+    try:
+        results = {}
+        for name in scenarios or SCENARIOS:
+            runner = _run_asgi if interface == 'asgi' else _run_wsgi
+            result = runner(name, data, requests, concurrency, random_seed, auth, headers or {})
+            results[name] = result.summary()
+        return results
+    finally:
+        connection_created.disconnect(_install_counter)
+
+
+def _timed(counter, started):
+    return time.perf_counter() - started, counter[0]
+
+
+def _size(response):
+    return 0 if response.streaming else len(response.content)
+
+
+def _run_wsgi(name, data, requests, concurrency, random_seed, auth, extra_headers):
+    method, path, body = SCENARIOS[name]
+    result = ScenarioResult(name)
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(f'{random_seed}:{name}:{index}')
+        user = User.objects.get(pk=data.user_ids[index % len(data.user_ids)])
+        headers = dict(extra_headers)
+        if auth == 'token':
+            headers['Authorization'] = 'Token ' + Token.objects.get_or_create(user=user)[0].key
+        client = Client(raise_request_exception=False, headers=headers)
+        client.force_login(user)
+        samples = []
+        for _ in range(requests // concurrency + (index < requests % concurrency)):
+            counter = [0]
+            token = _query_counter.set(counter)
+            started = time.perf_counter()
+            response = getattr(client, method)(path(rng, data), body(rng, data) if body else None)
+            latency, queries = _timed(counter, started)
+            _query_counter.reset(token)
+            samples.append(Sample(latency, queries, response.status_code, _size(response)))
+        with lock:
+            result.samples.extend(samples)
+        connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _run_asgi(name, data, requests, concurrency, random_seed, auth, extra_headers):
+    method, path, body = SCENARIOS[name]
+    result = ScenarioResult(name)
+
+    async def worker(index):
+        rng = random.Random(f'{random_seed}:{name}:{index}')
+        user = await User.objects.aget(pk=data.user_ids[index % len(data.user_ids)])
+        headers = dict(extra_headers)
+        if auth == 'token':
+            headers['Authorization'] = 'Token ' + (await Token.objects.aget_or_create(user=user))[0].key
+        client = AsyncClient(raise_request_exception=False, headers=headers)
+        await client.aforce_login(user)
+        for _ in range(requests // concurrency + (index < requests % concurrency)):
+            counter = [0]
+            _query_counter.set(counter)
+            started = time.perf_counter()
+            response = await getattr(client, method)(path(rng, data), body(rng, data) if body else None)
+            latency, queries = _timed(counter, started)
+            result.samples.append(Sample(latency, queries, response.status_code, _size(response)))
+
+    async def main():
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+# Baselines
+
+def compare(current, baseline, tolerance=0.2):
+    # Returns a list of human-readable regressions: latency or throughput worse than the baseline
+    # by more than `tolerance`, or any increase in queries per request
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get('results', baseline).get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if before[metric] and now[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {before[metric]} -> {now[metric]}')
+        if before['throughput'] and now['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']} -> {now['throughput']}")
+        if now['queries_per_request'] > before['queries_per_request']:
+            regressions.append(
+                f"{name}: queries/request {before['queries_per_request']} -> {now['queries_per_request']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_baseline(path, results, metadata):
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump({'metadata': metadata, 'results': results}, handle, indent=2, sort_keys=True)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Response cache for read-heavy endpoints
+#
+# Entries are keyed by the request plus the current version of every namespace the response
+# depends on (e.g. ('movie', 7) or ('reviews',)). Writes never delete entries; they bump the
+# version, so the next read builds a new key and the old entry ages out on its own.
+#
+# Each entry is fresh for TIMEOUT seconds and may then be served stale for STALE_TIMEOUT more
+# while a single request, holding a short lock, recomputes it. On a cold miss the lock also
+# keeps concurrent requests from all recomputing the same response.
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'STALE_TIMEOUT': 300,
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 0.5,
+    'KEY_PREFIX': 'reviews',
+    'CONDITIONAL': None,  # Conditional GET (see conditional.py); None: only when the cache is shared()
+}
+
+STATS = ('hit', 'stale', 'miss')
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def _cache():
+    return caches[config('ALIAS')]
+
+
+def shared():
+    # Whether every worker process sees the same versions; a local-memory cache is per process
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _key(*parts):
+    return ':'.join([config('KEY_PREFIX'), *map(str, parts)])
+
+
+def _count(stat):
+    key = _key('stats', stat)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        if not _cache().add(key, 1, timeout=None):
+            _cache().incr(key)
+
+
+def stats():
+    values = _cache().get_many([_key('stats', stat) for stat in STATS])
+    return {stat: values.get(_key('stats', stat), 0) for stat in STATS}
+
+
+def get_version(*namespace):
+    key = _key('version', *namespace)
+    version = _cache().get(key)
+    if version is None:
+        # Seeded from the clock so a version evicted from the cache is never reused
+        _cache().add(key, time.time_ns() // 1000, timeout=None)
+        version = _cache().get(key)
+    return version
+
+
+def bump(*namespace):
+    key = _key('version', *namespace)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        _cache().add(key, time.time_ns() // 1000, timeout=None)
+    # When the namespace last changed, for Last-Modified; last writer wins, which is all it needs
+    _cache().set(_key('modified', *namespace), time.time(), timeout=None)
+
+
+def stamp(*namespaces):
+    # (versions, last modified epoch seconds or None) of the namespaces: a validator for conditional
+    # GETs that costs one cache round trip and no database or serializer work
+    keys = [(_key('version', *namespace), _key('modified', *namespace)) for namespace in namespaces]
+    values = _cache().get_many([key for pair in keys for key in pair])
+    versions = [values.get(version_key) for version_key, _ in keys]
+    if None in versions:
+        versions = [get_version(*namespace) for namespace in namespaces]
+    modified = [values[modified_key] for _, modified_key in keys if modified_key in values]
+    return versions, max(modified) if len(modified) == len(keys) else None
+
+
+def bump_on_commit(*namespaces):
+    # Bumping after commit stops a concurrent read from caching the pre-write rows under the new version
+    def bump_all():
+        for namespace in namespaces:
+            bump(*namespace)
+    transaction.on_commit(bump_all)
+
+
+def _entry_keys(name, versions):
+    digest = hashlib.sha1(f"{name}|{'.'.join(map(str, versions))}".encode()).hexdigest()
+    return _key('response', digest), _key('lock', digest)
+
+
+def fetch(name, depends_on, compute):
+    # Returns compute()'s result for `name`, a string identifying the response, cached under
+    # the versions of the `depends_on` namespaces. Exceptions from compute() are not cached.
+    if not config('ENABLED'):
+        return compute()
+
+    key, lock_key = _entry_keys(name, [get_version(*namespace) for namespace in depends_on])
+    cache = _cache()
+
+    entry = cache.get(key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        _count('hit')
+        return entry['data']
+
+    if entry is not None:
+        # Stale: whoever takes the lock refreshes it, everyone else keeps serving the old copy
+        _count('stale')
+        if not cache.add(lock_key, 1, timeout=config('LOCK_TIMEOUT')):
+            return entry['data']
+    else:
+        _count('miss')
+        if not cache.add(lock_key, 1, timeout=config('LOCK_TIMEOUT')):
+            entry = _wait_for(key)
+            if entry is not None:
+                return entry['data']
+
+    try:
+        data = compute()
+        cache.set(key, {'data': data, 'fresh_until': time.time() + config('TIMEOUT')},
+                  timeout=config('TIMEOUT') + config('STALE_TIMEOUT'))
+    finally:
+        cache.delete(lock_key)
+    return data
+
+
+def _wait_for(key):
+    # Polls briefly for the lock holder's result before giving up and computing it too
+    deadline = time.monotonic() + config('LOCK_WAIT')
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        entry = _cache().get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+# Async counterparts for ASGI-native views; same keys and entries, so sync and async views share them
+
+async def _acount(stat):
+    key = _key('stats', stat)
+    try:
+        await _cache().aincr(key)
+    except ValueError:
+        if not await _cache().aadd(key, 1, timeout=None):
+            await _cache().aincr(key)
+
+
+async def aget_version(*namespace):
+    key = _key('version', *namespace)
+    version = await _cache().aget(key)
+    if version is None:
+        await _cache().aadd(key, time.time_ns() // 1000, timeout=None)
+        version = await _cache().aget(key)
+    return version
+
+
+async def astamp(*namespaces):
+    keys = [(_key('version', *namespace), _key('modified', *namespace)) for namespace in namespaces]
+    values = await _cache().aget_many([key for pair in keys for key in pair])
+    versions = [values.get(version_key) for version_key, _ in keys]
+    if None in versions:
+        versions = [await aget_version(*namespace) for namespace in namespaces]
+    modified = [values[modified_key] for _, modified_key in keys if modified_key in values]
+    return versions, max(modified) if len(modified) == len(keys) else None
+
+
+async def afetch(name, depends_on, compute):
+    # fetch() for a coroutine function `compute`
+    if not config('ENABLED'):
+        return await compute()
+
+    key, lock_key = _entry_keys(name, [await aget_version(*namespace) for namespace in depends_on])
+    cache = _cache()
+
+    entry = await cache.aget(key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        await _acount('hit')
+        return entry['data']
+
+    if entry is not None:
+        await _acount('stale')
+        if not await cache.aadd(lock_key, 1, timeout=config('LOCK_TIMEOUT')):
+            return entry['data']
+    else:
+        await _acount('miss')
+        if not await cache.aadd(lock_key, 1, timeout=config('LOCK_TIMEOUT')):
+            entry = await _await_for(key)
+            if entry is not None:
+                return entry['data']
+
+    try:
+        data = await compute()
+        await cache.aset(key, {'data': data, 'fresh_until': time.time() + config('TIMEOUT')},
+                         timeout=config('TIMEOUT') + config('STALE_TIMEOUT'))
+    finally:
+        await cache.adelete(lock_key)
+    return data
+
+
+async def _await_for(key):
+    deadline = time.monotonic() + config('LOCK_WAIT')
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+        entry = await _cache().aget(key)
+        if entry is not None:
+            return entry
+    return None
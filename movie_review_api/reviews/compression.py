@@ -0,0 +1,71 @@
+import gzip
+
+from django.conf import settings
+
+try:  # Optional: Brotli, preferred over gzip when the client accepts it
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression (see CompressionMiddleware)
+#
+# Bodies of at least MIN_SIZE bytes are compressed with the best encoding the client accepts: 'br'
+# when the brotli package is installed, otherwise 'gzip'. Smaller bodies go out as they are, since
+# the framing and CPU would cost more than the bytes saved. The levels favour speed, as every body
+# is compressed afresh.
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,  # Bytes
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    # Content types worth compressing (prefixes); images and archives already are
+    'CONTENT_TYPES': ('application/json', 'application/msgpack', 'application/javascript', 'application/xml',
+                      'text/'),
+}
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_COMPRESSION', {}).get(name, DEFAULTS[name])
+
+
+def encodings():
+    # Supported encodings, best first
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted(accept_encoding):
+    # {coding: q} from an Accept-Encoding header such as 'gzip;q=0.5, br'
+    codings = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            codings[coding.strip().lower()] = quality
+    return codings
+
+
+def negotiate(accept_encoding):
+    # The encoding to use for a client sending this Accept-Encoding, or None for identity
+    codings = accepted(accept_encoding)
+    for coding in encodings():
+        if codings.get(coding, codings.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compressible(content_type):
+    return content_type.split(';')[0].strip().lower().startswith(config('CONTENT_TYPES'))
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, quality=config('BROTLI_QUALITY'))
+    return gzip.compress(content, compresslevel=config('GZIP_LEVEL'), mtime=0)
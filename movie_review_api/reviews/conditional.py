@@ -0,0 +1,54 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import cache
+
+# Conditional GET (ETag / Last-Modified)
+#
+# A response's validators come from the response-cache versions of the namespaces it depends on
+# (see cache.py), combined with a name covering everything else that shapes the body, such as its
+# query parameters. Checking them costs one cache round trip, so a client polling an unchanged
+# resource gets a 304 before any query or serializer runs.
+#
+# The versions must be the ones every worker bumps. With a per-process cache (LocMemCache) a worker
+# that never saw a write would keep answering 304 for as long as it runs, where a cached response
+# at least expires, so by default validators are only sent when the cache is shared (Redis).
+
+
+def enabled():
+    setting = cache.config('CONDITIONAL')
+    return cache.shared() if setting is None else setting
+
+
+def _validators(name, versions, modified):
+    etag = '"%s"' % hashlib.sha1(f"{name}|{'.'.join(map(str, versions))}".encode()).hexdigest()[:24]
+    return etag, int(modified) if modified else None
+
+
+def _finish(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # Clients may keep the body but must revalidate before reusing it
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def respond(request, name, namespaces, build):
+    # build() produces the full response; it is skipped when the client's copy is current
+    if not enabled():
+        return build()
+    etag, last_modified = _validators(name, *cache.stamp(*namespaces))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return _finish(response if response is not None else build(), etag, last_modified)
+
+
+async def arespond(request, name, namespaces, build):
+    if not enabled():
+        return await build()
+    etag, last_modified = _validators(name, *await cache.astamp(*namespaces))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return _finish(response if response is not None else await build(), etag, last_modified)
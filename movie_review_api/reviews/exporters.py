@@ -0,0 +1,107 @@
+import csv
+import datetime
+import json
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Comment, Review
+
+FORMATS = ('ndjson', 'csv')
+
+# Exported columns per kind: (output name, ORM lookup)
+COLUMNS = {
+    'reviews': (
+        ('id', 'id'),
+        ('movie_id', 'movie_id'),
+        ('movie_title', 'movie__title'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('rating', 'rating'),
+        ('review_content', 'review_content'),
+        ('like_count', 'like_count'),
+        ('created_date', 'created_date'),
+    ),
+    'comments': (
+        ('id', 'id'),
+        ('review_id', 'review_id'),
+        ('movie_id', 'review__movie_id'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('content', 'content'),
+        ('created_at', 'created_at'),
+    ),
+}
+KINDS = tuple(COLUMNS)
+
+
+# Streaming export of reviews and comments
+# Rows are read as plain tuples in primary-key chunks (keyset, so each chunk is an index range
+# and MySQL never buffers the whole result client-side) and encoded one line at a time, so
+# memory use does not depend on how many rows are exported.
+
+def parse_bound(value):
+    # Accepts an ISO date or datetime for the created-date range filters
+    if not value:
+        return None
+    bound = parse_datetime(value)
+    if bound is None:
+        day = parse_date(value)
+        bound = datetime.datetime.combine(day, datetime.time.min, datetime.timezone.utc) if day else None
+    if bound is None:
+        raise ValueError(f'Invalid date: {value}')
+    return bound
+
+
+def export_queryset(kind, movie=None, user=None, since=None, until=None):
+    if kind == 'reviews':
+        queryset, created, movie_lookup = Review.objects.all(), 'created_date', 'movie_id'
+    else:
+        queryset, created, movie_lookup = Comment.objects.all(), 'created_at', 'review__movie_id'
+    if movie:
+        queryset = queryset.filter(**{movie_lookup: movie})
+    if user:
+        queryset = queryset.filter(user_id=user)
+    if since:
+        queryset = queryset.filter(**{f'{created}__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{created}__lt': until})
+    return queryset
+
+
+def iter_rows(queryset, kind, chunk_size=2000):
+    lookups = [lookup for _, lookup in COLUMNS[kind]]
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(*lookups)[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1][0]
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+
+
+def ndjson_lines(kind, rows):
+    names = [name for name, _ in COLUMNS[kind]]
+    for row in rows:
+        yield json.dumps(dict(zip(names, map(_plain, row))), ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def csv_lines(kind, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in COLUMNS[kind]])
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def export_lines(kind, fmt, chunk_size=2000, **filters):
+    rows = iter_rows(export_queryset(kind, **filters), kind, chunk_size)
+    return csv_lines(kind, rows) if fmt == 'csv' else ndjson_lines(kind, rows)
@@ -0,0 +1,203 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import FeedEntry, Like, Movie, MovieFollow, Review
+
+# Per-user review feeds
+#
+# A user follows every movie they have reviewed or liked a review of. When a review is written,
+# it is fanned out on write: one FeedEntry row per follower of its movie, so reading a feed is a
+# single index range scan on (user, created_date, review) instead of joins across reviews and likes.
+# Each feed holds roughly the newest FEED_LENGTH entries; a sample of the followers is trimmed on
+# every fan-out, so a write never trims them all.
+#
+# Movies with more than FANOUT_LIMIT followers are not fanned out; their reviews are merged into
+# the feed on read from the (movie, created_date, id) review index. A page therefore always costs
+# three queries: the user's popular follows, their feed entries and those movies' reviews.
+
+DEFAULTS = {
+    'FEED_LENGTH': 200,  # Entries kept per user
+    'FANOUT_LIMIT': 1000,  # Followers above which a movie is read on demand instead
+    'BACKFILL': 20,  # Recent reviews copied into a feed when it starts following a movie
+    'TRIM_EVERY': 20,  # A follower's feed is trimmed on about one in this many fan-outs
+}
+
+LOOKUP_CHUNK_SIZE = 500  # Movies per query when reading which pairs are already follows
+
+# Columns ReviewSerializer reads, loaded with the author and movie in the same query
+REVIEW_FIELDS = ('id', 'rating', 'review_content', 'created_date', 'like_count', 'user__username', 'movie__title',
+                 'movie_id')
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_FEEDS', {}).get(name, DEFAULTS[name])
+
+
+# Write side
+
+def follow(pairs):
+    # Makes each (user_id, movie_id) pair a follow; new follows get the movie's recent reviews
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    existing = _existing_follows(pairs)
+    created = []
+    for user_id, movie_id in pairs - existing:
+        # A concurrent follow of the same pair is settled by the unique constraint
+        _, new = MovieFollow.objects.get_or_create(user_id=user_id, movie_id=movie_id)
+        if new:
+            created.append((user_id, movie_id))
+
+    per_movie = defaultdict(list)
+    for user_id, movie_id in created:
+        per_movie[movie_id].append(user_id)
+    for movie_id, user_ids in per_movie.items():
+        Movie.objects.filter(pk=movie_id).update(follower_count=F('follower_count') + len(user_ids))
+    _backfill(per_movie)
+    return len(created)
+
+
+def _existing_follows(pairs):
+    # The pairs already followed. Read a chunk of movies at a time with plain IN lists; the rows for
+    # other pairs of the same users and movies are dropped here.
+    existing = set()
+    movie_ids = sorted({movie_id for _, movie_id in pairs})
+    for start in range(0, len(movie_ids), LOOKUP_CHUNK_SIZE):
+        chunk = set(movie_ids[start:start + LOOKUP_CHUNK_SIZE])
+        users = {user_id for user_id, movie_id in pairs if movie_id in chunk}
+        existing.update(pair for pair in MovieFollow.objects.filter(movie_id__in=chunk, user_id__in=users)
+                        .values_list('user_id', 'movie_id') if pair in pairs)
+    return existing
+
+
+def _backfill(per_movie):
+    limit = config('BACKFILL')
+    popular = set(Movie.objects.filter(pk__in=per_movie, follower_count__gt=config('FANOUT_LIMIT'))
+                  .values_list('pk', flat=True))
+    entries = []
+    for movie_id, user_ids in per_movie.items():
+        if movie_id in popular or not limit:
+            continue
+        recent = list(Review.objects.filter(movie_id=movie_id, is_hidden=False)
+                      .order_by('-created_date', '-id').values_list('pk', 'user_id', 'created_date')[:limit])
+        entries.extend(FeedEntry(user_id=user_id, review_id=pk, created_date=created_date)
+                       for pk, author_id, created_date in recent for user_id in user_ids if user_id != author_id)
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def review_added(review):
+    reviews_added([review])
+
+
+def reviews_added(reviews):
+    # Authors follow the movie, then each review is pushed to its movie's other followers
+    reviews = [review for review in reviews if not review.is_hidden]
+    follow((review.user_id, review.movie_id) for review in reviews)
+    per_movie = defaultdict(list)
+    for review in reviews:
+        per_movie[review.movie_id].append(review)
+
+    limit = config('FANOUT_LIMIT')
+    trim_every = config('TRIM_EVERY')
+    entries, trimmed = [], set()
+    for movie_id, movie_reviews in per_movie.items():
+        followers = list(MovieFollow.objects.filter(movie_id=movie_id).values_list('user_id', flat=True)[:limit + 1])
+        if len(followers) > limit:
+            continue  # Popular: merged in on read
+        for review in movie_reviews:
+            for user_id in followers:
+                if user_id == review.user_id:
+                    continue
+                entries.append(FeedEntry(user_id=user_id, review_id=review.pk, created_date=review.created_date))
+                if (user_id + review.pk) % trim_every == 0:
+                    trimmed.add(user_id)
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    trim(trimmed)
+    return len(entries)
+
+
+def trim(user_ids):
+    # Drops everything past the newest FEED_LENGTH entries of each feed: one ranking query and one
+    # delete for the whole set of users
+    if not user_ids:
+        return 0
+    ranked = FeedEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(RowNumber(), partition_by=[F('user_id')], order_by=[F('created_date').desc(),
+                                                                            F('review_id').desc()]))
+    stale = list(ranked.filter(position__gt=config('FEED_LENGTH')).values_list('pk', flat=True))
+    if stale:
+        FeedEntry.objects.filter(pk__in=stale).delete()
+    return len(stale)
+
+
+# Read side
+
+def page(user, limit, after=None):
+    # Up to `limit` reviews older than the (created_date, review id) position `after`, newest
+    # first, plus whether more follow
+    popular = list(MovieFollow.objects.filter(user=user, movie__follower_count__gt=config('FANOUT_LIMIT'))
+                   .values_list('movie_id', flat=True))
+
+    entries = (FeedEntry.objects.filter(user=user, review__is_hidden=False)
+               .select_related('review__user', 'review__movie')
+               .only(*(f'review__{name}' for name in REVIEW_FIELDS), 'created_date')
+               .order_by('-created_date', '-review_id'))
+    if after is not None:
+        entries = entries.filter(_seek('created_date', 'review_id', *after))
+    reviews = [entry.review for entry in entries[:limit + 1]]
+
+    if popular:
+        merged = (Review.objects.filter(movie_id__in=popular, is_hidden=False).exclude(user=user)
+                  .select_related('user', 'movie').only(*REVIEW_FIELDS).order_by('-created_date', '-id'))
+        if after is not None:
+            merged = merged.filter(_seek('created_date', 'id', *after))
+        # A movie that became popular may still have older fanned-out entries for the same reviews
+        unique = {review.pk: review for review in [*reviews, *merged[:limit + 1]]}
+        reviews = sorted(unique.values(), key=lambda review: (review.created_date, review.pk), reverse=True)
+
+    return reviews[:limit], len(reviews) > limit
+
+
+def _seek(field, tie_breaker, value, pk):
+    return Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(**{f'{tie_breaker}__lt': pk}))
+
+
+# Rebuild
+
+def rebuild(chunk_size=1000):
+    # Recomputes follows from reviews and likes, then every feed from scratch; returns (follows, entries)
+    with transaction.atomic():
+        FeedEntry.objects.all().delete()
+        MovieFollow.objects.all().delete()
+        Movie.objects.update(follower_count=0)
+        pairs = set(Review.objects.values_list('user_id', 'movie_id').distinct())
+        pairs.update(Like.objects.values_list('user_id', 'review__movie_id').distinct())
+        MovieFollow.objects.bulk_create([MovieFollow(user_id=user_id, movie_id=movie_id) for user_id, movie_id in pairs],
+                                        batch_size=chunk_size)
+        counts = defaultdict(int)
+        for _, movie_id in pairs:
+            counts[movie_id] += 1
+        for movie_id, count in counts.items():
+            Movie.objects.filter(pk=movie_id).update(follower_count=count)
+
+    followed = defaultdict(set)
+    popular = {movie_id for movie_id, count in counts.items() if count > config('FANOUT_LIMIT')}
+    for user_id, movie_id in pairs:
+        if movie_id not in popular:
+            followed[user_id].add(movie_id)
+
+    # One query per user for the newest reviews across their followed movies, written in batches
+    entries, created = [], 0
+    for user_id, movie_ids in followed.items():
+        recent = (Review.objects.filter(movie_id__in=movie_ids, is_hidden=False).exclude(user_id=user_id)
+                  .order_by('-created_date', '-id').values_list('pk', 'created_date')[:config('FEED_LENGTH')])
+        entries.extend(FeedEntry(user_id=user_id, review_id=pk, created_date=created_date) for pk, created_date in recent)
+        if len(entries) >= chunk_size:
+            FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            created, entries = created + len(entries), []
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(pairs), created + len(entries)
@@ -0,0 +1,14 @@
+from django_filters import rest_framework as filters
+
+from .models import Review
+
+
+# Filters for the review listing
+# movie_title resolves through the movie join, so it hits Movie.title's unique index
+# and then the indexed Review.movie_id instead of scanning review rows.
+class ReviewFilter(filters.FilterSet):
+    movie_title = filters.CharFilter(field_name='movie__title')
+
+    class Meta:
+        model = Review
+        fields = ['movie', 'movie_title', 'rating']
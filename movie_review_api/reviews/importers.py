@@ -0,0 +1,157 @@
+import csv
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import cache, jobs, leaderboards, ratings, search, titles
+from .models import Review
+from .serializers import MovieUpsertSerializer, ReviewSerializer
+
+FORMATS = ('csv', 'jsonl')
+
+
+# Streaming bulk import of reviews
+# Rows are read one at a time from CSV or JSON Lines, validated with ReviewSerializer's rules and
+# written with bulk_create, one transaction per batch. Memory is bounded by the batch size.
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    rejected: int = 0
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, row dict); a row that cannot be parsed is yielded as None
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def format_for(filename, default='jsonl'):
+    # Infers the input format from a file name such as reviews.csv or reviews.jsonl
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return default
+
+
+class ReviewImporter:
+    # Each row needs movie_title, rating and review_content, plus the author's username
+    # unless default_user is given. on_error(line_number, errors, row) receives every rejected row.
+    def __init__(self, batch_size=1000, default_user=None, on_error=None):
+        self.batch_size = batch_size
+        self.default_user = default_user
+        self.on_error = on_error or (lambda line_number, errors, row: None)
+
+    def run(self, rows):
+        result = ImportResult()
+        batch = []
+        for line_number, row in rows:
+            if row is None:
+                self._reject(result, line_number, {'non_field_errors': ['Malformed row.']}, row)
+                continue
+            serializer = ReviewSerializer(data=row)
+            if not serializer.is_valid():
+                self._reject(result, line_number, serializer.errors, row)
+                continue
+            batch.append((line_number, row, serializer.validated_data))
+            if len(batch) >= self.batch_size:
+                self._write(batch, result)
+                batch = []
+        if batch:
+            self._write(batch, result)
+        return result
+
+    def _reject(self, result, line_number, errors, row):
+        result.rejected += 1
+        self.on_error(line_number, errors, row)
+
+    def _write(self, batch, result):
+        usernames = {row.get('username') for _, row, _ in batch if row.get('username')}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+        pending = []
+        for line_number, row, data in batch:
+            username = row.get('username')
+            user_id = users.get(username) if username else getattr(self.default_user, 'pk', None)
+            if user_id is None:
+                self._reject(result, line_number, {'username': ['Unknown user.']}, row)
+                continue
+            pending.append((user_id, data))
+
+        # Resolved before the batch's transaction so the titles index can load (see titles.py)
+        movies = titles.resolve_many({data['movie']['title'] for _, data in pending})
+        with transaction.atomic():
+            reviews = [
+                Review(user_id=user_id, movie_id=movies[data['movie']['title']][0],
+                       rating=data['rating'], review_content=data['review_content'])
+                for user_id, data in pending
+            ]
+            Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+            self._read_back_pks(reviews)
+            ratings.reviews_added(reviews)
+            leaderboards.reviews_added(reviews)
+            jobs.enqueue_many('feeds.fanout', [{'review': review.pk} for review in reviews])
+            # bulk_create sends no signals, so the cached responses are invalidated here
+            cache.bump_on_commit(('reviews',), *{('movie', review.movie_id) for review in reviews})
+            if search.backend() == 'index':
+                search.index_objects('review', reviews)
+        result.created += len(reviews)
+
+    def _read_back_pks(self, reviews):
+        # Databases that cannot return ids from a bulk INSERT (MySQL) leave them unset; each review
+        # is found again by author, movie and the created_date auto_now_add gave it
+        if not reviews or reviews[0].pk is not None:
+            return
+        created = [review.created_date for review in reviews]
+        pks = defaultdict(list)
+        for pk, *key in (Review.objects.filter(user_id__in={review.user_id for review in reviews},
+                                               created_date__range=(min(created), max(created)))
+                         .order_by('pk').values_list('pk', 'user_id', 'movie_id', 'created_date')):
+            pks[tuple(key)].append(pk)
+        for review in reviews:
+            review.pk = pks[review.user_id, review.movie_id, review.created_date].pop(0)
+
+
+# Streaming catalog sync: movie rows ({'title'} plus optional description and release_date) are
+# validated, then created or updated by title in batches (see titles.upsert)
+class MovieImporter:
+    def __init__(self, batch_size=1000, on_error=None):
+        self.batch_size = batch_size
+        self.on_error = on_error or (lambda line_number, errors, row: None)
+
+    def run(self, rows):
+        result = titles.UpsertResult()
+        batch = []
+        for line_number, row in rows:
+            if row is None:
+                result.rejected += 1
+                self.on_error(line_number, {'non_field_errors': ['Malformed row.']}, row)
+                continue
+            serializer = MovieUpsertSerializer(data=row)
+            if not serializer.is_valid():
+                result.rejected += 1
+                self.on_error(line_number, serializer.errors, row)
+                continue
+            batch.append(serializer.validated_data)
+            if len(batch) >= self.batch_size:
+                titles.upsert(batch, result)
+                batch = []
+        if batch:
+            titles.upsert(batch, result)
+        return result
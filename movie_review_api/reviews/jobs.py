@@ -0,0 +1,174 @@
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Background jobs for post-write work
+#
+# Work that follows a review, like or comment write (feed fan-out, search indexing, trending
+# activity, notifications) is enqueued instead of run inside the request. enqueue() inserts a Job
+# row once the surrounding transaction commits, so a rolled-back write queues nothing and the
+# request never waits on the work itself. The run_jobs command runs workers that claim due jobs in
+# batches, hand all claimed jobs of one kind to their task in a single call, delete them on success
+# and retry them with exponential backoff on failure, up to MAX_ATTEMPTS.
+#
+# A task may give each payload a dedup key: while a job with that key is still pending, enqueuing
+# the same work again is a no-op (e.g. three quick edits of a review reindex it once).
+#
+# Claiming uses SELECT ... FOR UPDATE SKIP LOCKED where the database has it, so concurrent workers
+# never wait on each other, and a conditional UPDATE that only takes still-due rows everywhere.
+# A claimed job is leased for LEASE seconds; if its worker dies it becomes due again.
+#
+# With EAGER (the test settings), enqueue() runs the task at once, in-process.
+
+DEFAULTS = {
+    'EAGER': False,
+    'BATCH_SIZE': 100,  # Jobs claimed at a time, and the most one task call receives
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,  # Seconds before the first retry; doubles with every attempt
+    'LEASE': 300,  # Seconds a claimed job may run before another worker may take it over
+    'POLL_INTERVAL': 1.0,  # Seconds an idle worker sleeps between claims
+}
+
+TASKS = {}  # kind -> (function taking a list of payloads, dedup function or None)
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_JOBS', {}).get(name, DEFAULTS[name])
+
+
+def task(kind, dedup=None):
+    # Registers a function(payloads) as the task run for jobs of `kind`. dedup(payload), if given,
+    # returns the key that makes pending duplicates collapse.
+    def decorator(function):
+        TASKS[kind] = (function, dedup)
+        return function
+    return decorator
+
+
+# Producing
+
+def enqueue(kind, payload):
+    enqueue_many(kind, [payload])
+
+
+def enqueue_many(kind, payloads):
+    payloads = list(payloads)
+    if not payloads:
+        return
+    if kind not in TASKS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    if config('EAGER'):
+        TASKS[kind][0](payloads)
+        return
+    dedup = TASKS[kind][1]
+    jobs = [Job(kind=kind, payload=payload, dedup_key=f'{kind}:{dedup(payload)}' if dedup else None)
+            for payload in payloads]
+    # A pending duplicate's dedup key makes its insert a no-op
+    transaction.on_commit(lambda: Job.objects.bulk_create(jobs, ignore_conflicts=True))
+
+
+# Consuming
+
+def _due():
+    return Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING], run_after__lte=timezone.now())
+
+
+def claim(batch_size=None):
+    # Leases up to batch_size due jobs to this caller and returns them, oldest first
+    batch_size = batch_size or config('BATCH_SIZE')
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        due = _due().order_by('run_after', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        pks = list(due.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return []
+        # The due filter again: without row locks another worker may have taken some meanwhile
+        _due().filter(pk__in=pks).update(status=Job.RUNNING, claimed_by=token, dedup_key=None,
+                                         attempts=F('attempts') + 1,
+                                         run_after=now + timedelta(seconds=config('LEASE')))
+    return list(Job.objects.filter(claimed_by=token, status=Job.RUNNING).order_by('pk'))
+
+
+def run(jobs):
+    # Runs claimed jobs, one task call per kind; returns (succeeded, failed)
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+    succeeded = failed = 0
+    for kind, batch in by_kind.items():
+        if kind not in TASKS:
+            _failed(batch, f'Unknown job kind: {kind}', final=True)
+            failed += len(batch)
+            continue
+        try:
+            _call(kind, batch)
+        except Exception:
+            if len(batch) == 1:
+                _failed(batch, traceback.format_exc())
+                failed += 1
+                continue
+            # Rerun one at a time so a single bad payload does not fail its whole batch
+            logger.warning('Batch of %d %s jobs failed; retrying them one by one', len(batch), kind)
+            for job in batch:
+                try:
+                    _call(kind, [job])
+                except Exception:
+                    _failed([job], traceback.format_exc())
+                    failed += 1
+                else:
+                    succeeded += 1
+        else:
+            succeeded += len(batch)
+    return succeeded, failed
+
+
+def _call(kind, batch):
+    with transaction.atomic():
+        TASKS[kind][0]([job.payload for job in batch])
+        Job.objects.filter(pk__in=[job.pk for job in batch]).delete()
+
+
+def _failed(batch, error, final=False):
+    logger.error('Job %s failed: %s', ', '.join(str(job) for job in batch), error)
+    for job in batch:
+        if final or job.attempts >= config('MAX_ATTEMPTS'):
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error)
+        else:
+            delay = config('RETRY_DELAY') * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(status=Job.PENDING, last_error=error,
+                                                 run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def work(batch_size=None):
+    # Claims and runs one batch; returns (succeeded, failed), (0, 0) when nothing was due
+    jobs = claim(batch_size)
+    return run(jobs) if jobs else (0, 0)
+
+
+def drain(batch_size=None):
+    # Runs batches until nothing is due; returns the totals
+    succeeded = failed = 0
+    while True:
+        done, errors = work(batch_size)
+        if not done and not errors:
+            return succeeded, failed
+        succeeded, failed = succeeded + done, failed + errors
+
+
+def retry_failed(queryset):
+    # Puts failed jobs back in the queue with a fresh set of attempts
+    return queryset.filter(status=Job.FAILED).update(status=Job.PENDING, attempts=0, run_after=timezone.now(),
+                                                     claimed_by='')
@@ -0,0 +1,197 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Like, LeaderboardState, MovieRating, Review, TrendingBucket, TrendingScore
+
+# Precomputed "top rated" and "trending" leaderboards.
+#
+# Top rated orders MovieRating.bayesian_score, (C * m + rating_sum) / (C + review_count) with C the
+# prior weight and m the global mean rating, refreshed for a movie whenever its aggregate changes.
+#
+# Trending uses forward decay: an event of weight w in hour h adds w * 2 ** ((h - epoch) / half_life)
+# to the movie's score. Older events then count exponentially less than newer ones without any
+# score having to be rewritten as time passes, so ordering the stored scores is the ranking.
+# rebuild() re-anchors the epoch and drops activity older than the window.
+
+DEFAULTS = {
+    'PRIOR_WEIGHT': 10,
+    'DEFAULT_MEAN': 3.0,
+    'TRENDING_HALF_LIFE_HOURS': 24,
+    'TRENDING_WINDOW_DAYS': 7,
+    'REVIEW_WEIGHT': 3,
+    'LIKE_WEIGHT': 1,
+}
+
+GLOBAL_MEAN_KEY = 'reviews:leaderboards:global-mean'
+EPOCH_KEY = 'reviews:leaderboards:trending-epoch'
+STATE_NAME = 'default'
+EPOCH_CACHE_TIMEOUT = 60
+GLOBAL_MEAN_CACHE_TIMEOUT = 3600
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_LEADERBOARDS', {}).get(name, DEFAULTS[name])
+
+
+# Top rated
+
+def global_mean():
+    mean = cache.get(GLOBAL_MEAN_KEY)
+    if mean is None:
+        totals = MovieRating.objects.aggregate(reviews=Sum('review_count'), ratings=Sum('rating_sum'))
+        mean = totals['ratings'] / totals['reviews'] if totals['reviews'] else config('DEFAULT_MEAN')
+        cache.set(GLOBAL_MEAN_KEY, mean, timeout=GLOBAL_MEAN_CACHE_TIMEOUT)
+    return mean
+
+
+def _bayesian_expression(mean):
+    prior = config('PRIOR_WEIGHT')
+    return ((Value(prior * mean) + F('rating_sum')) /
+            (Value(float(prior)) + F('review_count')))
+
+
+def refresh_top_rated(movie_ids=None, recompute_mean=False):
+    # Rescores the given movies, or all of them. Runs as its own UPDATE after the counter update,
+    # because MySQL would otherwise read the already-updated counter columns.
+    if recompute_mean:
+        cache.delete(GLOBAL_MEAN_KEY)
+    ratings = MovieRating.objects.all()
+    if movie_ids is not None:
+        ratings = ratings.filter(movie_id__in=movie_ids)
+    ratings.update(bayesian_score=_bayesian_expression(global_mean()))
+
+
+# Trending
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _epoch():
+    # Cached briefly; a process that misses a re-anchoring scales events by at most a few percent
+    # for EPOCH_CACHE_TIMEOUT seconds
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None:
+        state, _ = LeaderboardState.objects.get_or_create(
+            name=STATE_NAME, defaults={'trending_epoch': _hour(timezone.now())})
+        epoch = state.trending_epoch
+        cache.set(EPOCH_KEY, epoch, timeout=EPOCH_CACHE_TIMEOUT)
+    return epoch
+
+
+def _decayed(weight, hour, epoch):
+    hours = (hour - epoch).total_seconds() / 3600
+    return weight * 2 ** (hours / config('TRENDING_HALF_LIFE_HOURS'))
+
+
+def record_activity(movie_id, weight, moment=None):
+    hour = _hour(moment or timezone.now())
+    boost = _decayed(weight, hour, _epoch())
+    # Upsert by update-then-create, as ratings.py does for MovieRating
+    with transaction.atomic():
+        if not TrendingBucket.objects.filter(movie_id=movie_id, hour=hour).update(weight=F('weight') + weight):
+            TrendingBucket.objects.get_or_create(movie_id=movie_id, hour=hour)
+            TrendingBucket.objects.filter(movie_id=movie_id, hour=hour).update(weight=F('weight') + weight)
+        if not TrendingScore.objects.filter(movie_id=movie_id).update(score=F('score') + boost):
+            TrendingScore.objects.get_or_create(movie_id=movie_id)
+            TrendingScore.objects.filter(movie_id=movie_id).update(score=F('score') + boost)
+
+
+def record_activities(events):
+    # (movie_id, weight, moment) events, e.g. from queued jobs: one update per (movie, hour)
+    weights = {}
+    for movie_id, weight, moment in events:
+        key = (movie_id, _hour(moment))
+        weights[key] = weights.get(key, 0) + weight
+    for (movie_id, hour), weight in weights.items():
+        record_activity(movie_id, weight, hour)
+
+
+def review_added(review):
+    record_activity(review.movie_id, config('REVIEW_WEIGHT'), review.created_date)
+
+
+def reviews_added(reviews):
+    # One bucket/score update per (movie, hour) for a bulk-created batch
+    weights = {}
+    for review in reviews:
+        key = (review.movie_id, _hour(review.created_date))
+        weights[key] = weights.get(key, 0) + config('REVIEW_WEIGHT')
+    for (movie_id, hour), weight in weights.items():
+        record_activity(movie_id, weight, hour)
+
+
+def like_added(movie_id):
+    record_activity(movie_id, config('LIKE_WEIGHT'))
+
+
+def likes_added(counts):
+    # {movie_id: new likes} from a batched write
+    for movie_id, count in counts.items():
+        record_activity(movie_id, config('LIKE_WEIGHT') * count)
+
+
+# Reads, O(limit)
+
+def top_rated(limit=10):
+    return (MovieRating.objects.filter(review_count__gt=0).select_related('movie')
+            .order_by('-bayesian_score', 'movie_id')[:limit])
+
+
+def trending(limit=10):
+    return (TrendingScore.objects.filter(score__gt=0).select_related('movie')
+            .order_by('-score', 'movie_id')[:limit])
+
+
+# Recompilation
+
+def rebuild(from_history=False, chunk_size=1000):
+    now = timezone.now()
+    window_start = _hour(now) - datetime.timedelta(days=config('TRENDING_WINDOW_DAYS'))
+
+    # Top rated: a fresh global mean, then every score in one statement
+    refresh_top_rated(recompute_mean=True)
+
+    with transaction.atomic():
+        if from_history:
+            TrendingBucket.objects.all().delete()
+            _replay_history(window_start, chunk_size)
+        else:
+            TrendingBucket.objects.filter(hour__lt=window_start).delete()
+
+        epoch = _hour(now)
+        scores = {}
+        for movie_id, hour, weight in TrendingBucket.objects.values_list('movie_id', 'hour', 'weight').iterator(
+                chunk_size=chunk_size):
+            scores[movie_id] = scores.get(movie_id, 0) + _decayed(weight, hour, epoch)
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(
+            [TrendingScore(movie_id=movie_id, score=score) for movie_id, score in scores.items()],
+            batch_size=chunk_size)
+        LeaderboardState.objects.update_or_create(name=STATE_NAME, defaults={'trending_epoch': epoch})
+    cache.set(EPOCH_KEY, epoch, timeout=EPOCH_CACHE_TIMEOUT)
+    return len(scores)
+
+
+def _replay_history(window_start, chunk_size):
+    weights = {}
+    sources = (
+        (Review.objects.filter(created_date__gte=window_start)
+         .annotate(hour=TruncHour('created_date')).values('movie_id', 'hour'), config('REVIEW_WEIGHT')),
+        (Like.objects.filter(created_date__gte=window_start)
+         .annotate(hour=TruncHour('created_date'), movie_id=F('review__movie_id')).values('movie_id', 'hour'),
+         config('LIKE_WEIGHT')),
+    )
+    for queryset, weight in sources:
+        for row in queryset.order_by().annotate(events=Count('pk')):
+            key = (row['movie_id'], row['hour'])
+            weights[key] = weights.get(key, 0) + weight * row['events']
+    TrendingBucket.objects.bulk_create(
+        [TrendingBucket(movie_id=movie_id, hour=hour, weight=weight) for (movie_id, hour), weight in weights.items()],
+        batch_size=chunk_size)
@@ -0,0 +1,148 @@
+import platform
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from reviews import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Seed a separate benchmark database and load-test every API route in-process, reporting '
+            'throughput, latency percentiles and queries per request. The configured database is '
+            'never touched: a test database is created next to it (SQLite: a local file).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=100000)
+        parser.add_argument('--likes', type=int, default=200000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--scenario', action='append', choices=sorted(benchmark.SCENARIOS),
+                            help='Run only this scenario (repeatable).')
+        parser.add_argument('--sync-vs-async', action='store_true',
+                            help='Run each sync route and its async variant under ASGI and compare them.')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the response cache.')
+        parser.add_argument('--eager-jobs', action='store_true',
+                            help='Run post-write jobs inside the requests instead of queueing them.')
+        parser.add_argument('--no-throttle', action='store_true', help='Disable request throttling.')
+        parser.add_argument('--throttle-overhead', action='store_true',
+                            help='Run each scenario without and with throttling and report the difference.')
+        parser.add_argument('--auth', choices=['session', 'token'], default='session',
+                            help='How the clients authenticate to the API.')
+        parser.add_argument('--token-cache-savings', action='store_true',
+                            help='Authenticate by token and rerun with the token cache off to report its savings.')
+        parser.add_argument('--accept', choices=['json', 'msgpack'], default='json',
+                            help='Response format the clients ask for (msgpack needs the msgpack package).')
+        parser.add_argument('--accept-encoding', default='',
+                            help='Accept-Encoding the clients send, e.g. "br, gzip"; none by default.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database (and its seeded data) for the next run.')
+        parser.add_argument('--sqlite-path', default='benchmark.sqlite3')
+        parser.add_argument('--save', metavar='PATH', help='Write the results to a JSON baseline.')
+        parser.add_argument('--compare', metavar='PATH', help='Fail when results regress against a baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = options['sqlite_path']
+            # Concurrent writers wait for the lock instead of failing on read-to-write upgrades
+            connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+            connection.settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['save']:
+            benchmark.save_baseline(options['save'], results, {
+                'created': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'interface': options['interface'],
+                'concurrency': options['concurrency'],
+                'python': platform.python_version(),
+            })
+            self.stdout.write(f"Saved baseline to {options['save']}")
+        if options['compare']:
+            regressions = benchmark.compare(results, benchmark.load_baseline(options['compare']),
+                                            options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def run_benchmark(self, options):
+        if not User.objects.filter(username__startswith='bench').exists():
+            benchmark.seed(users=options['users'], movies=options['movies'], reviews=options['reviews'],
+                           likes=options['likes'], comments=options['comments'],
+                           batch_size=options['batch_size'], log=self.stdout.write)
+
+        overrides = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver']}
+        if options['no_cache']:
+            overrides['REVIEWS_CACHE'] = {'ENABLED': False}
+        # Queued jobs are left in the table (nothing runs them), so writes are timed without their follow-up work
+        overrides['REVIEWS_JOBS'] = {**getattr(settings, 'REVIEWS_JOBS', {}), 'EAGER': options['eager_jobs']}
+        scenarios = options['scenario']
+        if options['sync_vs_async']:
+            options['interface'] = 'asgi'
+            pairs = {name: twin for name, twin in benchmark.ASYNC_PAIRS.items() if not scenarios or name in scenarios}
+            scenarios = [name for pair in pairs.items() for name in pair]
+        # Throttles run in full but with limits no benchmark client reaches, so nothing is rejected
+        configured = getattr(settings, 'REVIEWS_THROTTLE', {})
+        throttle = {**configured, 'ENABLED': not options['no_throttle'],
+                    'RATES': {scope: '1000000/s' for scope in configured.get('RATES', {})}}
+        if options['token_cache_savings']:
+            options['auth'] = 'token'
+        run = {'requests': options['requests'], 'concurrency': options['concurrency'],
+               'interface': options['interface'], 'auth': options['auth'],
+               'headers': {'Accept': 'application/msgpack' if options['accept'] == 'msgpack' else 'application/json'}}
+        if options['accept_encoding']:
+            run['headers']['Accept-Encoding'] = options['accept_encoding']
+        with override_settings(**overrides, REVIEWS_THROTTLE=throttle):
+            results = benchmark.run(scenarios, **run)
+        if options['throttle_overhead']:
+            with override_settings(**overrides, REVIEWS_THROTTLE={**throttle, 'ENABLED': False}):
+                baseline = benchmark.run(scenarios, **run)
+        if options['token_cache_savings']:
+            # A zero timeout keeps nothing, so every request resolves its token from the database
+            token_auth = {**getattr(settings, 'REVIEWS_TOKEN_AUTH', {}), 'TIMEOUT': 0}
+            with override_settings(**overrides, REVIEWS_THROTTLE=throttle, REVIEWS_TOKEN_AUTH=token_auth):
+                uncached = benchmark.run(scenarios, **run)
+
+        self.stdout.write(f"{'scenario':<24}{'req':>6}{'err':>5}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>7}"
+                          f"{'bytes':>9}  statuses")
+        for name, row in results.items():
+            self.stdout.write(f"{name:<24}{row['requests']:>6}{row['errors']:>5}{row['throughput']:>10}"
+                              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['queries_per_request']:>7}"
+                              f"{row['bytes_per_request']:>9}  "
+                              + ' '.join(f'{status}x{count}' for status, count in row['statuses'].items()))
+        if options['throttle_overhead']:
+            self.stdout.write('\nThrottling overhead (throttled vs. unthrottled)')
+            self.write_deltas(results, baseline)
+        if options['token_cache_savings']:
+            self.stdout.write('\nToken cache (cached vs. uncached token lookups)')
+            self.write_deltas(results, uncached)
+        if options['sync_vs_async']:
+            self.stdout.write(f"\n{'route':<24}{'async/sync req/s':>18}{'async/sync p95':>16}")
+            for name, twin in pairs.items():
+                sync, async_ = results[name], results[twin]
+                self.stdout.write(f"{name:<24}{async_['throughput'] / (sync['throughput'] or 1):>18.2f}"
+                                  f"{async_['p95_ms'] / (sync['p95_ms'] or 1):>16.2f}")
+        return results
+
+    def write_deltas(self, results, baseline):
+        self.stdout.write(f"{'scenario':<24}{'p50 +ms':>9}{'p95 +ms':>9}{'req/s ratio':>13}{'q/req +':>9}")
+        for name, row in results.items():
+            before = baseline[name]
+            self.stdout.write(f"{name:<24}{row['p50_ms'] - before['p50_ms']:>9.2f}"
+                              f"{row['p95_ms'] - before['p95_ms']:>9.2f}"
+                              f"{row['throughput'] / (before['throughput'] or 1):>13.2f}"
+                              f"{row['queries_per_request'] - before['queries_per_request']:>9.2f}")
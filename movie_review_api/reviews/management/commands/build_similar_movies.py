@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from reviews import similarity
+
+
+class Command(BaseCommand):
+    help = ('Compute each movie\'s most similar movies from co-ratings (REVIEWS_SIMILARITY). Run a full '
+            'build periodically (e.g. nightly) and --incremental in between.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only recompute movies reviewed since the last run.')
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            count = similarity.update()
+            self.stdout.write(self.style.SUCCESS(f'Updated {count} movies ({similarity.engine()} engine)'))
+        else:
+            count = similarity.build()
+            self.stdout.write(self.style.SUCCESS(f'Built similar movies for {count} movies '
+                                                 f'({similarity.engine()} engine)'))
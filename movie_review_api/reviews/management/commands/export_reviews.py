@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.exporters import FORMATS, KINDS, export_lines, parse_bound
+
+
+class Command(BaseCommand):
+    help = 'Stream reviews or comments to a file (or stdout) as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=KINDS, default='reviews')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', help='Output file. Defaults to stdout.')
+        parser.add_argument('--movie', type=int, help='Only rows for this movie id.')
+        parser.add_argument('--user', type=int, help='Only rows written by this user id.')
+        parser.add_argument('--since', help='Created on or after this ISO date/datetime.')
+        parser.add_argument('--until', help='Created before this ISO date/datetime.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query.')
+
+    def handle(self, *args, **options):
+        try:
+            since, until = parse_bound(options['since']), parse_bound(options['until'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        lines = export_lines(options['kind'], options['format'], chunk_size=options['chunk_size'],
+                             movie=options['movie'], user=options['user'], since=since, until=until)
+        newline = '' if options['format'] == 'csv' else None
+        output = open(options['output'], 'w', encoding='utf-8', newline=newline) if options['output'] else None
+        try:
+            for line in lines:
+                if output:
+                    output.write(line)
+                else:
+                    self.stdout.write(line, ending='')
+        finally:
+            if output:
+                output.close()
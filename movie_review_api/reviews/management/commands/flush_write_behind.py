@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import writebehind
+
+
+class Command(BaseCommand):
+    help = ('Apply buffered likes and movie views (REVIEWS_WRITE_BEHIND). With the cache backend this '
+            'can run as a dedicated flusher in place of the per-process flush threads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every FLUSH_INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            added, removed, views = writebehind.flush()
+            if added or removed or views or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Flushed {added} likes, {removed} unlikes and {views} views'))
+            if not options['loop']:
+                return
+            time.sleep(writebehind.config('FLUSH_INTERVAL'))
@@ -0,0 +1,48 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.importers import FORMATS, ReviewImporter, format_for, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import reviews from a CSV or JSON Lines file (use - for stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - to read from stdin.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format. Defaults to the file extension, then jsonl.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per bulk INSERT and transaction.')
+        parser.add_argument('--user', help='Username to attribute rows without a username column to.')
+        parser.add_argument('--errors', help='Write rejected rows to this JSON Lines file.')
+
+    def handle(self, *args, **options):
+        default_user = None
+        if options['user']:
+            try:
+                default_user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        fmt = options['format'] or format_for(options['path'])
+        error_file = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+
+        def report(line_number, errors, row):
+            if error_file:
+                error_file.write(json.dumps({'line': line_number, 'errors': errors, 'row': row}) + '\n')
+
+        importer = ReviewImporter(batch_size=options['batch_size'], default_user=default_user, on_error=report)
+        try:
+            if options['path'] == '-':
+                result = importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as stream:
+                    result = importer.run(read_rows(stream, fmt))
+        finally:
+            if error_file:
+                error_file.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {result.created} reviews, rejected {result.rejected}"))
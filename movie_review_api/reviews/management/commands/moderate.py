@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from reviews import moderation
+
+
+class Command(BaseCommand):
+    help = ('Delete, hide or unhide every review or comment matching the filters, in chunked '
+            'transactions. Deleting reviews also removes their likes and comments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(moderation.KINDS))
+        parser.add_argument('action', choices=moderation.ACTIONS)
+        parser.add_argument('--ids', type=int, nargs='+')
+        parser.add_argument('--movie', type=int)
+        parser.add_argument('--movie-title')
+        parser.add_argument('--username')
+        parser.add_argument('--review', type=int, help='Comments on this review (comments only).')
+        parser.add_argument('--rating', type=int, help='Reviews with this rating (reviews only).')
+        parser.add_argument('--created-after', type=parse_datetime)
+        parser.add_argument('--created-before', type=parse_datetime)
+        parser.add_argument('--contains')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('ids', 'movie', 'movie_title', 'username', 'review', 'rating',
+                                                    'created_after', 'created_before', 'contains')
+                   if options[name] is not None}
+        if not filters:
+            raise CommandError('Select rows with --ids or at least one filter.')
+        report = {'processed': 0, 'changed': 0, 'total': 0}
+        for report in moderation.run(options['kind'], options['action'],
+                                     moderation.matching(options['kind'], **filters), options['chunk_size']):
+            self.stdout.write(f'{report["processed"]}/{report["total"]}')
+        self.stdout.write(self.style.SUCCESS(f'{options["action"].capitalize()}: {report["changed"]} '
+                                             f'{options["kind"]}s'))
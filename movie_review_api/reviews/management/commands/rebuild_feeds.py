@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews import feeds
+
+
+class Command(BaseCommand):
+    help = ('Recompute movie follows from reviews and likes and rebuild every user\'s feed. Run after '
+            'bulk loads that bypass the fan-out, or after changing REVIEWS_FEEDS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        follows, entries = feeds.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {follows} follows and {entries} feed entries'))
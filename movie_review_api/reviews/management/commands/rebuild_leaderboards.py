@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from reviews import leaderboards
+
+
+class Command(BaseCommand):
+    help = ('Rescore the top-rated and trending leaderboards. Run periodically (e.g. hourly) to '
+            'expire activity older than the trending window.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-history', action='store_true',
+                            help='Recompile the hourly trending buckets from review and like rows.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        trending = leaderboards.rebuild(from_history=options['from_history'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rescored top rated movies and {trending} trending movies"))
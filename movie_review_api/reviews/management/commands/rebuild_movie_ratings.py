@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews import ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-movie rating aggregates from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of aggregate rows written per INSERT.')
+
+    def handle(self, *args, **options):
+        created = ratings.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {created} movies"))
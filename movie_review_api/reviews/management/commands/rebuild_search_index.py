@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from reviews import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the tokenized search index used when MySQL FULLTEXT is not available.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Documents indexed per query.')
+
+    def handle(self, *args, **options):
+        if search.backend() != 'index':
+            self.stdout.write('Search is served by MySQL FULLTEXT indexes; nothing to rebuild.')
+            return
+        counts = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {counts['review']} reviews and {counts['movie']} movies"))
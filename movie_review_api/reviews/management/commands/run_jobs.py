@@ -0,0 +1,63 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from reviews import jobs
+
+logger = logging.getLogger('reviews.jobs')
+
+
+def _worker(stop, batch_size):
+    # Child process: claim and run batches until told to stop, finishing the batch in hand
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent turns Ctrl-C and SIGTERM into `stop`
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    while not stop.is_set():
+        try:
+            succeeded, failed = jobs.work(batch_size)
+        except DatabaseError:
+            # Lost connection, lock timeout...: the claimed jobs' leases run out and they are retried
+            logger.exception('Claiming or finishing jobs failed')
+            connections.close_all()
+            succeeded = failed = 0
+        if not succeeded and not failed:
+            stop.wait(jobs.config('POLL_INTERVAL'))
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs (REVIEWS_JOBS): feed fan-out, search indexing, trending '
+            'activity and notifications. Failed jobs are retried with backoff.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes claiming jobs concurrently.')
+        parser.add_argument('--batch-size', type=int, help='Jobs claimed at a time (default BATCH_SIZE).')
+        parser.add_argument('--once', action='store_true', help='Run every due job in this process, then exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            succeeded, failed = jobs.drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} jobs, {failed} failed'))
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        workers = [context.Process(target=_worker, args=(stop, options['batch_size']), daemon=True)
+                   for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        signal.signal(signal.SIGTERM, signal.default_int_handler)  # Shut down like on Ctrl-C
+        self.stdout.write(self.style.SUCCESS(f'Started {len(workers)} job workers'))
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop.set()
+        for worker in workers:
+            worker.join()
+        self.stdout.write('Job workers stopped')
@@ -16,7 +16,7 @@ class Command(BaseCommand):
 
         # Creating a test review
         review, created = Review.objects.get_or_create(
-            movie_title=movie,
+            movie=movie,
             user=user,
             review_content="Awesome, very funny and emotional",
             rating=4,
@@ -28,6 +28,6 @@ class Command(BaseCommand):
             self.stdout.write(f"Review already exists for {movie.title} by {user.username}")
 
         # List all reviews
-        reviews = Review.objects.all()
+        reviews = Review.objects.select_related('movie', 'user')
         for review in reviews:
             self.stdout.write(str(review))
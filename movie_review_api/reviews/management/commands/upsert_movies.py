@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from reviews.importers import FORMATS, MovieImporter, format_for, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Create or update movies from a CSV or JSON Lines file (use - for stdin), matching '
+            'existing movies by title regardless of case and spacing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - to read from stdin.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format. Defaults to the file extension, then jsonl.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per bulk upsert and transaction.')
+        parser.add_argument('--errors', help='Write rejected rows to this JSON Lines file.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for(options['path'])
+        error_file = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+
+        def report(line_number, errors, row):
+            if error_file:
+                error_file.write(json.dumps({'line': line_number, 'errors': errors, 'row': row}) + '\n')
+
+        importer = MovieImporter(batch_size=options['batch_size'], on_error=report)
+        try:
+            if options['path'] == '-':
+                result = importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as stream:
+                    result = importer.run(read_rows(stream, fmt))
+        finally:
+            if error_file:
+                error_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created} movies, updated {result.updated}, {result.unchanged} unchanged, '
+            f'rejected {result.rejected}'))
@@ -0,0 +1,173 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Per-request performance metrics
+#
+# RequestMetrics collects one sampled request's SQL, serializer time and sizes (see
+# reviews/middleware.py); the registry folds finished requests into per-view histograms that
+# render() prints in the Prometheus text exposition format. Each worker process keeps its own
+# registry, so scrape every process (or use one worker per scrape target).
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,  # Fraction of requests that are measured
+    'SLOW_REQUEST_MS': 500,
+    'DUPLICATE_QUERY_THRESHOLD': 5,  # Repeats of one normalized statement flagged as N+1
+}
+
+BUCKETS = {
+    'request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'db_duration_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    'serializer_duration_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+    'db_queries': (1, 2, 3, 5, 10, 20, 50, 100),
+    'response_size_bytes': (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+}
+
+HELP = {
+    'request_duration_seconds': 'Wall time spent handling the request.',
+    'db_duration_seconds': 'Time spent executing SQL.',
+    'serializer_duration_seconds': 'Time spent in serializer to_representation().',
+    'db_queries': 'SQL statements executed.',
+    'response_size_bytes': 'Size of the response body (streaming responses excluded).',
+}
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_METRICS', {}).get(name, DEFAULTS[name])
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def normalize_sql(sql):
+    # Collapse literals and placeholder lists so statements differing only by values compare equal
+    sql = _NUMBER.sub('?', _STRING.sub('?', sql)).replace('%s', '?')
+    return ' '.join(_IN_LIST.sub('(...)', sql).split())
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    @property
+    def db_time(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def duplicates(self):
+        threshold = config('DUPLICATE_QUERY_THRESHOLD')
+        counts = Counter(normalize_sql(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+current = contextvars.ContextVar('reviews_request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection; the context variable follows ASGI requests into the
+    # threads that run their ORM calls, so sync and async views are measured alike
+    request_metrics = current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.queries.append((sql, time.perf_counter() - started))
+
+
+def install(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    # Adds serializer time to the sampled request; nested and per-item calls count only once
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics._serializer_depth:
+            return super().to_representation(instance)
+        metrics._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics._serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}  # (metric, view) -> Histogram
+        self.requests = Counter()  # (view, method, status)
+        self.slow = Counter()  # view
+        self.duplicates = Counter()  # view
+
+    def observe(self, view, method, status, duration, metrics, size=None, slow=False, duplicates=False):
+        values = {
+            'request_duration_seconds': duration,
+            'db_duration_seconds': metrics.db_time,
+            'serializer_duration_seconds': metrics.serializer_time,
+            'db_queries': len(metrics.queries),
+            'response_size_bytes': size,
+        }
+        with self.lock:
+            self.requests[view, method, status] += 1
+            self.slow[view] += slow
+            self.duplicates[view] += duplicates
+            for name, value in values.items():
+                if value is not None:
+                    key = (name, view)
+                    if key not in self.histograms:
+                        self.histograms[key] = Histogram(BUCKETS[name])
+                    self.histograms[key].observe(value)
+
+    def render(self):
+        with self.lock:
+            lines = ['# HELP reviews_requests_total Sampled requests.', '# TYPE reviews_requests_total counter']
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'reviews_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for name, help_text in (('slow_requests_total', 'Sampled requests slower than SLOW_REQUEST_MS.'),
+                                    ('duplicate_query_requests_total', 'Sampled requests with repeated queries.')):
+                counter = self.slow if name.startswith('slow') else self.duplicates
+                lines += [f'# HELP reviews_{name} {help_text}', f'# TYPE reviews_{name} counter']
+                lines += [f'reviews_{name}{{view="{view}"}} {count}' for view, count in sorted(counter.items())]
+            for name in BUCKETS:
+                lines += [f'# HELP reviews_{name} {HELP[name]}', f'# TYPE reviews_{name} histogram']
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'reviews_{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'reviews_{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'reviews_{name}_count{{view="{view}"}} {cumulative}')
+            return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
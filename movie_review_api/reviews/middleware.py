@@ -0,0 +1,170 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import compression, metrics, routers
+
+logger = logging.getLogger('reviews.performance')
+
+
+# Performance Middleware
+# Measures a sample of requests (REVIEWS_METRICS['SAMPLE_RATE']) per view: wall time, SQL count and
+# time, serializer time and response size. Slow requests are logged with their normalized SQL and
+# requests repeating one statement DUPLICATE_QUERY_THRESHOLD times or more are flagged as N+1.
+# Works in both sync and async chains so it never forces async views through a thread.
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.record(request, response, time.perf_counter() - started, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self.record(request, response, time.perf_counter() - started, request_metrics)
+        return response
+
+    def sampled(self):
+        return metrics.config('ENABLED') and random.random() < metrics.config('SAMPLE_RATE')
+
+    def record(self, request, response, duration, request_metrics):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        slow = duration * 1000 >= metrics.config('SLOW_REQUEST_MS')
+        duplicates = request_metrics.duplicates()
+        metrics.registry.observe(view, request.method, response.status_code, duration, request_metrics,
+                                 size=size, slow=slow, duplicates=bool(duplicates))
+
+        if slow:
+            statements = '\n'.join(f'  {seconds * 1000:.1f}ms {metrics.normalize_sql(sql)}'
+                                   for sql, seconds in request_metrics.queries)
+            logger.warning('Slow request %s %s (%s): %.0fms, %d queries in %.0fms, serializer %.0fms\n%s',
+                           request.method, request.path, view, duration * 1000, len(request_metrics.queries),
+                           request_metrics.db_time * 1000, request_metrics.serializer_time * 1000, statements)
+        for sql, count in duplicates.items():
+            logger.warning('Possible N+1 in %s %s (%s): %d x %s', request.method, request.path, view, count, sql)
+
+
+# Compression Middleware
+# Compresses response bodies of REVIEWS_COMPRESSION['MIN_SIZE'] bytes or more with Brotli or gzip,
+# whichever the client accepts (see compression.py). Streaming responses are left alone so exports
+# and moderation progress still reach the client as they are produced.
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (not compression.config('ENABLED') or response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < compression.config('MIN_SIZE')
+                or not compression.compressible(response.get('Content-Type', ''))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+        content = compression.compress(response.content, coding)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = coding
+        # The compressed body is a different byte sequence: a strong validator would claim otherwise
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+        return response
+
+
+# Replica Routing Middleware
+# Lets safe-method requests read from the replicas (see routers.py) unless the client wrote within
+# DATABASE_REPLICA_STICKY_SECONDS, which a cookie set on every successful write remembers.
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary_until'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = routers.use_replicas.set(self.may_use_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.use_replicas.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = routers.use_replicas.set(self.may_use_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.use_replicas.reset(token)
+        return self.pin(request, response)
+
+    def may_use_replicas(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in self.safe_methods:
+            return False
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) < time.time()
+        except ValueError:
+            return True
+
+    def pin(self, request, response):
+        sticky = settings.DATABASE_REPLICA_STICKY_SECONDS
+        if settings.DATABASE_REPLICAS and request.method not in self.safe_methods and response.status_code < 400 and sticky:
+            response.set_cookie(self.cookie_name, str(time.time() + sticky), max_age=sticky, httponly=True,
+                                samesite='Lax')
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_alter_movie_description_alter_movie_release_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRating',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='reviews.movie')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('last_review_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
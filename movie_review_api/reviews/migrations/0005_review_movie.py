@@ -0,0 +1,18 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_movierating'),
+    ]
+
+    operations = [
+        # Nullable until 0006 has backfilled it from movie_title
+        migrations.AddField(
+            model_name='review',
+            name='movie',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='reviews.movie'),
+        ),
+    ]
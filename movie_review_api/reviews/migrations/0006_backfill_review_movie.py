@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+# Reviews handled per transaction. Each batch is a keyset range over the primary key,
+# so no statement touches or locks more than this many review rows.
+BATCH_SIZE = 1000
+
+
+def backfill_review_movie(apps, schema_editor):
+    Movie = apps.get_model('reviews', 'Movie')
+    Review = apps.get_model('reviews', 'Review')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Review.objects.using(db)
+                     .filter(pk__gt=last_pk, movie__isnull=True)
+                     .order_by('pk')
+                     .values_list('pk', 'movie_title')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+        titles = {title for _, title in batch}
+        with transaction.atomic(using=db):
+            # Titles without a catalogue entry get one, as the free-text field allowed them
+            Movie.objects.using(db).bulk_create([Movie(title=title) for title in titles], ignore_conflicts=True)
+            movie_ids = {}
+            for title, pk in Movie.objects.using(db).filter(title__in=titles).values_list('title', 'pk'):
+                movie_ids[title] = pk
+                # MySQL's default collation matches titles case- and trailing-space-insensitively
+                movie_ids.setdefault(title.rstrip().casefold(), pk)
+
+            reviews_by_movie = defaultdict(list)
+            for pk, title in batch:
+                movie_id = movie_ids.get(title) or movie_ids.get(title.rstrip().casefold())
+                if movie_id is None:
+                    # The collation matched a title neither key covers (accent-insensitively, as
+                    # utf8mb4_0900_ai_ci does), so the insert above was skipped; that movie is the one meant
+                    movie_id = movie_ids[title] = (Movie.objects.using(db).filter(title=title)
+                                                   .values_list('pk', flat=True).get())
+                reviews_by_movie[movie_id].append(pk)
+            for movie_id, review_pks in reviews_by_movie.items():
+                Review.objects.using(db).filter(pk__in=review_pks).update(movie_id=movie_id)
+
+
+def restore_movie_title(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Review.objects.using(db)
+                     .filter(pk__gt=last_pk)
+                     .order_by('pk')
+                     .values_list('pk', 'movie__title')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+        reviews_by_title = defaultdict(list)
+        for pk, title in batch:
+            reviews_by_title[title or ''].append(pk)
+        with transaction.atomic(using=db):
+            for title, review_pks in reviews_by_title.items():
+                Review.objects.using(db).filter(pk__in=review_pks).update(movie_title=title)
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own instead of holding one transaction over the whole table
+    atomic = False
+
+    dependencies = [
+        ('reviews', '0005_review_movie'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_review_movie, restore_movie_title),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_backfill_review_movie'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='reviews.movie'),
+        ),
+        # A default lets the column be re-added when this migration is reversed
+        migrations.AlterField(
+            model_name='review',
+            name='movie_title',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='review',
+            name='movie_title',
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Rows copied per INSERT, walking the source table by primary key
+BATCH_SIZE = 1000
+
+
+def _auto_through(apps):
+    # The implicit reviews_review_likes table backing the old Review.likes
+    return apps.get_model('reviews', 'Review')._meta.get_field('likes').remote_field.through
+
+
+def copy_likes_to_like_table(apps, schema_editor):
+    Like = apps.get_model('reviews', 'Like')
+    Review = apps.get_model('reviews', 'Review')
+    Through = _auto_through(apps)
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Through.objects.using(db).filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'user_id', 'review_id')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        # Pairs already stored as Like rows are skipped by the unique (user, review) constraint
+        Like.objects.using(db).bulk_create(
+            [Like(user_id=user_id, review_id=review_id) for _, user_id, review_id in batch],
+            ignore_conflicts=True,
+        )
+
+    like_counts = (Like.objects.using(db).filter(review=OuterRef('pk')).order_by()
+                   .values('review').annotate(total=Count('pk')).values('total'))
+    Review.objects.using(db).update(like_count=Coalesce(Subquery(like_counts), 0))
+
+
+def copy_likes_to_auto_table(apps, schema_editor):
+    Like = apps.get_model('reviews', 'Like')
+    Through = _auto_through(apps)
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Like.objects.using(db).filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'user_id', 'review_id')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        Through.objects.using(db).bulk_create(
+            [Through(user_id=user_id, review_id=review_id) for _, user_id, review_id in batch],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0008_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_likes_to_like_table, copy_likes_to_auto_table),
+        # Django cannot add through= to an existing M2M, so the implicit table is dropped and the
+        # field is redeclared on top of the Like model, which needs no schema change
+        migrations.RemoveField(
+            model_name='review',
+            name='likes',
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='likes',
+            field=models.ManyToManyField(blank=True, related_name='liked_reviews', through='reviews.Like', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+# Native full-text indexes serve search on MySQL; other databases use the tables created here
+FULLTEXT_INDEXES = (
+    ('reviews_review', 'review_content_fulltext', 'review_content'),
+    ('reviews_movie', 'movie_text_fulltext', 'title, description'),
+)
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'CREATE FULLTEXT INDEX {name} ON {table} ({columns})')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, _ in FULLTEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX {name} ON {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0009_unify_review_likes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+        migrations.CreateModel(
+            name='SearchStats',
+            fields=[
+                ('kind', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('total_length', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('term', models.CharField(max_length=64)),
+                ('object_id', models.BigIntegerField()),
+                ('term_frequency', models.PositiveIntegerField()),
+                ('document_length', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='search_posting_object_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'term', 'object_id'), name='search_posting_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('term', models.CharField(max_length=64)),
+                ('document_frequency', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'term'), name='search_term_unique')],
+            },
+        ),
+    ]
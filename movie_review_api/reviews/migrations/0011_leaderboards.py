@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardState',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('trending_epoch', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='reviews.movie')),
+                ('score', models.FloatField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movierating',
+            name='bayesian_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='TrendingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('weight', models.PositiveIntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_buckets', to='reviews.movie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('movie', 'hour'), name='trending_bucket_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0011_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, transaction
+
+# Comments handled per transaction, as a keyset range over the primary key
+BATCH_SIZE = 1000
+SEGMENT_WIDTH = 7
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def segment(pk):
+    # Same encoding as reviews.threads.segment, frozen here as migrations must not import app code
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = DIGITS[remainder] + digits
+    return digits.rjust(SEGMENT_WIDTH, '0')
+
+
+def backfill_comment_paths(apps, schema_editor):
+    # Existing comments predate replies, so each one is the root of its own thread
+    Comment = apps.get_model('reviews', 'Comment')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Comment.objects.using(db).filter(pk__gt=last_pk).order_by('pk').only('pk')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for comment in batch:
+            comment.path = segment(comment.pk)
+        with transaction.atomic(using=db):
+            Comment.objects.using(db).bulk_update(batch, ['path'])
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own instead of holding one transaction over the whole table
+    atomic = False
+
+    dependencies = [
+        ('reviews', '0015_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0017_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityState',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('last_review_id', models.BigIntegerField(default=0)),
+                ('built_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_movies', to='reviews.movie')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='reviews.movie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('movie', 'rank'), name='similar_movie_rank_unique')],
+            },
+        ),
+    ]
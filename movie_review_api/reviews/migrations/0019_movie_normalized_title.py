@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0018_similar_movies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='normalized_title',
+            field=models.CharField(db_index=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,40 @@
+import unicodedata
+
+from django.db import migrations, transaction
+
+# Movies handled per transaction, as a keyset range over the primary key
+BATCH_SIZE = 1000
+
+
+def normalize_title(title):
+    # Same as reviews.models.normalize_title, frozen here as migrations must not import app code
+    return ' '.join(unicodedata.normalize('NFKC', title).casefold().split())[:255]
+
+
+def backfill_normalized_titles(apps, schema_editor):
+    Movie = apps.get_model('reviews', 'Movie')
+    db = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        batch = list(Movie.objects.using(db).filter(pk__gt=last_pk).order_by('pk').only('pk', 'title')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for movie in batch:
+            movie.normalized_title = normalize_title(movie.title)
+        with transaction.atomic(using=db):
+            Movie.objects.using(db).bulk_update(batch, ['normalized_title'])
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own instead of holding one transaction over the whole table
+    atomic = False
+
+    dependencies = [
+        ('reviews', '0019_movie_normalized_title'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_titles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, Max, Q, Sum, Value
+
+# Aggregates written per bulk INSERT
+BATCH_SIZE = 1000
+
+
+def seed_movie_ratings(apps, schema_editor):
+    # Same as reviews.ratings.rebuild, frozen here as migrations must not import app code. MovieRating
+    # was created empty, so reviews written before it were never counted and removing one of them
+    # took its movie's review_count below zero.
+    Review = apps.get_model('reviews', 'Review')
+    MovieRating = apps.get_model('reviews', 'MovieRating')
+    db = schema_editor.connection.alias
+
+    per_movie = (Review.objects.using(db).filter(is_hidden=False).order_by().values('movie_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        last_review_at=Max('created_date'),
+        **{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+    ))
+    MovieRating.objects.using(db).all().delete()
+    batch = []
+    for row in per_movie.iterator(chunk_size=BATCH_SIZE):
+        batch.append(MovieRating(**row))
+        if len(batch) >= BATCH_SIZE:
+            MovieRating.objects.using(db).bulk_create(batch)
+            batch = []
+    MovieRating.objects.using(db).bulk_create(batch)
+
+    # Bayesian scores as reviews.leaderboards.refresh_top_rated computes them
+    options = getattr(settings, 'REVIEWS_LEADERBOARDS', {})
+    totals = MovieRating.objects.using(db).aggregate(reviews=Sum('review_count'), ratings=Sum('rating_sum'))
+    mean = totals['ratings'] / totals['reviews'] if totals['reviews'] else options.get('DEFAULT_MEAN', 3.0)
+    prior = options.get('PRIOR_WEIGHT', 10)
+    MovieRating.objects.using(db).update(
+        bayesian_score=(Value(prior * mean) + F('rating_sum')) / (Value(float(prior)) + F('review_count')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0020_backfill_normalized_titles'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_movie_ratings, migrations.RunPython.noop),
+    ]
@@ -1,29 +1,69 @@
-from django.db import models
+import unicodedata
+
+from django.db import models, router
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 # Create your models here.
 class Movie(models.Model):
     title = models.CharField(max_length=255, unique=True)
+    # Case-, width- and whitespace-folded title that variants of one title share (see titles.py)
+    normalized_title = models.CharField(max_length=255, db_index=True, default='')
     description = models.TextField(default='No description available')
     release_date = models.DateField(default='2000-01-01')
+    view_count = models.PositiveIntegerField(default=0)  # Only counted in write-behind mode (see writebehind.py)
+    follower_count = models.PositiveIntegerField(default=0)  # MovieFollow rows; decides fan-out (see feeds.py)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Bulk writes (bulk_create) set normalized_title themselves
+        self.normalized_title = normalize_title(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_title'}
+        super().save(*args, **kwargs)
+
+
+def normalize_title(title):
+    # 'The  Lion King ' and 'the lion king' share a key; NFKC also folds full-width and ligature forms
+    return ' '.join(unicodedata.normalize('NFKC', title).casefold().split())[:255]
+
+
+def raw_delete(queryset):
+    # Deletes the queryset's rows with one DELETE on the model's write database and returns how
+    # many went. Nothing cascades and no signals are sent: for bulk paths on models with delete
+    # signals or cascades (reviews, likes, comments) that clean up after themselves. The only
+    # use of the private QuerySet._raw_delete(); models without either use QuerySet.delete().
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
 
 # Movie Title, Review Content, Rating, User, and Created Date are defined.
 class Review(models.Model):
-    movie_title = models.CharField(max_length=255)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE,
+                              related_name='reviews')  # Indexed, so filtering a movie's reviews is an index seek
     review_content = models.TextField()
     rating = models.IntegerField()
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name='reviews')  # ForeignKey to User ensures reviews are tied to specific users.
     created_date = models.DateTimeField(auto_now_add=True)
-    likes = models.ManyToManyField(User, related_name='liked_reviews', blank=True)
+    # Likes are stored only as Like rows; like_count mirrors them and is kept in step with F() updates
+    likes = models.ManyToManyField(User, through='Like', related_name='liked_reviews', blank=True)
+    like_count = models.PositiveIntegerField(default=0)
+    is_hidden = models.BooleanField(default=False)  # Hidden by moderation: left out of listings and aggregates
+
+    class Meta:
+        # Composite indexes matching the keyset order of the review listings
+        indexes = [
+            models.Index(fields=['created_date', 'id'], name='review_created_idx'),
+            models.Index(fields=['user', 'created_date', 'id'], name='review_user_created_idx'),
+            models.Index(fields=['movie', 'created_date', 'id'], name='review_movie_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.movie_title} - {self.user.username}"
+        return f"{self.movie.title} - {self.user.username}"
 
 
 class Like(models.Model):
@@ -38,8 +78,196 @@ class Like(models.Model):
         return f"{self.user.username} likes {self.review.movie.title}"
 
 
+class PathField(models.CharField):
+    # A materialized path (see threads.py), compared byte by byte on every backend so a subtree is
+    # the range [path, path + '~'). MySQL's default utf8mb4_0900_ai_ci collation sorts '~' before
+    # the digits; SQLite already compares in binary.
+    collations = {'mysql': 'utf8mb4_bin'}
+
+    def db_parameters(self, connection):
+        params = super().db_parameters(connection)
+        params['collation'] = self.db_collation or self.collations.get(connection.vendor)
+        return params
+
+
 class Comment(models.Model):
     review = models.ForeignKey(Review, related_name='comments', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_hidden = models.BooleanField(default=False)  # Hidden by moderation
+    # Reply threading as a materialized path (see threads.py): the fixed-width ids of the root
+    # down to this comment, so a subtree is one range of the (review, path) index
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    path = PathField(max_length=255, default='')
+    depth = models.PositiveSmallIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)  # Direct replies, kept in step with F() updates
+
+    class Meta:
+        # Matches the keyset order of the comment listings
+        indexes = [
+            models.Index(fields=['review', 'created_at', 'id'], name='comment_review_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='comment_created_idx'),
+            models.Index(fields=['review', 'path'], name='comment_review_path_idx'),
+            models.Index(fields=['path'], name='comment_path_idx'),
+        ]
+
+
+# Materialized rating aggregate for a movie, kept in step with review writes (see ratings.py)
+class MovieRating(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='rating')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    # One counter per star, so the distribution never needs a scan of the reviews
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    last_review_at = models.DateTimeField(null=True, blank=True)
+    # Average shrunk towards the global mean, so one 5-star review does not top the chart (leaderboards.py)
+    bayesian_score = models.FloatField(default=0, db_index=True)
+
+    @property
+    def average(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    @property
+    def distribution(self):
+        return {str(star): getattr(self, f'rating_{star}') for star in range(1, 6)}
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.review_count} reviews"
+
+
+# Inverted index used for search when the database has no native full-text index (see search.py)
+class SearchTerm(models.Model):
+    kind = models.CharField(max_length=10)  # 'review' or 'movie'
+    term = models.CharField(max_length=64)
+    document_frequency = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['kind', 'term'], name='search_term_unique')]
+
+
+class SearchPosting(models.Model):
+    kind = models.CharField(max_length=10)
+    term = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+    term_frequency = models.PositiveIntegerField()
+    document_length = models.PositiveIntegerField()  # Copied onto each posting so scoring needs no join
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['kind', 'term', 'object_id'], name='search_posting_unique')]
+        indexes = [models.Index(fields=['kind', 'object_id'], name='search_posting_object_idx')]
+
+
+class SearchStats(models.Model):
+    kind = models.CharField(max_length=10, primary_key=True)
+    document_count = models.PositiveIntegerField(default=0)
+    total_length = models.PositiveBigIntegerField(default=0)
+
+
+# Hourly activity (reviews and likes, weighted) per movie, the history trending scores are built from
+class TrendingBucket(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='trending_buckets')
+    hour = models.DateTimeField(db_index=True)
+    weight = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['movie', 'hour'], name='trending_bucket_unique')]
+
+
+# Time-decayed activity score per movie, stored relative to LeaderboardState.trending_epoch
+class TrendingScore(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(default=0, db_index=True)
+
+
+class LeaderboardState(models.Model):
+    name = models.CharField(max_length=32, primary_key=True)
+    trending_epoch = models.DateTimeField()
+
+
+# A user follows every movie they have reviewed or liked a review of; their feed shows its new reviews
+class MovieFollow(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='movie_follows')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='follows')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'movie'], name='movie_follow_unique')]
+        indexes = [models.Index(fields=['movie', 'user'], name='movie_follow_movie_idx')]
+
+
+# One review in a user's precomputed feed. created_date is copied from the review so a page is read
+# from the (user, created_date, review) index alone.
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='feed_entries')
+    created_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'review'], name='feed_entry_unique')]
+        indexes = [models.Index(fields=['user', 'created_date', 'review'], name='feed_entry_user_created_idx')]
+
+
+# Something that happened to a user's review: a like, a comment or a reply to their comment.
+# Written by a background job (see tasks.py).
+class Notification(models.Model):
+    VERBS = [('like', 'liked your review'), ('comment', 'commented on your review'),
+             ('reply', 'replied to your comment')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    verb = models.CharField(max_length=10, choices=VERBS)
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx')]
+
+
+# Post-write work queued by jobs.enqueue and run by the run_jobs worker (see jobs.py)
+class Job(models.Model):
+    PENDING, RUNNING, FAILED = 'pending', 'running', 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField()
+    # Set while pending, so a second request for the same work is dropped; cleared when claimed
+    dedup_key = models.CharField(max_length=191, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending job becomes due; for a running one, when its worker's lease runs out
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'], name='job_due_idx')]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+# A movie's most similar movies by co-rating, best first (see similarity.py)
+class SimilarMovie(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='similar_movies')
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # Serves the read: one movie's list in rank order
+        constraints = [models.UniqueConstraint(fields=['movie', 'rank'], name='similar_movie_rank_unique')]
+
+
+# How far the similarity lists have been built: reviews up to last_review_id are included
+class SimilarityState(models.Model):
+    name = models.CharField(max_length=32, primary_key=True)
+    last_review_id = models.BigIntegerField(default=0)
+    built_at = models.DateTimeField()
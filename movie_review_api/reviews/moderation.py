@@ -0,0 +1,111 @@
+from django.db import transaction
+
+from . import cache, jobs, ratings, search, threads
+from .models import Comment, FeedEntry, Like, Notification, Review, raw_delete
+
+# Bulk moderation of reviews and comments
+#
+# run() deletes, hides or unhides everything a queryset matches in primary-key chunks, one
+# transaction per chunk, yielding progress after each. Deletes are raw: likes, comments, feed
+# entries and notifications of deleted reviews are removed with one statement per table instead of
+# Django's collector and its per-row signals. The rating aggregates and cached responses are fixed
+# up for the whole chunk at once, and the search index by one batch of queued jobs. Hidden reviews
+# are taken out of their movie's rating like deleted ones.
+
+KINDS = {'review': Review, 'comment': Comment}
+ACTIONS = ('delete', 'hide', 'unhide')
+
+
+def matching(kind, ids=None, movie=None, movie_title=None, username=None, review=None, rating=None,
+             created_after=None, created_before=None, contains=None):
+    queryset = KINDS[kind].objects.all()
+    created = 'created_date' if kind == 'review' else 'created_at'
+    filters = {
+        'pk__in': ids,
+        'movie_id' if kind == 'review' else 'review__movie_id': movie,
+        'movie__title' if kind == 'review' else 'review__movie__title': movie_title,
+        'user__username': username,
+        'review_id': review if kind == 'comment' else None,
+        'rating': rating if kind == 'review' else None,
+        f'{created}__gte': created_after,
+        f'{created}__lt': created_before,
+        'review_content__icontains' if kind == 'review' else 'content__icontains': contains,
+    }
+    return queryset.filter(**{lookup: value for lookup, value in filters.items() if value is not None})
+
+
+def run(kind, action, queryset, chunk_size=500):
+    # Yields {'processed': rows visited so far, 'changed': rows changed so far, 'total': rows matched}
+    handler = {
+        ('review', 'delete'): _delete_reviews,
+        ('review', 'hide'): lambda pks: _hide_reviews(pks, True),
+        ('review', 'unhide'): lambda pks: _hide_reviews(pks, False),
+        ('comment', 'delete'): _delete_comments,
+        ('comment', 'hide'): lambda pks: _hide_comments(pks, True),
+        ('comment', 'unhide'): lambda pks: _hide_comments(pks, False),
+    }[kind, action]
+    total = queryset.count()
+    processed = changed = last = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            changed += handler(pks)
+        processed += len(pks)
+        last = pks[-1]
+        yield {'processed': processed, 'changed': changed, 'total': total}
+
+
+def _rows(pks, **filters):
+    return list(Review.objects.filter(pk__in=pks, **filters)
+                .only('pk', 'movie_id', 'rating', 'created_date', 'is_hidden').select_for_update())
+
+
+def _delete_reviews(pks):
+    rows = _rows(pks)
+    raw_delete(Like.objects.filter(review_id__in=pks))
+    threads.unlink(pks)
+    raw_delete(Comment.objects.filter(review_id__in=pks))
+    FeedEntry.objects.filter(review_id__in=pks).delete()
+    Notification.objects.filter(review_id__in=pks).delete()
+    deleted = raw_delete(Review.objects.filter(pk__in=pks))
+    ratings.reviews_removed([row for row in rows if not row.is_hidden])
+    if search.backend() == 'index':
+        jobs.enqueue_many('search.index', ({'kind': 'review', 'id': pk} for pk in pks))
+    _bump_reviews(rows)
+    return deleted
+
+
+def _hide_reviews(pks, hidden):
+    rows = _rows(pks, is_hidden=not hidden)
+    Review.objects.filter(pk__in=[row.pk for row in rows]).update(is_hidden=hidden)
+    (ratings.reviews_removed if hidden else ratings.reviews_added)(rows)
+    _bump_reviews(rows)
+    return len(rows)
+
+
+def _bump_reviews(rows):
+    cache.bump_on_commit(('reviews',), *(('review', row.pk) for row in rows),
+                         *(('comments', row.pk) for row in rows),
+                         *(('movie', movie_id) for movie_id in {row.movie_id for row in rows}))
+
+
+def _delete_comments(pks):
+    # Replies go with the comments they answer
+    deleted, review_ids = threads.delete_subtrees(pks)
+    _bump_comments(review_ids)
+    return deleted
+
+
+def _hide_comments(pks, hidden):
+    comments = Comment.objects.filter(pk__in=pks, is_hidden=not hidden)
+    review_ids = set(comments.values_list('review_id', flat=True))
+    changed = comments.update(is_hidden=hidden)
+    _bump_comments(review_ids)
+    return changed
+
+
+def _bump_comments(review_ids):
+    cache.bump_on_commit(*(('review', review_id) for review_id in review_ids),
+                         *(('comments', review_id) for review_id in review_ids))
@@ -0,0 +1,124 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Page-number pagination by default, with an opt-in keyset mode.
+# Keyset mode is selected with ?pagination=keyset (first page) or ?cursor=<token>. It seeks
+# past the last row of the previous page on (timestamp, id), so deep pages cost the same as
+# the first one and no COUNT(*) is issued.
+class KeysetPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # (timestamp field, tie-breaker); a leading '-' orders newest first
+    ordering = ('-created_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = queryset.order_by(*self.ordering)
+        self.keyset = (self.cursor_query_param in request.query_params
+                       or request.query_params.get(self.mode_query_param) == 'keyset')
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek(*position))
+
+        # One extra row tells us whether there is a next page without counting
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def seek(self, value, pk):
+        # Rows strictly after (value, pk) in the listing order; the range on the leading
+        # column lets the database seek into the composite index
+        field, tie_breaker = (name.lstrip('-') for name in self.ordering)
+        if self.ordering[0].startswith('-'):
+            return Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(**{f'{tie_breaker}__lt': pk}))
+        return Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(**{f'{tie_breaker}__gt': pk}))
+
+    def position_of(self, obj):
+        field, tie_breaker = (name.lstrip('-') for name in self.ordering)
+        if isinstance(obj, dict):  # A .values() row
+            return obj[field], obj[tie_breaker]
+        return getattr(obj, field), getattr(obj, tie_breaker)
+
+    def encode_cursor(self, position):
+        value, pk = position
+        payload = json.dumps([value.isoformat(), pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+
+class ReviewPagination(KeysetPagination):
+    ordering = ('-created_date', '-id')
+
+
+class CommentPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+# Comment trees page along the materialized path, which is unique and indexed
+class CommentTreePagination(CursorPagination):
+    ordering = 'path'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# Cursor-only pagination over a merged feed page (see feeds.page)
+class FeedPagination(ReviewPagination):
+    page_size = 20
+
+    def paginate_feed(self, user, request, page):
+        self.keyset, self.request = True, request
+        rows, self.has_next = page(user, self.get_page_size(request), self.decode_cursor(request))
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
@@ -0,0 +1,103 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from . import leaderboards
+from .models import MovieRating, Review
+
+RATING_CHOICES = range(1, 6)
+
+
+# Incremental maintenance of MovieRating.
+# Callers run these inside the same transaction as the review write, so the
+# aggregate never drifts from the rows it summarises.
+
+def _apply(movie_id, delta, rating_sum, star_counts, created_date):
+    # delta reviews totalling rating_sum, star_counts maps rating -> delta for the histogram
+    updates = {
+        'review_count': F('review_count') + delta,
+        'rating_sum': F('rating_sum') + rating_sum,
+    }
+    for rating, count in star_counts.items():
+        if rating in RATING_CHOICES:
+            bucket = f'rating_{rating}'
+            updates[bucket] = F(bucket) + count
+    if delta > 0:
+        updates['last_review_at'] = Greatest(Coalesce('last_review_at', created_date), created_date)
+
+    rows = MovieRating.objects.filter(movie_id=movie_id).update(**updates)
+    if not rows:
+        MovieRating.objects.get_or_create(movie_id=movie_id)
+        MovieRating.objects.filter(movie_id=movie_id).update(**updates)
+
+    if delta < 0:
+        # Only the newest review can move last_review_at backwards
+        stale = MovieRating.objects.filter(movie_id=movie_id, last_review_at__lte=created_date)
+        stale.update(last_review_at=Review.objects.filter(movie_id=movie_id, is_hidden=False)
+                     .aggregate(latest=Max('created_date'))['latest'])
+
+    leaderboards.refresh_top_rated([movie_id])
+
+
+def review_added(review):
+    _apply(review.movie_id, 1, review.rating, {review.rating: 1}, review.created_date)
+
+
+def review_removed(review):
+    _apply(review.movie_id, -1, -review.rating, {review.rating: -1}, review.created_date)
+
+
+def review_changed(old_movie_id, old_rating, review):
+    if old_movie_id == review.movie_id and old_rating == review.rating:
+        return
+    _apply(old_movie_id, -1, -old_rating, {old_rating: -1}, review.created_date)
+    _apply(review.movie_id, 1, review.rating, {review.rating: 1}, review.created_date)
+
+
+def reviews_added(reviews):
+    # Folds a batch of new reviews (e.g. from bulk_create) in with one UPDATE per movie
+    per_movie = defaultdict(list)
+    for review in reviews:
+        per_movie[review.movie_id].append(review)
+    for movie_id, movie_reviews in per_movie.items():
+        _apply(movie_id, len(movie_reviews), sum(review.rating for review in movie_reviews),
+               Counter(review.rating for review in movie_reviews),
+               max(review.created_date for review in movie_reviews))
+
+
+def reviews_removed(reviews):
+    # Takes a batch of deleted or hidden reviews out with one UPDATE per movie
+    per_movie = defaultdict(list)
+    for review in reviews:
+        per_movie[review.movie_id].append(review)
+    for movie_id, movie_reviews in per_movie.items():
+        _apply(movie_id, -len(movie_reviews), -sum(review.rating for review in movie_reviews),
+               {rating: -count for rating, count in Counter(review.rating for review in movie_reviews).items()},
+               max(review.created_date for review in movie_reviews))
+
+
+def rebuild(batch_size=1000):
+    # Recomputes every aggregate from the visible reviews in one pass
+    per_movie = (Review.objects.filter(is_hidden=False).order_by().values('movie_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        last_review_at=Max('created_date'),
+        **{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in RATING_CHOICES},
+    ))
+
+    created = 0
+    with transaction.atomic():
+        MovieRating.objects.all().delete()
+        batch = []
+        for row in per_movie.iterator(chunk_size=batch_size):
+            batch.append(MovieRating(**row))
+            if len(batch) >= batch_size:
+                MovieRating.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        MovieRating.objects.bulk_create(batch)
+        created += len(batch)
+        leaderboards.refresh_top_rated(recompute_mean=True)
+    return created
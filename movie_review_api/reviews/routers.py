@@ -0,0 +1,35 @@
+import contextvars
+import random
+
+from django.conf import settings
+
+# Read-replica routing
+#
+# Reads go to a random replica from settings.DATABASE_REPLICAS only while the current context allows
+# it, which ReplicaRoutingMiddleware does for safe-method requests from clients that have not written
+# recently. Everything else (writes, unsafe requests, management commands, background threads and
+# the rest of a request once it has written) reads from the primary.
+
+use_replicas = contextvars.ContextVar('reviews_use_replicas', default=False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and use_replicas.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # Read-after-write: the rest of this request reads what it just wrote
+        if use_replicas.get():
+            use_replicas.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return False if db in settings.DATABASE_REPLICAS else None
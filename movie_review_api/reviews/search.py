@@ -0,0 +1,179 @@
+import base64
+import json
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Movie, Review, SearchPosting, SearchStats, SearchTerm
+
+# Relevance-ranked search over review content and movie titles/descriptions.
+#
+# On MySQL the FULLTEXT indexes created by migration 0010 answer queries directly. Elsewhere
+# (SQLite in tests and local runs) a tokenized inverted index -- SearchTerm, SearchPosting and
+# SearchStats -- is kept up to date as documents are written and scored with BM25.
+
+KINDS = ('review', 'movie')
+K1 = 1.2
+B = 0.75
+MAX_TERM_LENGTH = 64
+
+STOP_WORDS = frozenset('''
+a an and are as at be but by for from has have he her his i in is it its of on or she so that the
+their them they this to was were will with you your
+'''.split())
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def backend():
+    configured = getattr(settings, 'REVIEWS_SEARCH', {}).get('BACKEND', 'auto')
+    if configured == 'auto':
+        return 'fulltext' if connection.vendor == 'mysql' else 'index'
+    return configured
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall((text or '').lower())
+            if len(token) > 1 and token not in STOP_WORDS]
+
+
+def document_text(kind, obj):
+    if kind == 'review':
+        return obj.review_content
+    # The title counts twice so a title match outranks a passing mention in a description
+    return f'{obj.title} {obj.title} {obj.description}'
+
+
+# Index maintenance
+
+def index_document(kind, object_id, text):
+    terms = Counter(tokenize(text))
+    length = sum(terms.values())
+    with transaction.atomic():
+        old = dict(SearchPosting.objects.filter(kind=kind, object_id=object_id)
+                   .values_list('term', 'document_length'))
+        old_length = next(iter(old.values()), 0)
+        removed, added = old.keys() - terms.keys(), terms.keys() - old.keys()
+
+        if old:
+            SearchPosting.objects.filter(kind=kind, object_id=object_id).delete()
+        SearchPosting.objects.bulk_create([
+            SearchPosting(kind=kind, term=term, object_id=object_id, term_frequency=count, document_length=length)
+            for term, count in terms.items()
+        ])
+
+        if removed:
+            SearchTerm.objects.filter(kind=kind, term__in=removed).update(
+                document_frequency=F('document_frequency') - 1)
+        if added:
+            SearchTerm.objects.bulk_create([SearchTerm(kind=kind, term=term) for term in added],
+                                           ignore_conflicts=True)
+            SearchTerm.objects.filter(kind=kind, term__in=added).update(
+                document_frequency=F('document_frequency') + 1)
+
+        _update_stats(kind, int(bool(terms)) - int(bool(old)), length - old_length)
+
+
+def remove_document(kind, object_id):
+    index_document(kind, object_id, '')
+
+
+def _update_stats(kind, documents, length):
+    if not documents and not length:
+        return
+    updates = {'document_count': F('document_count') + documents, 'total_length': F('total_length') + length}
+    if not SearchStats.objects.filter(kind=kind).update(**updates):
+        SearchStats.objects.get_or_create(kind=kind)
+        SearchStats.objects.filter(kind=kind).update(**updates)
+
+
+def index_objects(kind, objects):
+    for obj in objects:
+        index_document(kind, obj.pk, document_text(kind, obj))
+
+
+def rebuild(chunk_size=1000):
+    with transaction.atomic():
+        SearchPosting.objects.all().delete()
+        SearchTerm.objects.all().delete()
+        SearchStats.objects.all().delete()
+    counts = {}
+    for kind, queryset in (('review', Review.objects.only('review_content')),
+                           ('movie', Movie.objects.only('title', 'description'))):
+        last_pk, counts[kind] = 0, 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not chunk:
+                break
+            index_objects(kind, chunk)
+            last_pk, counts[kind] = chunk[-1].pk, counts[kind] + len(chunk)
+    return counts
+
+
+# Querying
+
+def encode_cursor(score, object_id):
+    payload = json.dumps([score, object_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Raises ValueError for anything that is not a cursor this module produced
+    score, object_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    return float(score), int(object_id)
+
+
+def search(kind, query, limit=20, after=None):
+    # Returns up to `limit` (object_id, score) pairs, best first, starting after the
+    # (score, object_id) position `after`. Ties on score are broken by ascending id.
+    if backend() == 'fulltext':
+        ranked = _fulltext(kind, query)
+    else:
+        ranked = _bm25(kind, query)
+    if ranked is None:
+        return []
+    if after is not None:
+        score, object_id = after
+        ranked = ranked.filter(Q(score__lt=score) | Q(score=score, object_id__gt=object_id))
+    return [(row['object_id'], row['score']) for row in ranked.order_by('-score', 'object_id')[:limit]]
+
+
+def _bm25(kind, query):
+    terms = set(tokenize(query))
+    if not terms:
+        return None
+    stats = SearchStats.objects.filter(kind=kind).first()
+    frequencies = dict(SearchTerm.objects.filter(kind=kind, term__in=terms, document_frequency__gt=0)
+                       .values_list('term', 'document_frequency'))
+    if stats is None or not stats.document_count or not frequencies:
+        return None
+
+    total = stats.document_count
+    average_length = stats.total_length / total
+    idf = Case(
+        *[When(term=term, then=Value(math.log((total - df + 0.5) / (df + 0.5) + 1)))
+          for term, df in frequencies.items()],
+        default=Value(0.0), output_field=FloatField(),
+    )
+    tf = Cast('term_frequency', FloatField())
+    length_norm = Value(K1 * (1 - B)) + Value(K1 * B / average_length) * Cast('document_length', FloatField())
+    return (SearchPosting.objects.filter(kind=kind, term__in=frequencies)
+            .values('object_id')
+            .annotate(score=Sum(idf * tf * Value(K1 + 1) / (tf + length_norm), output_field=FloatField())))
+
+
+def _fulltext(kind, query):
+    if not query.strip():
+        return None
+    if kind == 'review':
+        model, columns = Review, 'review_content'
+    else:
+        model, columns = Movie, 'title, description'
+    match = RawSQL(f'MATCH({columns}) AGAINST (%s IN NATURAL LANGUAGE MODE)', [query], output_field=FloatField())
+    return model.objects.annotate(score=match, object_id=F('pk')).filter(score__gt=0).values('object_id', 'score')
@@ -1,34 +1,229 @@
-from rest_framework import serializers
+import functools
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
-from .models import Review, Movie, Comment
+from django.db import models, transaction
+from django.urls import reverse
+from django.utils import timezone
+from . import moderation, ratings, threads, titles
+from .metrics import TimedSerializerMixin
+from .models import Review, Movie, Comment, MovieRating, Notification, SimilarMovie, TrendingScore
+
+
+def parse_fields(params):
+    # ?fields=id,title -> ('id', 'title'); None when absent
+    fields = params.get('fields')
+    return tuple(sorted({name.strip() for name in fields.split(',') if name.strip()})) if fields else None
+
+
+# Sparse fieldsets: a top-level serializer only renders (and computes) the fields named by
+# context['fields'] or, for reads, by the request's ?fields=. Nested serializers are left whole.
+class SparseFieldsetMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None:
+            return fields
+        wanted = self.context.get('fields')
+        request = self.context.get('request')
+        if wanted is None and request is not None and request.method == 'GET':
+            wanted = parse_fields(request.query_params)
+        if wanted:
+            fields = {name: field for name, field in fields.items() if name in wanted}
+        return fields
+
+
+# Fast list reads: a listing whose queryset yields .values() rows (see values_columns) is rendered
+# by looking each field's column up in the row, with no model instances and no per-row field
+# lookup. Columns that are already JSON-ready (text, integers, foreign key ids) are copied as they
+# are; the rest go through their field's to_representation, or an equivalent that does its set-up
+# once per listing. Model instances take the normal path.
+class ValuesListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    copied = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+              serializers.PrimaryKeyRelatedField)
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if not rows or not isinstance(rows[0], dict):
+            return super().to_representation(rows)
+        plan = [(field.field_name, '__'.join(field.source_attrs), self.converter(field))
+                for field in self.child._readable_fields]
+        results = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            results.append(item)
+        return results
+
+    def converter(self, field):
+        # None when the column value is already what the field renders
+        if isinstance(field, self.copied):
+            return None
+        if isinstance(field, serializers.DateTimeField):
+            return datetime_converter(field)
+        return field.to_representation
+
+
+def datetime_converter(field):
+    # DateTimeField.to_representation for ISO 8601 output, with the time zone looked up once
+    # rather than for every row
+    zone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if zone is None or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        text = (value.astimezone(zone) if timezone.is_aware(value) else field.enforce_timezone(value)).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+@functools.cache
+def values_columns(serializer_class):
+    # The .values() columns a ValuesListSerializer listing of serializer_class reads
+    return tuple('__'.join(field.source_attrs) for field in serializer_class().fields.values()
+                 if not field.write_only)
 
 
 # Serializer for handling review data
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)  # #Read-only field to display the username of the review's author
+    movie_title = serializers.CharField(source='movie.title', max_length=255)  # Resolved to the Movie foreign key on write
 
     class Meta:
         model = Review
-        fields = ['id', 'movie_title', 'rating', 'review_content', 'created_date', 'username']
+        fields = ['id', 'movie_title', 'rating', 'review_content', 'created_date', 'username', 'like_count']
+        read_only_fields = ['like_count']  # Maintained by the like/unlike endpoints
+        list_serializer_class = ValuesListSerializer
+
+    def validate_rating(self, value):
+        if value not in ratings.RATING_CHOICES:
+            raise serializers.ValidationError('Rating must be between 1 and 5.')
+        return value
+
+    def _resolve_movie(self, validated_data):
+        # Replaces the nested {'title': ...} written through movie_title with the Movie it names,
+        # matching titles case- and whitespace-insensitively (see titles.py). Called outside the
+        # write's transaction so the titles index can load.
+        movie = validated_data.pop('movie', None)
+        if movie is not None:
+            validated_data['movie'] = titles.resolve(movie['title'])
+        return validated_data
 
     def create(self, validated_data):
         # Automatically associates the review with the current user from the request context
         user = self.context['request'].user
-        return Review.objects.create(user=user, **validated_data)
+        validated_data = self._resolve_movie(validated_data)
+        with transaction.atomic():
+            review = Review.objects.create(user=user, **validated_data)
+            ratings.review_added(review)
+        return review
+
+    def update(self, instance, validated_data):
+        # Moves the review's contribution between aggregates if its movie or rating changed
+        old_movie_id, old_rating = instance.movie_id, instance.rating
+        validated_data = self._resolve_movie(validated_data)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            # Saves only the edited columns, so a concurrent like_count update is not overwritten
+            instance.save(update_fields=list(validated_data))
+            if not instance.is_hidden:
+                ratings.review_changed(old_movie_id, old_rating, instance)
+        return instance
+
+
+# Serializer for the precomputed rating aggregate of a movie
+class MovieRatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    average_rating = serializers.FloatField(source='average', read_only=True)
+    rating_distribution = serializers.DictField(source='distribution', read_only=True)
+
+    class Meta:
+        model = MovieRating
+        fields = ['review_count', 'average_rating', 'rating_distribution', 'last_review_at']
 
 
 # Serializer for handling movie data
-class MovieSerializer(serializers.ModelSerializer):
-    # Nested serialization to include related reviews for a movie
-    reviews = ReviewSerializer(many=True, read_only=True)
+class MovieSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    # Nested serialization to include related reviews for a movie (the detail view embeds only the
+    # newest few; reviews_url pages through the rest)
+    reviews = serializers.SerializerMethodField()
+    reviews_url = serializers.SerializerMethodField()
+    similar_url = serializers.SerializerMethodField()
+    rating = MovieRatingSerializer(read_only=True, allow_null=True)  # Aggregate is null until the movie is reviewed
 
     class Meta:
         model = Movie
-        fields = ['id', 'title', 'description', 'release_date', 'reviews']  # Includes reviews for better context
+        fields = ['id', 'title', 'description', 'release_date', 'view_count', 'rating', 'reviews', 'reviews_url',
+                  'similar_url']
+        read_only_fields = ['view_count']
+
+    def validate_title(self, value):
+        # A title differing from an existing one only in case or spacing names that movie
+        existing = titles.lookup(value)
+        if existing is not None and (self.instance is None or existing[0] != self.instance.pk):
+            raise serializers.ValidationError('A movie with this title already exists.')
+        return titles.clean_title(value)
+
+    def get_reviews(self, movie):
+        # The detail view prefetches a capped list into newest_reviews
+        reviews = getattr(movie, 'newest_reviews', None)
+        return ReviewSerializer(movie.reviews.all() if reviews is None else reviews, many=True).data
+
+    def get_reviews_url(self, movie):
+        return f"{reverse('review_list_create')}?movie={movie.pk}"
+
+    def get_similar_url(self, movie):
+        return reverse('similar_movies', args=[movie.pk])
+
+
+# A catalog row for the bulk movie upsert: the title plus whichever details are given
+class MovieUpsertSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True)
+    release_date = serializers.DateField(required=False)
+
+
+# Compact movie representation for search results and other movie listings
+class MovieSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Movie
+        fields = ['id', 'title', 'release_date']
+
+
+# Leaderboard entries: the movie plus the score it is ranked by
+class TopRatedSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    movie = MovieSummarySerializer(read_only=True)
+    score = serializers.FloatField(source='bayesian_score', read_only=True)
+    average_rating = serializers.FloatField(source='average', read_only=True)
+
+    class Meta:
+        model = MovieRating
+        fields = ['movie', 'score', 'average_rating', 'review_count']
+
+
+class TrendingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    movie = MovieSummarySerializer(read_only=True)
+
+    class Meta:
+        model = TrendingScore
+        fields = ['movie', 'score']
+
+
+# A precomputed neighbour of a movie (see similarity.py)
+class SimilarMovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    movie = MovieSummarySerializer(source='similar', read_only=True)
+
+    class Meta:
+        model = SimilarMovie
+        fields = ['movie', 'score']
 
 
 # Serializer for handling user registration
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # The password field is write-only to prevent it from being exposed in API responses
     class Meta:
         model = User
@@ -41,9 +236,61 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 # Serializer for handling comment data
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)  # Displays the username of the comment's author
+    # The comment replied to; set on creation only, the review comes from the URL
+    parent = serializers.PrimaryKeyRelatedField(queryset=Comment.objects.only('review_id', 'path', 'depth'),
+                                                required=False, allow_null=True)
 
     class Meta:
         model = Comment
-        fields = ['id', 'review', 'username', 'content', 'created_at']  # Includes associated review, author, and content details
+        fields = ['id', 'review', 'parent', 'username', 'content', 'created_at', 'depth',
+                  'reply_count']  # Includes associated review, author, and content details
+        read_only_fields = ['review', 'depth', 'reply_count']
+        list_serializer_class = ValuesListSerializer
+
+    def create(self, validated_data):
+        return threads.add_comment(validated_data['review_id'], validated_data['user'], validated_data['content'],
+                                   validated_data.get('parent'))
+
+    def update(self, instance, validated_data):
+        # A comment cannot be moved to another thread
+        validated_data.pop('parent', None)
+        instance.content = validated_data.get('content', instance.content)
+        instance.save(update_fields=['content'])
+        return instance
+
+
+# Serializer for a user's notifications; the actor's name comes from a select_related join
+class NotificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    actor = serializers.CharField(source='actor.username', read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'verb', 'actor', 'review', 'created_at']
+
+
+# Serializer for a bulk moderation request: an action plus ids and/or filters selecting the rows
+class ModerationSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=moderation.ACTIONS)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    movie = serializers.IntegerField(required=False)
+    movie_title = serializers.CharField(required=False)
+    username = serializers.CharField(required=False)
+    review = serializers.IntegerField(required=False)  # Comments only
+    rating = serializers.IntegerField(required=False, min_value=1, max_value=5)  # Reviews only
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    contains = serializers.CharField(required=False)
+    chunk_size = serializers.IntegerField(required=False, default=500, min_value=1, max_value=5000)
+
+    def validate(self, attrs):
+        kind = self.context['kind']
+        if kind == 'review' and 'review' in attrs:
+            raise serializers.ValidationError({'review': ['Only applies to comments.']})
+        if kind == 'comment' and 'rating' in attrs:
+            raise serializers.ValidationError({'rating': ['Only applies to reviews.']})
+        # Refuse to act on a whole table by accident
+        if not set(attrs) - {'action', 'chunk_size'}:
+            raise serializers.ValidationError('Select rows with ids or at least one filter.')
+        return attrs
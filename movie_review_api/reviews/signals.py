@@ -0,0 +1,120 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import authentication, cache, jobs, leaderboards, search, titles
+from .models import Comment, Like, Movie, Review
+
+
+# Cache invalidation driven by model writes
+# Bulk paths that skip signals (bulk_create, queryset.update) bump the versions themselves.
+# Slower derived work (feeds, trending, search, notifications) is queued as jobs (see jobs.py).
+
+@receiver([post_save, post_delete], sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    # ('movies',) covers the movie title embedded in every single-review response
+    cache.bump_on_commit(('movie', instance.pk), ('movies',), ('reviews',))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_movie(sender, instance, update_fields=None, **kwargs):
+    # A review moved to another movie must also invalidate the movie it left
+    if instance.pk and (update_fields is None or 'movie' in update_fields):
+        instance._previous_movie_id = (Review.objects.filter(pk=instance.pk)
+                                       .values_list('movie_id', flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    namespaces = [('movie', instance.movie_id), ('review', instance.pk), ('reviews',)]
+    previous_movie_id = getattr(instance, '_previous_movie_id', None)
+    if previous_movie_id and previous_movie_id != instance.movie_id:
+        namespaces.append(('movie', previous_movie_id))
+    cache.bump_on_commit(*namespaces)
+
+
+@receiver([post_save, post_delete], sender=Like)
+def like_changed(sender, instance, created=False, **kwargs):
+    # like_count is part of the review in every listing and in its movie's detail
+    movie_id = Review.objects.filter(pk=instance.review_id).values_list('movie_id', flat=True).first()
+    cache.bump_on_commit(('movie', movie_id), ('review', instance.review_id), ('reviews',))
+    if created and movie_id:
+        jobs.enqueue('trending.activity', {'movie': movie_id, 'weight': leaderboards.config('LIKE_WEIGHT'),
+                                           'at': timezone.now().isoformat()})
+        jobs.enqueue('feeds.follow', {'user': instance.user_id, 'movie': movie_id})
+        jobs.enqueue('notifications.like', {'user': instance.user_id, 'review': instance.review_id})
+
+
+@receiver(post_save, sender=Review)
+def review_activity(sender, instance, created, **kwargs):
+    # New reviews count towards trending; edits and deletions leave past activity as it was
+    if created:
+        jobs.enqueue('trending.activity', {'movie': instance.movie_id, 'weight': leaderboards.config('REVIEW_WEIGHT'),
+                                           'at': instance.created_date.isoformat()})
+        jobs.enqueue('feeds.fanout', {'review': instance.pk})
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, created=False, **kwargs):
+    cache.bump_on_commit(('review', instance.review_id), ('comments', instance.review_id))
+    if created:
+        jobs.enqueue('notifications.comment', {'comment': instance.pk})
+
+
+# Search index maintenance (only needed when search is not served by MySQL FULLTEXT)
+
+@receiver(post_save, sender=Review)
+def index_review(sender, instance, update_fields=None, **kwargs):
+    if search.backend() == 'index' and (update_fields is None or 'review_content' in update_fields):
+        jobs.enqueue('search.index', {'kind': 'review', 'id': instance.pk})
+
+
+@receiver(post_save, sender=Movie)
+def index_movie(sender, instance, **kwargs):
+    if search.backend() == 'index':
+        jobs.enqueue('search.index', {'kind': 'movie', 'id': instance.pk})
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Movie)
+def unindex_document(sender, instance, **kwargs):
+    if search.backend() == 'index':
+        jobs.enqueue('search.index', {'kind': 'review' if sender is Review else 'movie', 'id': instance.pk})
+
+
+# Movie title index maintenance (see titles.py)
+
+@receiver(pre_save, sender=Movie)
+def remember_movie_title(sender, instance, update_fields=None, **kwargs):
+    # A renamed movie invalidates every process's title index
+    if instance.pk and (update_fields is None or 'title' in update_fields):
+        instance._previous_title = Movie.objects.filter(pk=instance.pk).values_list('title', flat=True).first()
+
+
+@receiver(post_save, sender=Movie)
+def movie_title_saved(sender, instance, created, **kwargs):
+    if created:
+        titles.added(instance)
+    elif getattr(instance, '_previous_title', instance.title) != instance.title:
+        titles.changed()
+
+
+@receiver(post_delete, sender=Movie)
+def movie_title_deleted(sender, instance, **kwargs):
+    titles.changed()
+
+
+# Token authentication cache invalidation
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    authentication.forget(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Covers deactivation; saves that only touch other columns (last_login on every login) skip it
+    if not created and (update_fields is None or 'is_active' in update_fields):
+        authentication.forget(*Token.objects.filter(user=instance).values_list('key', flat=True))
@@ -0,0 +1,221 @@
+import heapq
+import math
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from . import cache
+from .models import Review, SimilarMovie, SimilarityState
+
+try:  # Optional: the vectorized engine
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# "Users who liked this also liked": item-item cosine similarity over positive reviews
+#
+# A review rated LIKED_RATING or better is an entry in the user x movie matrix, weighted by how far
+# above the threshold it is (4 stars -> 1, 5 stars -> 2). Two movies' similarity is the cosine of
+# their columns, counted only when at least MIN_CORATERS users liked both. Each movie keeps its
+# TOP_K most similar movies in SimilarMovie, ranked, so a read is one index range scan.
+#
+# build() recomputes every list offline; the matrix is loaded in primary-key chunks and, with
+# NumPy/SciPy installed, multiplied as sparse arrays a block of movies at a time (a pure-Python
+# engine gives the same result without them, much more slowly). update() recomputes only the
+# movies reviewed since the last run, from the ratings of the users who reviewed them, and patches
+# those movies into their neighbours' lists. Edits and deletions are picked up by the next build().
+
+DEFAULTS = {
+    'TOP_K': 20,
+    'LIKED_RATING': 4,
+    'MIN_CORATERS': 2,
+    'CHUNK_SIZE': 50000,  # Reviews loaded per query
+    'BLOCK_SIZE': 1024,  # Movies whose similarities are computed per sparse product
+}
+
+STATE_NAME = 'default'
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_SIMILARITY', {}).get(name, DEFAULTS[name])
+
+
+def engine():
+    return 'numpy' if np is not None else 'python'
+
+
+def _liked():
+    return Review.objects.filter(is_hidden=False, rating__gte=config('LIKED_RATING'))
+
+
+def _weight():
+    return F('rating') - (config('LIKED_RATING') - 1)
+
+
+def _load(queryset):
+    # (user ids, movie ids, weights) as flat arrays, read in primary-key chunks
+    users, movies, weights = array('q'), array('q'), array('d')
+    last_pk, chunk_size = 0, config('CHUNK_SIZE')
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'user_id', 'movie_id', 'rating')[:chunk_size])
+        if not rows:
+            return users, movies, weights
+        for _, user_id, movie_id, rating in rows:
+            users.append(user_id)
+            movies.append(movie_id)
+            weights.append(rating - config('LIKED_RATING') + 1)
+        last_pk = rows[-1][0]
+
+
+def _norms(last_review_id):
+    # Each movie's column length over every user, from one aggregate query
+    weight = _weight()
+    return {movie_id: math.sqrt(total) for movie_id, total in
+            _liked().filter(pk__lte=last_review_id).values('movie_id').annotate(total=Sum(weight * weight))
+            .values_list('movie_id', 'total')}
+
+
+def _neighbours(targets, entries, norms, top_k):
+    # {movie id: [(similar id, score)] best first} for each target movie, from the loaded entries;
+    # top_k None keeps every qualifying neighbour
+    compute = _neighbours_numpy if np is not None else _neighbours_python
+    return compute(targets, entries, norms, top_k, config('MIN_CORATERS'))
+
+
+def _neighbours_numpy(targets, entries, norms, top_k, min_coraters):
+    users, movies, weights = (np.frombuffer(values, dtype=dtype) if len(values) else np.empty(0, dtype)
+                              for values, dtype in zip(entries, (np.int64, np.int64, np.float64)))
+    movie_ids, columns = np.unique(movies, return_inverse=True)
+    _, rows = np.unique(users, return_inverse=True)
+    shape = (rows.max() + 1 if len(rows) else 0, len(movie_ids))
+    matrix = sparse.csc_matrix((weights, (rows, columns)), shape=shape)
+    liked = sparse.csc_matrix((np.ones_like(weights), (rows, columns)), shape=shape)
+    lengths = np.array([norms.get(movie_id, 0.0) for movie_id in movie_ids.tolist()])
+    target_columns = np.flatnonzero(np.isin(movie_ids, list(targets)))
+
+    result = {}
+    for start in range(0, len(target_columns), config('BLOCK_SIZE')):
+        block = target_columns[start:start + config('BLOCK_SIZE')]
+        dots = (matrix.T @ matrix[:, block]).tocsc()
+        counts = (liked.T @ liked[:, block]).tocsc()
+        dots.sort_indices()
+        counts.sort_indices()
+        for offset, column in enumerate(block.tolist()):
+            begin, end = dots.indptr[offset], dots.indptr[offset + 1]
+            others, scores = dots.indices[begin:end], dots.data[begin:end]
+            keep = (others != column) & (counts.data[counts.indptr[offset]:counts.indptr[offset + 1]] >= min_coraters)
+            others, scores = others[keep], scores[keep] / (lengths[others[keep]] * lengths[column])
+            if top_k is not None and len(scores) > top_k:
+                # Everything scoring at least the k-th best, so ties are settled by id as below
+                best = scores >= -np.partition(-scores, top_k - 1)[top_k - 1]
+                others, scores = others[best], scores[best]
+            order = np.lexsort((movie_ids[others], -scores))[:top_k]
+            result[int(movie_ids[column])] = [(int(movie_ids[others[i]]), float(scores[i])) for i in order]
+    return result
+
+
+def _neighbours_python(targets, entries, norms, top_k, min_coraters):
+    by_movie, by_user = defaultdict(list), defaultdict(list)
+    for user_id, movie_id, weight in zip(*entries):
+        by_movie[movie_id].append((user_id, weight))
+        by_user[user_id].append((movie_id, weight))
+    result = {}
+    for movie_id in targets:
+        if movie_id not in by_movie:
+            continue
+        dots, counts = defaultdict(float), defaultdict(int)
+        for user_id, weight in by_movie[movie_id]:
+            for other, other_weight in by_user[user_id]:
+                dots[other] += weight * other_weight
+                counts[other] += 1
+        scored = ((other, dot / (norms[other] * norms[movie_id])) for other, dot in dots.items()
+                  if other != movie_id and counts[other] >= min_coraters)
+        ranked = sorted if top_k is None else lambda pairs, key: heapq.nsmallest(top_k, pairs, key=key)
+        result[movie_id] = ranked(scored, key=lambda pair: (-pair[1], pair[0]))
+    return result
+
+
+def _store(neighbours):
+    # Replaces the stored lists of these movies, one transaction per chunk of movies
+    movie_ids = sorted(neighbours)
+    for start in range(0, len(movie_ids), 1000):
+        chunk = movie_ids[start:start + 1000]
+        with transaction.atomic():
+            SimilarMovie.objects.filter(movie_id__in=chunk).delete()
+            SimilarMovie.objects.bulk_create([
+                SimilarMovie(movie_id=movie_id, similar_id=similar_id, rank=rank, score=round(score, 6))
+                for movie_id in chunk for rank, (similar_id, score) in enumerate(neighbours[movie_id], start=1)
+            ], batch_size=5000)
+
+
+def _save_state(last_review_id):
+    SimilarityState.objects.update_or_create(name=STATE_NAME, defaults={'last_review_id': last_review_id,
+                                                                        'built_at': timezone.now()})
+    cache.bump_on_commit(('similar',))
+
+
+def build():
+    # Recomputes every movie's list; returns the number of movies with neighbours
+    last_review_id = Review.objects.aggregate(last=Max('pk'))['last'] or 0
+    entries = _load(_liked().filter(pk__lte=last_review_id))
+    neighbours = _neighbours(set(entries[1]), entries, _norms(last_review_id), config('TOP_K'))
+    stale = set(SimilarMovie.objects.values_list('movie_id', flat=True).distinct()) - neighbours.keys()
+    _store({**dict.fromkeys(stale, []), **neighbours})
+    _save_state(last_review_id)
+    return len(neighbours)
+
+
+def update():
+    # Recomputes the movies reviewed since the last build or update and patches them into their
+    # neighbours' lists; returns the number of movies recomputed
+    state = SimilarityState.objects.filter(name=STATE_NAME).first()
+    if state is None:
+        return build()
+    last_review_id = Review.objects.aggregate(last=Max('pk'))['last'] or 0
+    changed = set(Review.objects.filter(pk__gt=state.last_review_id, pk__lte=last_review_id)
+                  .values_list('movie_id', flat=True))
+    if not changed:
+        return 0
+    raters = _liked().filter(movie_id__in=changed).values('user_id')
+    entries = _load(_liked().filter(user_id__in=raters, pk__lte=last_review_id))
+    # Complete lists, so a neighbour's own top K can take a pair outside this movie's
+    neighbours = _neighbours(changed, entries, _norms(last_review_id), None)
+    for movie_id in changed - neighbours.keys():
+        neighbours[movie_id] = []
+    _store({**_patched(neighbours), **{movie_id: similar[:config('TOP_K')] for movie_id, similar in neighbours.items()}})
+    _save_state(last_review_id)
+    return len(changed)
+
+
+def _patched(neighbours):
+    # The lists of other movies, with the recomputed movies' scores put in, taken out or changed
+    scores = defaultdict(dict)  # other movie -> {recomputed movie: score}
+    for movie_id, similar in neighbours.items():
+        for other, score in similar:
+            scores[other][movie_id] = score
+    affected = (set(scores) | set(SimilarMovie.objects.filter(similar_id__in=list(neighbours))
+                                  .values_list('movie_id', flat=True))) - neighbours.keys()
+    current, ordered = defaultdict(dict), sorted(affected)
+    for start in range(0, len(ordered), 1000):
+        for movie_id, similar_id, score in (SimilarMovie.objects.filter(movie_id__in=ordered[start:start + 1000])
+                                            .values_list('movie_id', 'similar_id', 'score')):
+            current[movie_id][similar_id] = score
+    patched = {}
+    for movie_id in affected:
+        merged = {similar_id: score for similar_id, score in current[movie_id].items() if similar_id not in neighbours}
+        merged.update(scores[movie_id])
+        patched[movie_id] = heapq.nsmallest(config('TOP_K'), merged.items(), key=lambda pair: (-pair[1], pair[0]))
+    return patched
+
+
+def similar(movie_id, limit):
+    # The stored neighbours with their titles: one query
+    return list(SimilarMovie.objects.filter(movie_id=movie_id).select_related('similar')
+                .only('score', 'rank', 'similar__id', 'similar__title', 'similar__release_date')
+                .order_by('rank')[:limit])
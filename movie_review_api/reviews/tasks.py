@@ -0,0 +1,72 @@
+from django.utils.dateparse import parse_datetime
+
+from . import feeds, jobs, leaderboards, search
+from .models import Comment, Like, Movie, Notification, Review
+
+# Background tasks (see jobs.py)
+#
+# Each task receives the payloads of a batch of jobs of its kind. Payloads carry ids, not rows, so
+# a task reads the current state when it runs: a review deleted in the meantime is not fanned out,
+# a like undone before its notification was sent sends none.
+
+
+@jobs.task('feeds.fanout', dedup=lambda payload: payload['review'])
+def fan_out_reviews(payloads):
+    feeds.reviews_added(Review.objects.filter(pk__in=[payload['review'] for payload in payloads])
+                        .only('pk', 'user_id', 'movie_id', 'created_date', 'is_hidden'))
+
+
+@jobs.task('feeds.follow', dedup=lambda payload: f"{payload['user']}:{payload['movie']}")
+def follow_movies(payloads):
+    feeds.follow((payload['user'], payload['movie']) for payload in payloads)
+
+
+@jobs.task('search.index', dedup=lambda payload: f"{payload['kind']}:{payload['id']}")
+def index_documents(payloads):
+    # Indexes each document as it is now, or removes it if it no longer exists
+    for kind, model, fields in (('review', Review, ('review_content',)), ('movie', Movie, ('title', 'description'))):
+        ids = {payload['id'] for payload in payloads if payload['kind'] == kind}
+        objects = model.objects.only(*fields).in_bulk(ids)
+        for object_id in sorted(ids):
+            if object_id in objects:
+                search.index_document(kind, object_id, search.document_text(kind, objects[object_id]))
+            else:
+                search.remove_document(kind, object_id)
+
+
+@jobs.task('trending.activity')
+def record_activity(payloads):
+    leaderboards.record_activities((payload['movie'], payload['weight'], parse_datetime(payload['at']))
+                                   for payload in payloads)
+
+
+@jobs.task('notifications.like', dedup=lambda payload: f"{payload['user']}:{payload['review']}")
+def notify_likes(payloads):
+    pairs = {(payload['user'], payload['review']) for payload in payloads}
+    review_ids = {review_id for _, review_id in pairs}
+    still_liked = set(Like.objects.filter(review_id__in=review_ids, user_id__in={user_id for user_id, _ in pairs})
+                      .values_list('user_id', 'review_id')) & pairs
+    authors = dict(Review.objects.filter(pk__in=review_ids).values_list('pk', 'user_id'))
+    Notification.objects.bulk_create([
+        Notification(user_id=authors[review_id], actor_id=user_id, verb='like', review_id=review_id)
+        for user_id, review_id in sorted(still_liked) if authors.get(review_id, user_id) != user_id
+    ])
+
+
+@jobs.task('notifications.comment', dedup=lambda payload: payload['comment'])
+def notify_comments(payloads):
+    # The review's author hears of every comment and a comment's author of replies to it; no one
+    # hears of their own, or twice of the same one
+    comments = (Comment.objects.filter(pk__in=[payload['comment'] for payload in payloads], is_hidden=False)
+                .select_related('review', 'parent').only('user_id', 'review_id', 'review__user_id', 'parent__user_id')
+                .order_by('pk'))
+    notifications = []
+    for comment in comments:
+        parent_author = comment.parent.user_id if comment.parent_id else None
+        if parent_author is not None and parent_author != comment.user_id:
+            notifications.append(Notification(user_id=parent_author, actor_id=comment.user_id, verb='reply',
+                                              review_id=comment.review_id))
+        if comment.review.user_id not in (comment.user_id, parent_author):
+            notifications.append(Notification(user_id=comment.review.user_id, actor_id=comment.user_id,
+                                              verb='comment', review_id=comment.review_id))
+    Notification.objects.bulk_create(notifications)
@@ -1,3 +1,1482 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache as django_cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import authentication, benchmark, cache, compression, jobs, leaderboards, metrics, moderation, ratings, \
+    renderers, search, similarity, threads, throttling, titles, writebehind
+from .models import Comment, FeedEntry, Job, Like, Movie, MovieFollow, MovieRating, Notification, Review, SimilarMovie, \
+    raw_delete
+from .importers import ReviewImporter
+from .serializers import CommentSerializer, ReviewSerializer
+
+# Settings the whole module runs under, whatever runner or settings module started it: jobs run
+# in-process as soon as they are queued, and request metrics are off, as their slow-request and
+# N+1 warnings would bury the output. Test cases that need otherwise override them.
+test_settings = override_settings(REVIEWS_JOBS={'EAGER': True}, REVIEWS_METRICS={'ENABLED': False})
+
+
+def setUpModule():
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+
+
+# Query budgets per endpoint
+# Each listing must cost the same number of queries for one row as for a full page,
+# so adding a per-row relation lookup to a serializer fails here. The response cache is
+# off so the budgets cover the full path.
+@override_settings(REVIEWS_CACHE={'ENABLED': False})
+class QueryBudgetTests(APITestCase):
+    rows = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        authors = [User.objects.create_user(f'author{i}', password='pass12345') for i in range(3)]
+        cls.movie = Movie.objects.create(title='The Lion King')
+        cls.other_movie = Movie.objects.create(title='Up')
+        reviews = [
+            Review.objects.create(movie=cls.movie if i % 2 else cls.other_movie, user=authors[i % 3],
+                                  rating=i % 5 + 1, review_content=f'Review {i}')
+            for i in range(cls.rows)
+        ]
+        Review.objects.create(movie=cls.movie, user=cls.user, rating=4, review_content='Mine')
+        cls.review = reviews[1]
+        for i in range(cls.rows):
+            Comment.objects.create(review=cls.review, user=authors[i % 3], content=f'Comment {i}')
+        cls.comment = Comment.objects.first()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assert_budget(self, url, budget):
+        # Same budget for a one-row page and a large page
+        for page_size in (1, self.rows):
+            separator = '&' if '?' in url else '?'
+            with self.assertNumQueries(budget):
+                response = self.client.get(f'{url}{separator}page_size={page_size}')
+            self.assertEqual(response.status_code, 200)
+
+    def test_review_list(self):
+        # COUNT(*) + page
+        self.assert_budget(reverse('review_list_create'), 2)
+
+    def test_review_list_keyset(self):
+        self.assert_budget(reverse('review_list_create') + '?pagination=keyset', 1)
+
+    def test_review_list_filtered_by_movie(self):
+        # COUNT(*) + page + the movie's rating aggregate
+        self.assert_budget(reverse('review_list_create') + '?movie_title=The+Lion+King', 3)
+
+    def test_user_reviews(self):
+        self.assert_budget(reverse('user_reviews'), 2)
+
+    def test_review_detail(self):
+        self.assert_budget(reverse('review_detail', args=[self.review.pk]), 1)
+
+    def test_movie_detail(self):
+        # Movie with its aggregate + prefetched reviews with their authors
+        # (the API and HTML routes share the name movie_detail, so the API path is spelled out)
+        self.assert_budget(f'/api/movies/{self.movie.pk}/', 2)
+
+    def test_movie_detail_page(self):
+        self.assert_budget(f'/api/movie/{self.movie.pk}/', 2)
+
+    def test_comment_list(self):
+        self.assert_budget(reverse('comment_list', args=[self.review.pk]), 2)
+
+    def test_comment_detail(self):
+        self.assert_budget(reverse('comment_detail', args=[self.comment.pk]), 1)
+
+
+# Keyset pagination: ?pagination=keyset (or a cursor) pages on (created, id) without counting
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.client.force_authenticate(self.user)
+        movie = Movie.objects.create(title='Jaws')
+        self.reviews = [Review.objects.create(movie=movie, user=self.user, rating=4, review_content=str(i))
+                        for i in range(7)]
+        self.comments = [Comment.objects.create(review=self.reviews[0], user=self.user, content=str(i))
+                         for i in range(7)]
+        # Ties on the timestamp are broken by id
+        tied = timezone.now() - timedelta(days=1)
+        Review.objects.filter(pk__in=[review.pk for review in self.reviews[2:6]]).update(created_date=tied)
+        Comment.objects.filter(pk__in=[comment.pk for comment in self.comments[1:5]]).update(created_at=tied)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            data = self.client.get(url).data
+            self.assertNotIn('count', data)
+            ids += [row['id'] for row in data['results']]
+            url, pages = data['next'], pages + 1
+        return ids, pages
+
+    def test_cursors_walk_every_listing_once_in_order(self):
+        reviews = [review.pk for review in Review.objects.order_by('-created_date', '-id')]
+        comments = [comment.pk for comment in Comment.objects.order_by('-created_at', '-id')]
+        for url, expected in ((reverse('review_list_create'), reviews), (reverse('user_reviews'), reviews),
+                              (reverse('comment_list', args=[self.reviews[0].pk]), comments)):
+            self.assertEqual(self.walk(url + '?pagination=keyset&page_size=3'), (expected, 3))
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('bogus', 'WzEsMl0', ''):
+            response = self.client.get(reverse('review_list_create'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404 if cursor else 200)
+        self.assertEqual(self.client.get(reverse('user_reviews'), {'cursor': 'bogus'}).status_code, 404)
+
+
+# Rating aggregates: every review write moves MovieRating in step, and rebuild() agrees with it
+class MovieRatingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('critic', password='pass12345')
+        self.jaws = Movie.objects.create(title='Jaws')
+        self.client.force_authenticate(self.user)
+
+    def review(self, title, rating):
+        response = self.client.post(reverse('review_list_create'),
+                                    {'movie_title': title, 'rating': rating, 'review_content': 'Seen it'})
+        return response.data['id']
+
+    def aggregate(self, title):
+        rating = MovieRating.objects.get(movie__title=title)
+        return rating.review_count, rating.rating_sum, [count for _, count in sorted(rating.distribution.items())]
+
+    def test_writes_keep_the_aggregate_in_step(self):
+        first, second = self.review('Jaws', 5), self.review('Jaws', 3)
+        self.assertEqual(self.aggregate('Jaws'), (2, 8, [0, 0, 1, 0, 1]))
+        self.assertEqual(MovieRating.objects.get(movie=self.jaws).average, 4)
+
+        self.client.patch(reverse('review_detail', args=[second]), {'rating': 1})
+        self.assertEqual(self.aggregate('Jaws'), (2, 6, [1, 0, 0, 0, 1]))
+        self.client.patch(reverse('review_detail', args=[second]), {'movie_title': 'Heat'})
+        self.assertEqual(self.aggregate('Jaws'), (1, 5, [0, 0, 0, 0, 1]))
+        self.assertEqual(self.aggregate('Heat'), (1, 1, [1, 0, 0, 0, 0]))
+
+        self.assertEqual(self.client.delete(reverse('review_detail', args=[first])).status_code, 204)
+        self.assertEqual(self.aggregate('Jaws'), (0, 0, [0, 0, 0, 0, 0]))
+        self.assertIsNone(MovieRating.objects.get(movie=self.jaws).last_review_at)
+        list(moderation.run('review', 'hide', Review.objects.filter(pk=second)))
+        self.assertEqual(self.aggregate('Heat'), (0, 0, [0, 0, 0, 0, 0]))
+        list(moderation.run('review', 'unhide', Review.objects.filter(pk=second)))
+        self.assertEqual(self.aggregate('Heat'), (1, 1, [1, 0, 0, 0, 0]))
+
+    def test_rebuild_matches_the_incremental_aggregate(self):
+        for title, rating in (('Jaws', 5), ('Jaws', 2), ('Heat', 4)):
+            self.review(title, rating)
+        incremental = {title: self.aggregate(title) for title in ('Jaws', 'Heat')}
+        self.assertEqual(ratings.rebuild(), 2)
+        self.assertEqual({title: self.aggregate(title) for title in ('Jaws', 'Heat')}, incremental)
+        self.assertEqual(MovieRating.objects.get(movie=self.jaws).last_review_at,
+                         self.jaws.reviews.latest('created_date').created_date)
+
+
+# Data migrations, run against the historical models they were written for
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connections['default'])
+        executor.loader.build_graph()
+        executor.migrate([('reviews', target)])
+        return executor.loader.project_state([('reviews', target)]).apps
+
+    def setUp(self):
+        self.addCleanup(call_command, 'migrate', 'reviews', verbosity=0)
+
+
+class SeedMovieRatingsMigrationTests(MigrationTestCase):
+    def test_reviews_written_before_the_aggregate_are_counted(self):
+        apps = self.migrate('0020_backfill_normalized_titles')
+        user = apps.get_model('auth', 'User').objects.create(username='critic')
+        movie = apps.get_model('reviews', 'Movie').objects.create(title='Jaws')
+        Review = apps.get_model('reviews', 'Review')
+        for rating, hidden in ((5, False), (4, False), (1, True)):
+            Review.objects.create(movie=movie, user=user, rating=rating, review_content='Seen it', is_hidden=hidden)
+
+        apps = self.migrate('0021_seed_movie_ratings')
+        rating = apps.get_model('reviews', 'MovieRating').objects.get(movie_id=movie.pk)
+        self.assertEqual((rating.review_count, rating.rating_sum, rating.rating_5, rating.rating_1), (2, 9, 1, 0))
+        self.assertAlmostEqual(rating.bayesian_score, (10 * 4.5 + 9) / 12)
+
+
+class BackfillReviewMovieMigrationTests(MigrationTestCase):
+    def test_free_text_titles_become_movie_links(self):
+        apps = self.migrate('0005_review_movie')
+        user = apps.get_model('auth', 'User').objects.create(username='critic')
+        jaws = apps.get_model('reviews', 'Movie').objects.create(title='Jaws')
+        Review = apps.get_model('reviews', 'Review')
+        for title in ('Jaws', 'Heat', 'Jaws', 'Up', 'Heat'):
+            Review.objects.create(movie_title=title, user=user, rating=4, review_content='Seen it')
+
+        migration = importlib.import_module('reviews.migrations.0006_backfill_review_movie')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            apps = self.migrate('0006_backfill_review_movie')
+        Movie, Review = apps.get_model('reviews', 'Movie'), apps.get_model('reviews', 'Review')
+        self.assertEqual(list(Review.objects.order_by('pk').values_list('movie__title', flat=True)),
+                         ['Jaws', 'Heat', 'Jaws', 'Up', 'Heat'])
+        self.assertEqual(Movie.objects.count(), 3)
+        self.assertEqual(Review.objects.filter(movie_id=jaws.pk).count(), 2)
+
+
+class LikeTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('liker', password='pass12345')
+        author = User.objects.create_user('author', password='pass12345')
+        cls.review = Review.objects.create(movie=Movie.objects.create(title='Up'), user=author,
+                                           rating=5, review_content='Great')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_like_and_unlike_keep_count_in_step(self):
+        like_url = reverse('like_review', args=[self.review.pk])
+        unlike_url = reverse('unlike_review', args=[self.review.pk])
+
+        self.assertEqual(self.client.post(like_url).status_code, 200)
+        self.assertEqual(self.client.post(like_url).status_code, 400)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.like_count, 1)
+        self.assertEqual(self.review.likes.count(), 1)
+
+        self.assertEqual(self.client.post(unlike_url).status_code, 200)
+        self.assertEqual(self.client.post(unlike_url).status_code, 400)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.like_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_missing_review(self):
+        self.assertEqual(self.client.post(reverse('like_review', args=[0])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('unlike_review', args=[0])).status_code, 404)
+
+    def test_like_count_is_serialized(self):
+        self.client.post(reverse('like_review', args=[self.review.pk]))
+        response = self.client.get(reverse('review_detail', args=[self.review.pk]))
+        self.assertEqual(response.data['like_count'], 1)
+
+
+class ReviewImportTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass12345')
+        User.objects.create_user('alice', password='pass12345')
+        Movie.objects.create(title='Up')
+
+    def test_import_jsonl_with_rejections(self):
+        lines = [
+            {'movie_title': 'Up', 'rating': 5, 'review_content': 'Great', 'username': 'alice'},
+            {'movie_title': 'Heat', 'rating': 4, 'review_content': 'Tense'},
+            {'movie_title': 'Heat', 'rating': 9, 'review_content': 'Out of range'},
+            {'movie_title': 'Heat', 'rating': 3, 'review_content': 'Who?', 'username': 'nobody'},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(reverse('review_import') + '?batch_size=2',
+                                    {'file': SimpleUploadedFile('reviews.jsonl', body.encode())})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['rejected']), (2, 3))
+        self.assertEqual(sorted(error['line'] for error in response.data['errors']), [3, 4, 5])
+        heat = Movie.objects.get(title='Heat')
+        self.assertEqual(heat.reviews.get().user, self.admin)
+        self.assertEqual(heat.rating.review_count, 1)
+
+    def test_import_csv_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'reviews.csv')
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['movie_title', 'rating', 'review_content', 'username'])
+            writer.writerows([['Up', 4, 'Lovely', 'alice'], ['Up', 2, 'Sad', 'alice']])
+
+        call_command('import_reviews', path, batch_size=1, stdout=io.StringIO())
+
+        rating = Movie.objects.get(title='Up').rating
+        self.assertEqual((rating.review_count, rating.rating_sum), (2, 6))
+
+    def test_import_without_ids_returned_from_bulk_insert(self):
+        # As on MySQL: bulk_create leaves the reviews' ids unset
+        up = Movie.objects.get(title='Up')
+        alice = User.objects.get(username='alice')
+        MovieFollow.objects.create(user=alice, movie=up)
+        rows = [(1, {'movie_title': 'Up', 'rating': 4, 'review_content': 'Lovely'}),
+                (2, {'movie_title': 'Up', 'rating': 2, 'review_content': 'Sad'})]
+        with mock.patch.object(type(connections['default'].features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            result = ReviewImporter(default_user=self.admin).run(rows)
+
+        self.assertEqual((result.created, result.rejected), (2, 0))
+        self.assertEqual(set(FeedEntry.objects.filter(user=alice).values_list('review_id', flat=True)),
+                         set(up.reviews.values_list('pk', flat=True)))
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(User.objects.get(username='alice'))
+        response = self.client.post(reverse('review_import'), {'file': SimpleUploadedFile('r.jsonl', b'')})
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass12345')
+        cls.movie = Movie.objects.create(title='Up')
+        other = Movie.objects.create(title='Heat')
+        for i in range(5):
+            review = Review.objects.create(movie=cls.movie if i % 2 else other, user=cls.admin,
+                                           rating=3, review_content=f'Review {i}')
+            Comment.objects.create(review=review, user=cls.admin, content=f'Comment {i}')
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_ndjson_reviews_filtered_by_movie(self):
+        response = self.client.get(reverse('export', args=['reviews']) + f'?movie={self.movie.pk}')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['review_content'] for row in rows], ['Review 1', 'Review 3'])
+        self.assertEqual(rows[0]['movie_title'], 'Up')
+
+    def test_csv_comments_in_chunks(self):
+        out = io.StringIO()
+        call_command('export_reviews', kind='comments', format='csv', chunk_size=2, stdout=out)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1]['content'], 'Comment 4')
+
+    def test_invalid_date_range(self):
+        response = self.client.get(reverse('export', args=['reviews']) + '?since=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.movie = Movie.objects.create(title='Up')
+        cls.review = Review.objects.create(movie=cls.movie, user=cls.user, rating=4, review_content='Fun')
+        ratings.review_added(cls.review)
+
+    def setUp(self):
+        django_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_movie_detail_is_served_from_cache_until_a_review_changes(self):
+        url = f'/api/movies/{self.movie.pk}/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url).data['reviews']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('review_list_create'),
+                             {'movie_title': 'Up', 'rating': 2, 'review_content': 'Meh'})
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['reviews']), 2)
+        self.assertEqual(response.data['rating']['review_count'], 2)
+
+    def test_filtered_listing_is_invalidated_by_likes(self):
+        url = reverse('review_list_create') + '?movie_title=Up'
+        self.client.get(url)
+        with self.assertNumQueries(1):  # Resolving the title to the movie whose version keys the entry
+            self.assertEqual(self.client.get(url).data['results'][0]['like_count'], 0)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('like_review', args=[self.review.pk]))
+        self.assertEqual(self.client.get(url).data['results'][0]['like_count'], 1)
+
+    def test_stats(self):
+        url = f'/api/movies/{self.movie.pk}/'
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='pass12345'))
+        self.assertEqual(self.client.get(reverse('cache_stats')).data, {'hit': 1, 'stale': 0, 'miss': 1})
+
+
+class SearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.jaws = Movie.objects.create(title='Jaws', description='A shark terrorises a beach town.')
+        Movie.objects.create(title='Up', description='An old man flies his house with balloons.')
+        texts = [
+            'The shark is terrifying, a shark movie like no other',
+            'Great soundtrack and a memorable shark',
+            'Balloons and adventure',
+            'Nothing about fish here',
+        ]
+        for text in texts:
+            Review.objects.create(movie=cls.jaws, user=cls.user, rating=4, review_content=text)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_reviews_ranked_and_paginated(self):
+        response = self.client.get(reverse('search') + '?q=shark&page_size=1')
+        first = response.data['results']
+        self.assertEqual(first[0]['review_content'], 'The shark is terrifying, a shark movie like no other')
+
+        second = self.client.get(response.data['next']).data
+        self.assertEqual(second['results'][0]['review_content'], 'Great soundtrack and a memorable shark')
+        self.assertIsNone(second['next'])
+
+    def test_movies(self):
+        results = self.client.get(reverse('search') + '?q=balloons&type=movies').data['results']
+        self.assertEqual([movie['title'] for movie in results], ['Up'])
+
+    def test_index_follows_edits_and_deletes(self):
+        review = Review.objects.get(review_content='Nothing about fish here')
+        review.review_content = 'A shark after all'
+        review.save()
+        self.assertEqual(len(self.client.get(reverse('search') + '?q=shark').data['results']), 3)
+        review.delete()
+        self.assertEqual(len(self.client.get(reverse('search') + '?q=shark').data['results']), 2)
+        self.assertEqual(search.rebuild(), {'review': 3, 'movie': 2})
+        self.assertEqual(len(self.client.get(reverse('search') + '?q=shark').data['results']), 2)
+
+
+class LeaderboardTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.movies = {title: Movie.objects.create(title=title) for title in ('Up', 'Heat', 'Jaws')}
+
+    def setUp(self):
+        django_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def review(self, title, rating):
+        return self.client.post(reverse('review_list_create'),
+                                {'movie_title': title, 'rating': rating, 'review_content': '...'}).data
+
+    def test_top_rated_prefers_many_top_reviews_over_a_single_one(self):
+        self.review('Up', 5)
+        for _ in range(6):
+            self.review('Heat', 5)
+        self.review('Jaws', 1)
+        leaderboards.rebuild()  # Re-reads the global mean, which the first review had set to 5
+
+        with self.assertNumQueries(1):
+            board = self.client.get(reverse('leaderboard', args=['top-rated'])).data
+        self.assertEqual([entry['movie']['title'] for entry in board], ['Heat', 'Up', 'Jaws'])
+
+    def test_trending_counts_recent_activity_and_rebuilds_from_history(self):
+        review = self.review('Jaws', 3)
+        self.review('Up', 3)
+        self.client.force_login(self.user)
+        self.client.post(reverse('like_review', args=[review['id']]))
+
+        board = self.client.get(reverse('leaderboard', args=['trending']) + '?limit=1').data
+        self.assertEqual([entry['movie']['title'] for entry in board], ['Jaws'])
+
+        # An old review no longer counts once the window is recompiled
+        Review.objects.filter(pk=review['id']).update(created_date=timezone.now() - timedelta(days=30))
+        Like.objects.all().delete()
+        leaderboards.rebuild(from_history=True)
+        board = self.client.get(reverse('leaderboard', args=['trending'])).data
+        self.assertEqual([entry['movie']['title'] for entry in board], ['Up'])
+
+
+@override_settings(REVIEWS_CACHE={'ENABLED': False}, REVIEWS_METRICS={'ENABLED': True})
+class MetricsTests(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.force_login(self.admin)
+        movie = Movie.objects.create(title='Jaws')
+        Review.objects.create(movie=movie, user=self.admin, rating=4, review_content='Shark')
+
+    def test_metrics_endpoint_exposes_per_view_histograms(self):
+        self.client.get(reverse('review_list_create'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('reviews_requests_total{view="review_list_create",method="GET",status="200"} 1', body)
+        self.assertIn('reviews_db_queries_count{view="review_list_create"} 1', body)
+        self.assertIn('reviews_serializer_duration_seconds_bucket{view="review_list_create",le="+Inf"} 1', body)
+
+    @override_settings(REVIEWS_METRICS={'SLOW_REQUEST_MS': 0, 'DUPLICATE_QUERY_THRESHOLD': 2})
+    def test_slow_requests_log_normalized_sql_and_repeated_queries(self):
+        with self.assertLogs('reviews.performance', 'WARNING') as logs:
+            for title in ('Up', 'Heat'):
+                self.client.post(reverse('review_list_create'),
+                                 {'movie_title': title, 'rating': 3, 'review_content': '...'})
+        self.assertIn('Slow request POST /api/reviews/', logs.output[0])
+        self.assertIn('"reviews_movie"', logs.output[0])
+        self.assertEqual(metrics.normalize_sql("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x' LIMIT 21"),
+                         'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+
+    @override_settings(REVIEWS_METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get(reverse('review_list_create'))
+        self.assertNotIn('review_list_create', metrics.registry.render())
+
+
+@override_settings(REVIEWS_CACHE={'ENABLED': False})
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.token = Token.objects.create(user=self.user)
+        self.movie = Movie.objects.create(title='Jaws')
+        self.reviews = [Review.objects.create(movie=self.movie, user=self.user, rating=rating, review_content='Shark')
+                        for rating in (1, 2, 3, 4, 5, 5, 4)]
+        ratings.rebuild()
+        Comment.objects.create(review=self.reviews[0], user=self.user, content='Agreed')
+        self.client.force_login(self.user)
+
+    def test_listings_and_detail_match_the_sync_views(self):
+        pairs = [
+            ('/api/reviews/?page=2&rating=5', '/api/async/reviews/?page=2&rating=5'),
+            ('/api/reviews/?movie_title=Jaws&page_size=3', '/api/async/reviews/?movie_title=Jaws&page_size=3'),
+            ('/api/movies/%d/' % self.movie.pk, '/api/async/movies/%d/' % self.movie.pk),
+            ('/api/reviews/%d/comments/' % self.reviews[0].pk, '/api/async/reviews/%d/comments/' % self.reviews[0].pk),
+        ]
+        for sync_url, async_url in pairs:
+            expected, actual = self.client.get(sync_url).json(), self.client.get(async_url).json()
+            for key in ('next', 'previous'):
+                if expected.get(key):
+                    expected[key] = expected[key].replace('/api/', '/api/async/')
+            self.assertEqual(actual, expected, async_url)
+
+    def test_keyset_pages_follow_the_cursor(self):
+        first = self.client.get('/api/async/reviews/?pagination=keyset&page_size=4').json()
+        second = self.client.get(first['next']).json()
+        ids = [review['id'] for review in first['results'] + second['results']]
+        self.assertEqual(ids, [review.pk for review in reversed(self.reviews)])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get('/api/async/reviews/?cursor=bogus').status_code, 404)
+
+    def test_token_authenticated_like_and_unlike(self):
+        self.client.logout()
+        url = '/api/async/reviews/%d/' % self.reviews[0].pk
+        self.assertEqual(self.client.post(url + 'like/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/reviews/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.post(url + 'like/').status_code, 200)
+        self.assertEqual(self.client.post(url + 'like/').status_code, 400)
+        self.assertEqual(Review.objects.get(pk=self.reviews[0].pk).like_count, 1)
+        self.assertEqual(self.client.post(url + 'unlike/').status_code, 200)
+        self.assertEqual(self.client.post('/api/async/reviews/0/like/').status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+
+@override_settings(REVIEWS_THROTTLE={'RATES': {'user': '100/min', 'anon': '100/min', 'like': '2/min',
+                                                 'register': '1/hour'}})
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user(username='fan', password='pass')
+        self.review = Review.objects.create(movie=Movie.objects.create(title='Jaws'), user=self.user, rating=4,
+                                            review_content='Shark')
+        self.client.force_login(self.user)
+
+    def test_scope_bucket_rejects_with_retry_after(self):
+        like, unlike = (reverse(name, args=[self.review.pk]) for name in ('like_review', 'unlike_review'))
+        self.assertEqual(self.client.post(like).status_code, 200)
+        self.assertEqual(self.client.post(unlike).status_code, 200)
+        response = self.client.post(like)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        response = self.client.post(f'/api/async/reviews/{self.review.pk}/like/')
+        self.assertEqual(response.status_code, 429)  # The async route shares the bucket
+
+        self.client.force_login(User.objects.create_user(username='other', password='pass'))
+        self.assertEqual(self.client.post(like).status_code, 200)  # Buckets are per user
+
+    def test_anonymous_clients_are_limited_per_ip(self):
+        self.client.logout()
+        url = reverse('user_register')
+        body = {'username': 'new', 'email': 'new@example.com', 'password': 'pass12345'}
+        self.assertEqual(self.client.post(url, body, REMOTE_ADDR='10.0.0.1').status_code, 201)
+        response = self.client.post(url, {**body, 'username': 'newer'}, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+        self.assertEqual(self.client.post(url, {**body, 'username': 'newest'}, REMOTE_ADDR='10.0.0.2').status_code, 201)
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch('reviews.throttling.time.time', return_value=1000.0) as clock:
+            rate = throttling.parse_rate('3/min')
+            self.assertEqual([throttling.take('test', 'x', rate) for _ in range(4)], [0, 0, 0, 20])
+            clock.return_value = 1020.0  # One token back
+            self.assertEqual([throttling.take('test', 'x', rate) for _ in range(2)], [0, 20])
+            clock.return_value = 1200.0  # Idle: full again, but no more than full
+            self.assertEqual([throttling.take('test', 'x', rate) for _ in range(4)], [0, 0, 0, 20])
+
+
+class TokenAuthTests(APITestCase):
+    def setUp(self):
+        authentication._memory.clear()
+        self.user = User.objects.create_user(username='client', password='pass12345')
+        response = self.client.post(reverse('token'), {'username': 'client', 'password': 'pass12345'})
+        self.key = response.json()['token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.key)
+
+    def auth_queries(self, url='/api/reviews/'):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(url)
+        return response.status_code, [query['sql'] for query in queries
+                                      if 'FROM "authtoken_token"' in query['sql'] or 'FROM "auth_user"' in query['sql']]
+
+    def test_warm_requests_authenticate_without_queries(self):
+        status_code, cold = self.auth_queries()
+        self.assertEqual((status_code, len(cold)), (200, 1))  # One Token -> User join
+        self.assertEqual(self.auth_queries(), (200, []))
+        self.assertEqual(self.auth_queries('/api/async/reviews/'), (200, []))
+
+    @override_settings(REVIEWS_TOKEN_AUTH={'BACKEND': 'cache'})
+    def test_shared_cache_backend(self):
+        django_cache.clear()
+        self.assertEqual(self.auth_queries()[0], 200)
+        self.assertEqual(self.auth_queries(), (200, []))
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(key=self.key).delete()
+        self.assertEqual(self.auth_queries()[0], 401)
+
+    def test_rotated_revoked_and_deactivated_tokens_stop_working(self):
+        self.auth_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            new_key = self.client.put(reverse('token')).json()['token']
+        self.assertEqual(self.auth_queries()[0], 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + new_key)
+        self.assertEqual(self.auth_queries()[0], 200)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.auth_queries()[0], 401)
+        self.assertEqual(self.client.get('/api/async/reviews/').json(), {'detail': 'User inactive or deleted.'})
+
+        self.user.is_active = True
+        self.user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(reverse('token')).status_code, 204)
+        self.assertEqual(self.auth_queries()[0], 401)
+
+    @override_settings(REVIEWS_TOKEN_AUTH={'EXPIRES_AFTER': 3600})
+    def test_tokens_expire(self):
+        self.assertEqual(self.auth_queries()[0], 200)
+        Token.objects.filter(key=self.key).update(created=timezone.now() - timedelta(hours=2))
+        authentication._memory.clear()
+        response = self.client.get('/api/reviews/')
+        self.assertEqual((response.status_code, response.json()), (401, {'detail': 'Token has expired.'}))
+
+        self.client.credentials()
+        body = self.client.post(reverse('token'), {'username': 'client', 'password': 'pass12345'}).json()
+        self.assertNotEqual(body['token'], self.key)
+        self.assertIsNotNone(body['expires'])
+
+
+@override_settings(REVIEWS_CACHE={'ENABLED': False})
+class WriteBehindTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.fan = User.objects.create_user(username='fan', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.movie = Movie.objects.create(title='Jaws')
+        self.review = Review.objects.create(movie=self.movie, user=self.other, rating=4, review_content='Shark')
+        Like.objects.create(user=self.other, review=self.review)
+        Review.objects.filter(pk=self.review.pk).update(like_count=1)
+
+    def like_count_seen_by(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('review_detail', args=[self.review.pk])).data['like_count']
+
+    def check_buffered_likes(self, backend):
+        settings = {'ENABLED': True, 'BACKEND': backend, 'FLUSH_THREAD': False}
+        with override_settings(REVIEWS_WRITE_BEHIND=settings):
+            writebehind.buffer().clear()
+            self.client.force_login(self.fan)
+            like, unlike = (reverse(name, args=[self.review.pk]) for name in ('like_review', 'unlike_review'))
+
+            # Clicks are coalesced and nothing is written until the flush
+            with self.assertNumQueries(3):  # Session, user and the liked-state lookup; nothing is written
+                self.assertEqual(self.client.post(like).status_code, 200)
+            self.assertEqual(self.client.post(like).status_code, 400)
+            self.assertEqual(self.client.post(unlike).status_code, 200)
+            self.assertEqual(self.client.post(like).status_code, 200)
+            self.client.force_login(self.other)
+            self.assertEqual(self.client.post(unlike).status_code, 200)
+            self.assertEqual(Like.objects.count(), 1)
+
+            # Each user sees their own pending clicks on top of the stored count
+            self.assertEqual(self.like_count_seen_by(self.fan), 2)
+            self.assertEqual(self.like_count_seen_by(self.other), 0)
+            self.client.get(f'/api/movies/{self.movie.pk}/')
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(writebehind.flush(), (1, 1, 1))
+            self.assertEqual(list(Like.objects.values_list('user__username', flat=True)), ['fan'])
+            self.assertEqual(Review.objects.get(pk=self.review.pk).like_count, 1)
+            self.assertEqual(Movie.objects.get(pk=self.movie.pk).view_count, 1)
+            self.assertEqual(self.like_count_seen_by(self.fan), 1)
+            self.assertEqual(writebehind.flush(), (0, 0, 0))
+
+    def test_memory_buffer(self):
+        self.check_buffered_likes('memory')
+
+    def test_cache_buffer(self):
+        self.check_buffered_likes('cache')
+
+    @override_settings(REVIEWS_WRITE_BEHIND={'ENABLED': True, 'FLUSH_THREAD': False})
+    def test_failed_flush_keeps_the_batch(self):
+        writebehind.buffer().clear()
+        writebehind.record_like(self.fan.pk, self.review.pk, True)
+        with mock.patch.object(Movie.objects, 'filter', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            writebehind.record_view(self.movie.pk)
+            writebehind.flush()
+        self.assertFalse(Like.objects.filter(user=self.fan).exists())
+        self.assertEqual(writebehind.flush(), (1, 0, 1))
+
+    @override_settings(REVIEWS_WRITE_BEHIND={'ENABLED': True, 'FLUSH_THREAD': False})
+    def test_flush_of_many_pending_pairs(self):
+        writebehind.buffer().clear()
+        User.objects.bulk_create([User(username=f'crowd{i}') for i in range(30)])
+        users = list(User.objects.filter(username__startswith='crowd').values_list('pk', flat=True))
+        Review.objects.bulk_create([Review(movie=self.movie, user=self.other, rating=3, review_content=str(i))
+                                    for i in range(60)])
+        reviews = list(Review.objects.exclude(pk=self.review.pk).values_list('pk', flat=True))
+        Like.objects.bulk_create([Like(user_id=user_id, review_id=reviews[0]) for user_id in users])
+        Review.objects.filter(pk=reviews[0]).update(like_count=len(users))
+        for review_id in reviews:
+            for user_id in users:
+                writebehind.record_like(user_id, review_id, review_id != reviews[0])
+
+        # 1800 pairs: more than one lookup chunk, and too many for one OR of conditions
+        self.assertEqual(writebehind.flush(), (30 * 59, 30, 0))
+        self.assertEqual(Like.objects.filter(review_id__in=reviews).count(), 30 * 59)
+        self.assertEqual(Review.objects.get(pk=reviews[0]).like_count, 0)
+
+    def test_flush_of_likes_across_many_movies(self):
+        writebehind.buffer().clear()
+        User.objects.bulk_create([User(username=f'crowd{i}') for i in range(40)])
+        users = list(User.objects.filter(username__startswith='crowd').values_list('pk', flat=True))
+        Movie.objects.bulk_create([Movie(title=f'Sequel {i}', normalized_title=f'sequel {i}') for i in range(40)])
+        movies = list(Movie.objects.filter(title__startswith='Sequel').values_list('pk', flat=True))
+        Review.objects.bulk_create([Review(movie_id=movie_id, user=self.other, rating=3, review_content='...')
+                                    for movie_id in movies])
+        reviews = list(Review.objects.filter(movie_id__in=movies).values_list('pk', flat=True))
+        MovieFollow.objects.create(user_id=users[0], movie_id=movies[0])
+        for review_id in reviews:
+            for user_id in users:
+                writebehind.record_like(user_id, review_id, True)
+
+        # 1600 (user, movie) follows to look up: too many for one OR of conditions
+        self.assertEqual(writebehind.flush(), (40 * 40, 0, 0))
+        self.assertEqual(MovieFollow.objects.filter(movie_id__in=movies).count(), 40 * 40)
+        self.assertEqual(Movie.objects.get(pk=movies[0]).follower_count, 39)
+
+
+# The local-memory test cache is not shared, so validators are turned on explicitly
+@override_settings(REVIEWS_CACHE={'CONDITIONAL': True})
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.client.force_authenticate(self.user)
+        self.movie = Movie.objects.create(title='Jaws')
+        self.reviews = [Review.objects.create(movie=self.movie, user=self.user, rating=4, review_content=str(i))
+                        for i in range(12)]
+        self.url = f'/api/movies/{self.movie.pk}/'
+
+    def test_movie_detail_embeds_newest_reviews_and_sparse_fields(self):
+        data = self.client.get(self.url).data
+        self.assertEqual([review['id'] for review in data['reviews']], [review.pk for review in self.reviews[:1:-1]])
+        self.assertEqual(data['reviews_url'], f'/api/reviews/?movie={self.movie.pk}')
+        self.assertEqual(len(self.client.get(self.url, {'reviews_limit': 3}).data['reviews']), 3)
+
+        with self.assertNumQueries(1):  # No reviews are loaded when they are not asked for
+            data = self.client.get(self.url, {'fields': 'id,title'}).data
+        self.assertEqual(data, {'id': self.movie.pk, 'title': 'Jaws'})
+
+        reviews = self.client.get(reverse('review_list_create'), {'fields': 'id,rating'}).data['results']
+        self.assertEqual(set(reviews[0]), {'id', 'rating'})
+
+    def test_unchanged_movie_is_answered_with_304_until_it_changes(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response.get('Last-Modified')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(self.url + '?fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('review_list_create'), {'movie_title': 'Jaws', 'rating': 5, 'review_content': 'New'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response['Last-Modified'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_review_detail_and_listing_revalidate(self):
+        url = reverse('review_detail', args=[self.reviews[0].pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.filter(pk=self.movie.pk).get().save()  # A rename would change movie_title
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        listing = reverse('review_list_create') + f'?movie={self.movie.pk}'
+        etag = self.client.get(listing)['ETag']
+        self.assertEqual(self.client.get(listing, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.force_login(self.user)  # like_review is a plain Django view
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('like_review', args=[self.reviews[0].pk])).status_code, 200)
+        self.assertEqual(self.client.get(listing, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+    def test_only_sent_with_a_shared_cache_by_default(self):
+        # A per-process cache cannot tell one worker about another's writes
+        with override_settings(REVIEWS_CACHE={'CONDITIONAL': None}):
+            response = self.client.get(self.url)
+            self.assertNotIn('ETag', response)
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"x"').status_code, 200)
+            with mock.patch.object(cache, 'shared', return_value=True):
+                self.assertIn('ETag', self.client.get(self.url))
+
+
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.client.force_authenticate(self.user)
+        movie = Movie.objects.create(title='Jaws')
+        self.review, self.other = (Review.objects.create(movie=movie, user=self.user, rating=4, review_content=text)
+                                   for text in ('Great', 'Fine'))
+
+    def reply(self, content, parent=None, review=None):
+        response = self.client.post(reverse('comment_list', args=[(review or self.review).pk]),
+                                    {'content': content, 'parent': parent}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_replies_build_paths_and_reply_counts(self):
+        root = self.reply('Root')
+        first = self.reply('First', root)
+        nested = self.reply('Nested', first)
+        second = self.reply('Second', root)
+        self.reply('Elsewhere', review=self.other)
+
+        comments = {comment.pk: comment for comment in Comment.objects.all()}
+        self.assertEqual(comments[nested].path, threads.segment(root) + threads.segment(first) + threads.segment(nested))
+        self.assertEqual((comments[nested].depth, comments[root].reply_count), (2, 2))
+
+        with self.assertNumQueries(1):
+            tree = self.client.get(reverse('comment_tree', args=[self.review.pk])).data['results']
+        self.assertEqual([comment['id'] for comment in tree], [root, first, nested, second])
+        tree = self.client.get(reverse('comment_tree', args=[self.review.pk]), {'depth': 2}).data['results']
+        self.assertEqual([comment['id'] for comment in tree], [root, first, second])
+
+        with self.assertNumQueries(1):
+            thread = self.client.get(reverse('comment_thread', args=[first])).data['results']
+        self.assertEqual([comment['id'] for comment in thread], [first, nested])
+        self.assertEqual(self.client.get(reverse('comment_thread', args=[first]), {'depth': 1}).data['results'][0]['id'],
+                         first)
+
+        # The listing only has this review's comments
+        self.assertEqual(self.client.get(reverse('comment_list', args=[self.review.pk])).data['count'], 4)
+
+    def test_reply_must_stay_on_its_review(self):
+        root = self.reply('Root', review=self.other)
+        response = self.client.post(reverse('comment_list', args=[self.review.pk]), {'content': 'x', 'parent': root},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(reverse('comment_list', args=[0]), {'content': 'x'}).status_code, 404)
+
+    def test_deleting_a_comment_removes_its_subtree(self):
+        root = self.reply('Root')
+        first = self.reply('First', root)
+        self.reply('Nested', first)
+        self.assertEqual(self.client.delete(reverse('comment_detail', args=[first])).status_code, 204)
+        self.assertEqual(list(Comment.objects.values_list('pk', 'reply_count')), [(root, 0)])
+
+        first = self.reply('First again', root)
+        self.reply('Nested again', first)
+        self.assertEqual(threads.delete_subtrees([first]), (2, {self.review.pk}))
+        self.assertEqual(Comment.objects.get().reply_count, 0)
+
+    def test_paths_compare_in_binary(self):
+        # The subtree range ends at path + '~', which only sorts after the digits byte by byte
+        field = Comment._meta.get_field('path')
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(field.db_parameters(connection)['collation'], 'utf8mb4_bin')
+        self.assertIsNone(field.db_parameters(connection)['collation'])
+        self.assertLess(threads.segment(36 ** threads.SEGMENT_WIDTH - 1), threads.END)
+
+
+class FeedTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pass')
+        self.critic = User.objects.create_user(username='critic', password='pass')
+        self.jaws, self.alien, self.heat = (Movie.objects.create(title=title) for title in ('Jaws', 'Alien', 'Heat'))
+        self.client.force_authenticate(self.reader)
+
+    def review(self, movie, user=None, content='Review'):
+        return Review.objects.create(movie=movie, user=user or self.critic, rating=4, review_content=content)
+
+    def test_follows_reviewed_and_liked_movies_with_backfill(self):
+        old = self.review(self.alien, content='Before the follow')
+        self.review(self.jaws, user=self.reader)
+        Like.objects.create(user=self.reader, review=old)
+        new = [self.review(movie) for movie in (self.jaws, self.alien, self.heat)]
+
+        results = self.client.get(reverse('feed')).data['results']
+        self.assertEqual([review['id'] for review in results], [new[1].pk, new[0].pk, old.pk])
+        self.assertEqual(Movie.objects.get(pk=self.alien.pk).follower_count, 2)
+
+    def test_cursor_pages_cost_constant_queries_and_skip_hidden(self):
+        self.review(self.jaws, user=self.reader)
+        reviews = [self.review(self.jaws, content=str(i)) for i in range(7)]
+        Review.objects.filter(pk=reviews[-1].pk).update(is_hidden=True)
+
+        seen, url = [], reverse('feed') + '?page_size=3'
+        while url:
+            with self.assertNumQueries(2):  # Popular follows and one page of entries joined to the reviews
+                data = self.client.get(url).data
+            seen += [review['id'] for review in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [review.pk for review in reversed(reviews[:-1])])
+
+    @override_settings(REVIEWS_FEEDS={'FANOUT_LIMIT': 1})
+    def test_popular_movies_are_merged_on_read_and_feeds_rebuild(self):
+        self.review(self.heat, user=self.reader)
+        self.review(self.heat)  # Heat now has two followers, so nothing more is fanned out
+        popular = self.review(self.heat, content='Popular')
+        self.assertFalse(FeedEntry.objects.filter(review=popular).exists())
+        with self.assertNumQueries(3):
+            results = self.client.get(reverse('feed')).data['results']
+        self.assertEqual(results[0]['id'], popular.pk)
+
+        FeedEntry.objects.all().delete()
+        MovieFollow.objects.all().delete()
+        call_command('rebuild_feeds', stdout=io.StringIO())
+        self.assertEqual(MovieFollow.objects.count(), 2)
+        self.assertEqual(self.client.get(reverse('feed')).data['results'][0]['id'], popular.pk)
+
+    @override_settings(REVIEWS_FEEDS={'FEED_LENGTH': 2, 'TRIM_EVERY': 1})
+    def test_feeds_are_trimmed_to_their_length(self):
+        self.review(self.jaws, user=self.reader)
+        for i in range(5):
+            self.review(self.jaws, content=str(i))
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 2)
+
+
+class ModerationTests(APITestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.staff = User.objects.create_user(username='mod', password='pass', is_staff=True)
+        self.spammer = User.objects.create_user(username='spammer', password='pass')
+        self.movie = Movie.objects.create(title='Jaws')
+        self.spam = [Review.objects.create(movie=self.movie, user=self.spammer, rating=1, review_content=f'spam {i}')
+                     for i in range(5)]
+        self.keep = Review.objects.create(movie=self.movie, user=self.staff, rating=5, review_content='Great')
+        for review in self.spam[:2]:
+            Like.objects.create(user=self.staff, review=review)
+            Comment.objects.create(review=review, user=self.staff, content='Reply')
+        ratings.rebuild()
+        self.client.force_authenticate(self.staff)
+
+    def moderate(self, kind, body):
+        response = self.client.post(reverse('moderation', args=[kind]), body, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_delete_runs_in_chunks_and_cleans_up_without_signals(self):
+        with mock.patch('reviews.signals.unindex_document') as unindex:
+            lines = self.moderate('review', {'action': 'delete', 'username': 'spammer', 'chunk_size': 2})
+        self.assertEqual(lines[:-1], [{'processed': 2, 'changed': 2, 'total': 5},
+                                      {'processed': 4, 'changed': 4, 'total': 5},
+                                      {'processed': 5, 'changed': 5, 'total': 5}])
+        self.assertEqual(lines[-1], {'done': True})
+        unindex.assert_not_called()
+        self.assertEqual(list(Review.objects.all()), [self.keep])
+        self.assertFalse(Like.objects.exists() or Comment.objects.exists())
+        self.assertEqual(MovieRating.objects.get(movie=self.movie).review_count, 1)
+
+    def test_hidden_rows_leave_listings_and_ratings_until_unhidden(self):
+        self.moderate('review', {'action': 'hide', 'ids': [review.pk for review in self.spam]})
+        self.assertEqual([row['id'] for row in self.client.get(reverse('review_list_create')).data['results']],
+                         [self.keep.pk])
+        self.assertEqual(MovieRating.objects.get(movie=self.movie).average, 5)
+        self.client.force_authenticate(User.objects.create_user(username='other', password='pass'))
+        self.assertEqual(self.client.get(reverse('review_detail', args=[self.spam[0].pk])).status_code, 404)
+        self.client.force_authenticate(self.spammer)  # Authors still see their own
+        self.assertEqual(self.client.get(reverse('review_detail', args=[self.spam[0].pk])).status_code, 200)
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.moderate('review', {'action': 'unhide', 'rating': 1})[-2]['changed'], 5)
+        self.assertEqual(MovieRating.objects.get(movie=self.movie).review_count, 6)
+
+        comments = self.moderate('comment', {'action': 'hide', 'review': self.spam[0].pk})
+        self.assertEqual(comments[-2]['changed'], 1)
+        self.assertEqual(self.client.get(reverse('comment_list', args=[self.spam[0].pk])).data['count'], 0)
+
+    def test_comment_delete_in_one_large_chunk(self):
+        Comment.objects.bulk_create([Comment(review=self.keep, user=self.spammer, content=f'spam {i}')
+                                     for i in range(1200)])
+        threads.set_root_paths()
+        root = Comment.objects.filter(review=self.keep).order_by('pk').first()
+        threads.add_comment(self.keep.pk, self.staff, 'Reply', parent=root)
+
+        lines = self.moderate('comment', {'action': 'delete', 'username': 'spammer', 'chunk_size': 5000})
+        self.assertEqual(lines[-2], {'processed': 1200, 'changed': 1201, 'total': 1200})
+        self.assertFalse(Comment.objects.filter(review=self.keep).exists())
+
+    def test_rejects_unfiltered_and_non_staff_requests(self):
+        response = self.client.post(reverse('moderation', args=['review']), {'action': 'delete'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.spammer)
+        response = self.client.post(reverse('moderation', args=['review']), {'action': 'delete', 'ids': [1]},
+                                    format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Review.objects.count(), 6)
+
+    def test_admin_changelist_and_bulk_action(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pass'))
+        with self.assertNumQueries(4):  # Session, user, one count and the rows joined to movie and user
+            response = self.client.get('/admin/reviews/review/')
+        self.assertContains(response, 'value="delete_selected_in_bulk"')
+        self.assertNotContains(response, 'value="delete_selected"')
+        response = self.client.post('/admin/reviews/review/', {
+            'action': 'delete_selected_in_bulk', '_selected_action': [review.pk for review in self.spam]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Review.objects.count(), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REVIEWS_CACHE={'ENABLED': False})
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.client.force_login(self.user)
+        self.review = Review.objects.create(movie=Movie.objects.create(title='Jaws'), user=self.user, rating=4,
+                                            review_content='Shark')
+
+    def queries_by_alias(self, method, url, **data):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data)
+        return response, len(primary), len(replica)
+
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        detail = reverse('review_detail', args=[self.review.pk])
+        response, primary, replica = self.queries_by_alias('get', detail)
+        self.assertEqual((response.status_code, primary), (200, 0))
+        self.assertGreater(replica, 0)
+
+        response, primary, replica = self.queries_by_alias('post', reverse('like_review', args=[self.review.pk]))
+        self.assertEqual((response.status_code, replica), (200, 0))
+        self.assertIn('db_primary_until', response.cookies)
+
+        # Pinned to the primary for the sticky window, so the like is visible at once
+        response, primary, replica = self.queries_by_alias('get', detail)
+        self.assertEqual((response.data['like_count'], replica), (1, 0))
+
+        self.client.cookies.pop('db_primary_until')
+        response, primary, replica = self.queries_by_alias('get', detail)
+        self.assertEqual(primary, 0)
+
+    def test_commands_and_background_work_read_from_the_primary(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            ratings.rebuild()
+            Review.objects.count()
+        self.assertEqual(len(replica), 0)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class BenchmarkTests(TransactionTestCase):
+    def test_seed_and_run_report_latency_and_queries(self):
+        benchmark.seed(users=3, movies=4, reviews=30, likes=20, comments=10, batch_size=7, log=lambda message: None)
+        self.assertEqual(Review.objects.count(), 30)
+        self.assertEqual(sum(Review.objects.values_list('like_count', flat=True)), Like.objects.count())
+
+        results = benchmark.run(['review_detail', 'like'], requests=4, concurrency=1)
+        self.assertEqual(results['review_detail']['requests'], 4)
+        self.assertEqual(results['review_detail']['statuses'], {'200': 4})
+        self.assertGreater(results['review_detail']['queries_per_request'], 0)
+
+        slower = dict(results['review_detail'], p95_ms=results['review_detail']['p95_ms'] * 2 + 1,
+                      queries_per_request=results['review_detail']['queries_per_request'] + 1)
+        regressions = benchmark.compare({'review_detail': slower}, {'results': results})
+        self.assertEqual(len(regressions), 2)
+
+
+@override_settings(REVIEWS_JOBS={'EAGER': False, 'RETRY_DELAY': 60, 'MAX_ATTEMPTS': 2},
+                   REVIEWS_SEARCH={'BACKEND': 'index'})
+class JobTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='pass')
+        self.critic = User.objects.create_user(username='critic', password='pass')
+        self.movie = Movie.objects.create(title='Jaws')
+        MovieFollow.objects.create(user=self.reader, movie=self.movie)
+        self.client.force_authenticate(self.critic)
+
+    def test_writes_queue_work_after_commit_for_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('review_list_create'),
+                                        {'movie_title': 'Jaws', 'rating': 5, 'review_content': 'Shark'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(Job.objects.values_list('kind', flat=True)),
+                         ['feeds.fanout', 'search.index', 'trending.activity'])
+        self.assertFalse(FeedEntry.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Review.objects.filter(pk=response.data['id']).first().save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(Job.objects.count(), 3)  # The rolled-back save queued nothing
+
+        self.assertEqual(jobs.drain(), (3, 0))
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(list(FeedEntry.objects.values_list('user__username', flat=True)), ['reader'])
+        self.assertEqual([object_id for object_id, _ in search.search('review', 'shark')], [response.data['id']])
+
+    def test_pending_duplicates_collapse(self):
+        review = Review.objects.create(movie=self.movie, user=self.critic, rating=3, review_content='One')
+        with self.captureOnCommitCallbacks(execute=True):
+            for content in ('Two', 'Three'):
+                review.review_content = content
+                review.save()
+        self.assertEqual(Job.objects.filter(kind='search.index').count(), 1)
+
+        jobs.claim()
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()  # Claimed jobs give up their key, so new work is queued again
+        self.assertEqual(Job.objects.filter(kind='search.index').count(), 2)
+
+    def test_batches_isolate_failures_and_retry_with_backoff(self):
+        calls = []
+
+        def flaky(payloads):
+            calls.append([payload['n'] for payload in payloads])
+            if any(payload['n'] == 2 for payload in payloads):
+                raise ValueError('bad payload')
+
+        with mock.patch.dict(jobs.TASKS, {'test.flaky': (flaky, None)}):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue_many('test.flaky', [{'n': n} for n in range(1, 4)])
+            with self.assertLogs('reviews.jobs', 'WARNING'):
+                self.assertEqual(jobs.work(), (2, 1))
+            self.assertEqual(calls, [[1, 2, 3], [1], [2], [3]])
+            job = Job.objects.get()
+            self.assertEqual((job.status, job.attempts, job.payload), (Job.PENDING, 1, {'n': 2}))
+            self.assertIn('bad payload', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(jobs.work(), (0, 0))  # Not due yet
+
+            Job.objects.update(run_after=timezone.now())
+            with self.assertLogs('reviews.jobs', 'ERROR'):
+                self.assertEqual(jobs.work(), (0, 1))
+            self.assertEqual(Job.objects.get().status, Job.FAILED)  # Out of attempts
+            self.assertEqual(jobs.retry_failed(Job.objects.all()), 1)
+            self.assertEqual(Job.objects.get().attempts, 0)
+
+    def test_expired_leases_are_claimed_again(self):
+        with mock.patch.dict(jobs.TASKS, {'test.noop': (lambda payloads: None, None)}):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue('test.noop', {})
+            self.assertEqual(len(jobs.claim()), 1)
+            self.assertEqual(jobs.claim(), [])  # Leased to the first worker
+            Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))  # Which died
+            self.assertEqual([job.attempts for job in jobs.claim()], [2])
+
+    def test_run_jobs_command(self):
+        Review.objects.create(movie=self.movie, user=self.critic, rating=3, review_content='Queued')
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.reader, review=Review.objects.get())
+        out = io.StringIO()
+        call_command('run_jobs', once=True, stdout=out)
+        self.assertIn('Ran 3 jobs, 0 failed', out.getvalue())
+        self.assertEqual(Notification.objects.get().verb, 'like')
+
+
+class NotificationTests(APITestCase):
+    def setUp(self):
+        self.author, self.fan, self.troll = (User.objects.create_user(username=name, password='pass')
+                                             for name in ('author', 'fan', 'troll'))
+        self.review = Review.objects.create(movie=Movie.objects.create(title='Jaws'), user=self.author, rating=5,
+                                            review_content='Shark')
+
+    def test_likes_comments_and_replies_notify_the_authors(self):
+        Like.objects.create(user=self.fan, review=self.review)
+        Like.objects.create(user=self.author, review=self.review)  # Their own: no notification
+        comment = threads.add_comment(self.review.pk, self.fan, 'Agreed')
+        threads.add_comment(self.review.pk, self.troll, 'No', parent=comment)
+        threads.add_comment(self.review.pk, self.author, 'Thanks', parent=comment)
+
+        self.client.force_authenticate(self.author)
+        with self.assertNumQueries(2):  # Count and page, actors joined
+            results = self.client.get(reverse('notifications')).data['results']
+        self.assertEqual([(row['actor'], row['verb']) for row in results],
+                         [('troll', 'comment'), ('fan', 'comment'), ('fan', 'like')])
+
+        self.client.force_authenticate(self.fan)
+        results = self.client.get(reverse('notifications')).data['results']
+        self.assertEqual([(row['actor'], row['verb']) for row in results], [('author', 'reply'), ('troll', 'reply')])
+
+
+class SimilarMovieTests(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(4)]
+        self.jaws, self.alien, self.heat, self.up = (Movie.objects.create(title=title)
+                                                     for title in ('Jaws', 'Alien', 'Heat', 'Up'))
+        # Everyone likes Jaws and Alien; two also like Heat; one likes Up (too few co-raters)
+        for user in self.users:
+            self.rate(user, self.jaws, 5)
+            self.rate(user, self.alien, 5 if user != self.users[0] else 4)
+        for user in self.users[:2]:
+            self.rate(user, self.heat, 4)
+        self.rate(self.users[0], self.up, 5)
+        self.rate(self.users[1], self.up, 2)  # Not a like
+        self.client.force_authenticate(self.users[0])
+
+    def rate(self, user, movie, rating):
+        return Review.objects.create(user=user, movie=movie, rating=rating, review_content='Seen it')
+
+    def neighbours(self, movie):
+        return [(row['movie']['title'], round(row['score'], 3))
+                for row in self.client.get(reverse('similar_movies', args=[movie.pk])).data]
+
+    def test_build_ranks_cosine_neighbours(self):
+        call_command('build_similar_movies', stdout=io.StringIO())
+        # Jaws . Alien = 2*1 + 3*(2*2) = 14 over |Jaws| 4 and |Alien| sqrt(13)
+        self.assertEqual(self.neighbours(self.jaws), [('Alien', 0.971), ('Heat', 0.707)])
+        self.assertEqual(self.neighbours(self.heat), [('Jaws', 0.707), ('Alien', 0.588)])
+        self.assertEqual(self.neighbours(self.up), [])
+
+        django_cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('similar_movies', args=[self.jaws.pk]) + '?limit=1')
+        data = self.client.get(f'/api/movies/{self.jaws.pk}/').json()
+        self.assertEqual(data['similar_url'], f'/api/movies/{self.jaws.pk}/similar/')
+
+    def test_incremental_update_matches_a_full_build(self):
+        similarity.build()
+        for user in self.users[2:]:
+            self.rate(user, self.heat, 5)
+        self.rate(self.users[1], self.up, 4)
+        self.assertEqual(similarity.update(), 2)
+        incremental = list(SimilarMovie.objects.order_by('movie_id', 'rank').values_list('movie_id', 'similar_id', 'score'))
+        self.assertEqual(similarity.update(), 0)
+
+        similarity.build()
+        rebuilt = list(SimilarMovie.objects.order_by('movie_id', 'rank').values_list('movie_id', 'similar_id', 'score'))
+        self.assertEqual(incremental, rebuilt)
+        self.assertIn((self.up.pk, self.jaws.pk), [(movie, similar) for movie, similar, _ in rebuilt])
+
+
+@override_settings(REVIEWS_CACHE={'ENABLED': False, 'CONDITIONAL': True})
+class RenderingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        movie = Movie.objects.create(title='Jaws')
+        self.reviews = [Review.objects.create(movie=movie, user=self.user, rating=i % 5 + 1,
+                                              review_content=f'Review {i} ' + 'text ' * 50) for i in range(20)]
+        root = threads.add_comment(self.reviews[0].pk, self.user, 'First')
+        threads.add_comment(self.reviews[0].pk, self.user, 'Reply', parent=root)
+        self.client.force_authenticate(self.user)
+
+    def test_values_listings_match_the_model_serializers(self):
+        reviews = {review.pk: ReviewSerializer(review).data for review in Review.objects.select_related('user', 'movie')}
+        for url in (reverse('review_list_create') + '?page_size=50', reverse('user_reviews') + '?pagination=keyset'):
+            results = self.client.get(url).json()['results']
+            self.assertEqual(results, [json.loads(json.dumps(reviews[row['id']])) for row in results])
+        comments = {comment.pk: CommentSerializer(comment).data for comment in Comment.objects.all()}
+        results = self.client.get(reverse('comment_list', args=[self.reviews[0].pk])).json()['results']
+        self.assertEqual(results, [json.loads(json.dumps(comments[row['id']])) for row in results])
+        self.assertIsNotNone(results[0]['parent'])
+
+        results = self.client.get(reverse('review_list_create') + '?fields=id,rating').json()['results']
+        self.assertEqual(set(results[0]), {'id', 'rating'})
+        # Keyset cursors are read from the rows too
+        page = self.client.get(reverse('review_list_create') + '?pagination=keyset&page_size=15').json()
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 5)
+
+    def test_fast_json_matches_the_default_renderer(self):
+        data = {'at': timezone.now(), 'ratio': 1.5, 1: 'line\u2028break', 'items': [None, True, 'é']}
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(REVIEWS_COMPRESSION={'MIN_SIZE': 1024})
+    def test_large_responses_are_compressed(self):
+        url = reverse('review_list_create') + '?page_size=20'
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) / 3)
+        if compression.brotli:
+            brotli = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(brotli['Content-Encoding'], 'br')
+            self.assertEqual(compression.brotli.decompress(brotli.content), plain.content)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        # A 304 compares weakly, so the compressed copy's validator still matches
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0'))
+        small = self.client.get(reverse('review_list_create') + '?page_size=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', small)
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_msgpack_on_request(self):
+        response = self.client.get(reverse('review_list_create'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = renderers.msgpack.unpackb(response.content)
+        self.assertEqual(data['results'], self.client.get(reverse('review_list_create')).json()['results'])
+
+
+class MovieTitleTests(APITestCase):
+    def setUp(self):
+        titles.clear()
+        self.admin = User.objects.create_superuser('admin', password='pass12345')
+        self.movie = Movie.objects.create(title='The Lion King', description='Pride Rock')
+        self.client.force_authenticate(self.admin)
+
+    def test_reviews_resolve_title_variants_to_one_movie(self):
+        for title in ('the lion king', '  THE   LION KING ', 'Ｔｈｅ Ｌｉｏｎ Ｋｉｎｇ'):
+            response = self.client.post(reverse('review_list_create'),
+                                        {'movie_title': title, 'rating': 4, 'review_content': 'Roar'})
+            self.assertEqual((response.status_code, response.data['movie_title']), (201, 'The Lion King'))
+        response = self.client.post(reverse('review_list_create'),
+                                    {'movie_title': '  Mufasa  ', 'rating': 3, 'review_content': 'Prequel'})
+        self.assertEqual(response.data['movie_title'], 'Mufasa')
+        self.assertEqual(self.movie.reviews.count(), 3)
+        self.assertEqual(Movie.objects.get(title='Mufasa').normalized_title, 'mufasa')
+
+        response = self.client.post(reverse('movie_create'), {'title': 'THE LION KING'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_upsert_creates_updates_and_skips_unchanged_rows(self):
+        rows = [
+            {'title': 'the lion king', 'description': 'Hakuna matata'},
+            {'title': 'Heat', 'release_date': '1995-12-15'},
+            {'title': 'Heat ', 'description': 'Los Angeles'},
+            {'title': ''},
+            'not a movie',
+        ]
+        response = self.client.post(reverse('movie_upsert') + '?batch_size=2', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([response.data[key] for key in ('created', 'updated', 'unchanged', 'rejected')], [1, 2, 0, 2])
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.title, self.movie.description), ('The Lion King', 'Hakuna matata'))
+        # The second Heat row fell in another batch and updated the movie the first created
+        heat = Movie.objects.get(normalized_title='heat')
+        self.assertEqual((heat.title, str(heat.release_date), heat.description), ('Heat', '1995-12-15', 'Los Angeles'))
+
+        path = os.path.join(tempfile.mkdtemp(), 'movies.csv')
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['title', 'description'])
+            writer.writerows([['HEAT', 'Los Angeles'], ['Up', 'Balloons']])
+        out = io.StringIO()
+        call_command('upsert_movies', path, stdout=out)
+        self.assertIn('Created 1 movies, updated 0, 1 unchanged', out.getvalue())
+
+    def test_autocomplete_falls_back_to_the_database(self):
+        # Inside the test's transaction the index is never loaded
+        Movie.objects.create(title='Lion')
+        response = self.client.get(reverse('movie_autocomplete') + '?q=LION')
+        self.assertEqual([movie['title'] for movie in response.data], ['Lion'])
+        self.assertEqual(self.client.get(reverse('movie_autocomplete') + '?q=').data, [])
+
+
+@override_settings(REVIEWS_TITLES={'REFRESH_INTERVAL': 0})
+class TitleIndexTests(TransactionTestCase):
+    def setUp(self):
+        titles.clear()
+        self.addCleanup(titles.clear)
+        self.user = User.objects.create_user(username='critic', password='pass')
+        self.client.force_login(self.user)
+        for title in ('The Lion King', 'Lion', 'An American Tail', 'Up'):
+            Movie.objects.create(title=title)
+
+    def test_known_titles_resolve_without_a_movie_query(self):
+        lion_king, up = Movie.objects.get(title='The Lion King'), Movie.objects.get(title='Up')
+        titles.current()
+        with CaptureQueriesContext(connections['default']) as queries, \
+                mock.patch.object(cache, 'shared', return_value=True):
+            resolved = titles.resolve_many(['the LION king', 'up'])
+        self.assertEqual(resolved, {'the LION king': (lion_king.pk, 'The Lion King'), 'up': (up.pk, 'Up')})
+        self.assertFalse([query for query in queries if 'reviews_movie' in query['sql']])
+
+    def test_autocomplete_matches_without_a_leading_article(self):
+        response = self.client.get(reverse('movie_autocomplete') + '?q=lion')
+        self.assertEqual([movie['title'] for movie in response.data], ['Lion', 'The Lion King'])
+        response = self.client.get(reverse('movie_autocomplete') + '?q=a&limit=1')
+        self.assertEqual([movie['title'] for movie in response.data], ['An American Tail'])
+
+    def test_index_follows_creations_renames_and_deletions(self):
+        titles.current()
+        Movie.objects.create(title='Lionheart')
+        self.assertIn('lionheart', titles.current().titles)
+
+        # Rows written behind the index's back arrive through the ('titles', 'added') version
+        Movie.objects.bulk_create([Movie(title='Lions', normalized_title='lions')])
+        self.assertNotIn('lions', titles.current().titles)
+        cache.bump('titles', 'added')
+        self.assertIn('lions', titles.current().titles)
+
+        movie = Movie.objects.get(title='Up')
+        movie.title = 'Up!'
+        movie.save()
+        Movie.objects.filter(title='Lion').delete()
+        index = titles.current()
+        self.assertEqual(index.titles['up!'], (movie.pk, 'Up!'))
+        self.assertNotIn('up', index.titles)
+        self.assertNotIn('lion', index.titles)
+
+    def test_other_workers_deletions_and_renames_are_not_written_against(self):
+        # Raw writes stand in for another worker's, whose version bumps a per-process cache never sees
+        titles.current()
+        raw_delete(Movie.objects.filter(title='Up'))
+        Movie.objects.filter(title='Lion').update(title='Lion!', normalized_title='lion!')
+        response = self.client.post(reverse('review_list_create'),
+                                    {'movie_title': 'up', 'rating': 4, 'review_content': 'Balloons'})
+        self.assertEqual((response.status_code, response.data['movie_title']), (201, 'up'))
+        self.assertEqual(titles.resolve('Lion').title, 'Lion')
+        self.assertEqual(Movie.objects.filter(normalized_title__in=['up', 'lion']).count(), 2)
+
+        # With a shared cache the versions are trusted, and MAX_AGE bounds a missed one
+        raw_delete(Movie.objects.filter(title='Lion'))
+        with mock.patch.object(cache, 'shared', return_value=True):
+            self.assertIn('lion', titles.current().titles)
+            with override_settings(REVIEWS_TITLES={'REFRESH_INTERVAL': 0, 'MAX_AGE': 0}):
+                self.assertNotIn('lion', titles.current().titles)
+
+    def test_rolled_back_movies_never_enter_the_index(self):
+        titles.current()
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                titles.resolve('Gone')
+                raise DatabaseError
+        self.assertNotIn('gone', titles.current().titles)
+        self.assertEqual(titles.resolve('GONE').title, 'GONE')
 
-# Create your tests here.
@@ -0,0 +1,125 @@
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q, Subquery, Value
+from django.db.models.functions import Concat
+from rest_framework.exceptions import ValidationError
+
+from .models import Comment, raw_delete
+
+# Threaded comments as a materialized path
+#
+# Comment.path is the chain of ids from the thread's root down to the comment, each encoded as a
+# fixed-width base-36 segment, so string order is depth-first (thread) order and a comment's
+# subtree is the contiguous range [path, path + '~') of the path index. The column compares in
+# binary (models.PathField), as a language collation may sort '~' before the digits. depth is the
+# number of ancestors and reply_count the number of direct replies, both stored so no read has to
+# count.
+#
+# A review's whole tree to depth n is one (review, path) range filtered on depth; one comment's
+# subtree is one path range, with the root's path taken from a scalar subquery.
+
+SEGMENT_WIDTH = 7  # 36 ** 7 ids, about 78 billion
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+MAX_DEPTH = Comment._meta.get_field('path').max_length // SEGMENT_WIDTH - 1
+END = '~'  # Sorts after every digit
+ROOTS_PER_QUERY = 100  # Path ranges ORed into one query by delete_subtrees
+DELETE_CHUNK_SIZE = 1000  # Comments per raw DELETE in delete_subtrees
+
+
+def segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        digits = DIGITS[remainder] + digits
+    return digits.rjust(SEGMENT_WIDTH, '0')
+
+
+def add_comment(review_id, user, content, parent=None):
+    # Creates the comment and its path, and counts it on the parent, in one transaction
+    if parent is not None:
+        if parent.review_id != review_id:
+            raise ValidationError({'parent': ['Must be a comment on the same review.']})
+        if parent.depth >= MAX_DEPTH:
+            raise ValidationError({'parent': [f'Replies can be nested at most {MAX_DEPTH} levels deep.']})
+    with transaction.atomic():
+        comment = Comment.objects.create(review_id=review_id, user=user, content=content, parent=parent,
+                                         depth=parent.depth + 1 if parent else 0)
+        comment.path = (parent.path if parent else '') + segment(comment.pk)
+        Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+        if parent is not None:
+            Comment.objects.filter(pk=parent.pk).update(reply_count=F('reply_count') + 1)
+    return comment
+
+
+def comment_removed(comment):
+    # After a delete: the parent, if it survives, has one reply fewer
+    if comment.parent_id:
+        Comment.objects.filter(pk=comment.parent_id).update(reply_count=F('reply_count') - 1)
+
+
+def review_tree(review_id, depth):
+    # The review's comments down to `depth` levels (1 = top-level only), in thread order
+    return Comment.objects.filter(review_id=review_id, depth__lt=depth, is_hidden=False).order_by('path')
+
+
+def subtree(comment_id, depth):
+    # The comment and its replies down to `depth` levels below it, in thread order
+    root = Comment.objects.filter(pk=comment_id)
+    root_path = Subquery(root.values('path')[:1])
+    return Comment.objects.filter(
+        path__gte=root_path,
+        path__lt=Concat(root_path, Value(END)),
+        depth__lte=Subquery(root.annotate(limit=F('depth') + depth).values('limit')[:1]),
+        is_hidden=False,
+    ).order_by('path')
+
+
+def delete_subtrees(pks):
+    # Raw delete of the comments and all their replies, for bulk paths that skip the collector;
+    # returns (rows deleted, review ids touched). The subtrees are read ROOTS_PER_QUERY roots at a
+    # time, as one OR of path ranges per root would outgrow the database's expression limits.
+    roots = list(Comment.objects.filter(pk__in=pks).values_list('path', 'parent_id', 'review_id'))
+    if not roots:
+        return 0, set()
+    doomed_pks = set()
+    for start in range(0, len(roots), ROOTS_PER_QUERY):
+        ranges = [Q(path__gte=path, path__lt=path + END) for path, _, _ in roots[start:start + ROOTS_PER_QUERY]]
+        doomed_pks.update(Comment.objects.filter(reduce(or_, ranges)).values_list('pk', flat=True))
+    doomed_pks = sorted(doomed_pks)
+    deleted = 0
+    for start in range(0, len(doomed_pks), DELETE_CHUNK_SIZE):
+        chunk = doomed_pks[start:start + DELETE_CHUNK_SIZE]
+        # Unlinking first lets one statement delete parents and replies in any order
+        Comment.objects.filter(pk__in=chunk).update(parent=None)
+        deleted += raw_delete(Comment.objects.filter(pk__in=chunk))
+    for parent_id, count in _count_by_parent(roots).items():
+        Comment.objects.filter(pk=parent_id).update(reply_count=F('reply_count') - count)
+    return deleted, {review_id for _, _, review_id in roots}
+
+
+def _count_by_parent(roots):
+    counts = {}
+    for _, parent_id, _ in roots:
+        if parent_id:
+            counts[parent_id] = counts.get(parent_id, 0) + 1
+    return counts
+
+
+def unlink(review_pks):
+    # Lets raw deletes of whole reviews remove their comments with one statement
+    Comment.objects.filter(review_id__in=review_pks, parent__isnull=False).update(parent=None)
+
+
+def set_root_paths(chunk_size=1000):
+    # Paths for comments written by bulk_create (no replies), e.g. the benchmark seed
+    last_pk, updated = 0, 0
+    while True:
+        batch = list(Comment.objects.filter(pk__gt=last_pk, path='').order_by('pk').only('pk')[:chunk_size])
+        if not batch:
+            return updated
+        for comment in batch:
+            comment.path = segment(comment.pk)
+        Comment.objects.bulk_update(batch, ['path'])
+        last_pk, updated = batch[-1].pk, updated + len(batch)
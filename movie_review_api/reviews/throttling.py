@@ -0,0 +1,192 @@
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+
+# Token-bucket request throttling on a shared cache counter
+#
+# Every (scope, client) pair has a bucket holding up to N tokens that refills at N per period, from
+# a rate such as '30/min'. Clients are users when authenticated and IP addresses otherwise. Each
+# request checks the 'user' or 'anon' bucket plus the bucket of its endpoint scope (e.g. 'like').
+#
+# A bucket is a single integer in the cache: its theoretical arrival time (GCRA) in milliseconds,
+# the moment the bucket would be full again. Taking a token is one atomic incr by the refill
+# interval, so concurrent workers sharing the cache (Redis; locmem within one process) never grant
+# the same token twice. The request is allowed while that moment is at most one full bucket ahead
+# of now; otherwise the token is handed back and Retry-After says when the next one is due.
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'reviews:throttle',
+    'NUM_PROXIES': None,  # Trusted proxies in front of the app, for X-Forwarded-For (as in DRF)
+    'RATES': {},
+}
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_THROTTLE', {}).get(name, DEFAULTS[name])
+
+
+def parse_rate(rate):
+    # '30/min' -> (30 tokens, 2000 ms per token); None for an unlimited scope
+    if not rate:
+        return None
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count, PERIODS[period] * 1000 / count
+
+
+def _cache():
+    return caches[config('CACHE_ALIAS')]
+
+
+def _bucket(scope, ident, rate):
+    # (cache key, capacity, ms per token, now in ms, key timeout: long enough to refill completely)
+    capacity, interval = rate[0], max(1, round(rate[1]))
+    return (f"{config('KEY_PREFIX')}:{scope}:{ident}", capacity, interval, int(time.time() * 1000),
+            math.ceil(capacity * interval / 1000) + 1)
+
+
+RESET = -1
+
+
+def _verdict(arrival, capacity, interval, now_ms):
+    # After incrementing the bucket to `arrival`: RESET if it had been idle long enough to be full,
+    # 0 if the token was granted, else the seconds until the next one is
+    if arrival - interval < now_ms:
+        return RESET
+    if arrival - now_ms <= capacity * interval:
+        return 0
+    return (arrival - capacity * interval - now_ms) / 1000
+
+
+def take(scope, ident, rate):
+    # Takes a token from the bucket; returns the seconds to wait, 0 when the request may proceed
+    if rate is None:
+        return 0
+    key, capacity, interval, now_ms, timeout = _bucket(scope, ident, rate)
+    cache_ = _cache()
+    if cache_.add(key, now_ms + interval, timeout=timeout):
+        return 0
+    try:
+        wait = _verdict(cache_.incr(key, interval), capacity, interval, now_ms)
+    except ValueError:  # Expired between the add and the incr
+        wait = RESET
+    if wait == RESET:
+        # Restart the idle bucket's clock from now. Idle requests racing here can each be allowed,
+        # which only ever errs by a token apiece.
+        cache_.set(key, now_ms + interval, timeout=timeout)
+        return 0
+    if wait:
+        cache_.decr(key, interval)  # Hand the token back
+    return wait
+
+
+async def atake(scope, ident, rate):
+    if rate is None:
+        return 0
+    key, capacity, interval, now_ms, timeout = _bucket(scope, ident, rate)
+    cache_ = _cache()
+    if await cache_.aadd(key, now_ms + interval, timeout=timeout):
+        return 0
+    try:
+        wait = _verdict(await cache_.aincr(key, interval), capacity, interval, now_ms)
+    except ValueError:
+        wait = RESET
+    if wait == RESET:
+        await cache_.aset(key, now_ms + interval, timeout=timeout)
+        return 0
+    if wait:
+        await cache_.adecr(key, interval)
+    return wait
+
+
+def client_ident(request, user):
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{_ip(request)}'
+
+
+def _ip(request):
+    # Mirrors DRF's BaseThrottle.get_ident, reading NUM_PROXIES from REVIEWS_THROTTLE
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    remote = request.META.get('REMOTE_ADDR')
+    proxies = config('NUM_PROXIES')
+    if proxies is not None:
+        if proxies == 0 or forwarded is None:
+            return remote
+        addresses = forwarded.split(',')
+        return addresses[-min(proxies, len(addresses))].strip()
+    return ''.join(forwarded.split()) if forwarded else remote
+
+
+def scopes_for(user, scope):
+    # The endpoint's own bucket first (usually the tighter one), then the client-wide one
+    client_scope = 'user' if user is not None and user.is_authenticated else 'anon'
+    return [scope, client_scope] if scope else [client_scope]
+
+
+def check(request, user, scope):
+    # Seconds to wait before the request may be retried, or 0 if it may proceed. A denial stops
+    # there, so it does not also spend the remaining buckets' tokens.
+    if not config('ENABLED'):
+        return 0
+    rates, ident = config('RATES'), client_ident(request, user)
+    for name in scopes_for(user, scope):
+        wait = take(name, ident, parse_rate(rates.get(name)))
+        if wait:
+            return wait
+    return 0
+
+
+async def acheck(request, user, scope):
+    if not config('ENABLED'):
+        return 0
+    rates, ident = config('RATES'), client_ident(request, user)
+    for name in scopes_for(user, scope):
+        wait = await atake(name, ident, parse_rate(rates.get(name)))
+        if wait:
+            return wait
+    return 0
+
+
+def throttled_response(wait):
+    response = JsonResponse({'detail': f'Request was throttled. Expected available in {math.ceil(wait)} seconds.'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+# DRF throttle (DEFAULT_THROTTLE_CLASSES). A view's throttle_scope is a scope name, or a dict of
+# HTTP method -> scope name when reads and writes are limited differently.
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if isinstance(scope, dict):
+            scope = scope.get(request.method)
+        self.retry_after = check(request, request.user, scope)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+# The same checks for plain Django function views
+def throttle(scope):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = check(request, request.user, scope)
+            if wait:
+                return throttled_response(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
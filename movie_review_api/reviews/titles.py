@@ -0,0 +1,299 @@
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, router, transaction
+
+from . import cache, jobs, search
+from .models import Movie, normalize_title
+
+# Movie title resolution
+#
+# Reviews name their movie by free text, so 'The Lion King', 'the lion king ' and 'THE  LION KING'
+# must all land on one movie. Titles are compared by normalize_title() (case, Unicode width and
+# whitespace folded), which Movie.normalized_title stores; where variants already exist, the
+# oldest movie is the one they resolve to.
+#
+# Each process keeps an index of every title: normalized title -> (id, title), so resolving a known
+# title costs no query, and a sorted list of normalized titles (also without a leading article) for
+# prefix autocomplete. It is loaded on first use and only ever holds committed rows: movies created
+# or looked up inside a transaction join it when that commits, and it is never loaded from inside
+# one. Other processes' writes are noticed through two cache versions, checked at most every
+# REFRESH_INTERVAL seconds: ('titles', 'added') when movies are created, which loads just the rows
+# past the newest id it holds, and ('titles', 'changed') when one is renamed or deleted, which
+# reloads it. Whatever else happens, an index older than MAX_AGE seconds is reloaded. A title the
+# index does not know is looked up in the database before a movie is created for it, so a stale
+# index never creates a duplicate.
+#
+# Those versions only reach every worker through a shared cache (cache.shared()). With a
+# per-process cache, resolve_many() confirms its index hits by primary key in one query before
+# using them, so a movie another worker renamed or deleted is never written against.
+#
+# upsert() syncs catalog rows in batches, one INSERT ... ON CONFLICT UPDATE per batch, and leaves
+# rows that would not change untouched.
+
+DEFAULTS = {
+    'REFRESH_INTERVAL': 1.0,  # Seconds between checks for other processes' writes
+    'MAX_AGE': 300,  # Seconds after which the index is reloaded even if no write was announced
+    'CHUNK_SIZE': 50000,  # Movies loaded per query
+    'ARTICLES': ('the', 'a', 'an'),  # Leading words autocomplete also matches without
+}
+
+UPSERT_FIELDS = ('description', 'release_date')
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_TITLES', {}).get(name, DEFAULTS[name])
+
+
+def clean_title(title):
+    # The stored form of a new title: as typed, with its whitespace collapsed
+    return ' '.join(title.split())
+
+
+class TitleIndex:
+    def __init__(self, versions):
+        self.versions = versions  # The ('titles', ...) cache versions it reflects
+        self.titles = {}  # normalized title -> (id, title)
+        self.prefixes = []  # Sorted (search key, normalized title)
+        self.max_pk = 0
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, rows):
+        # rows: (id, title, normalized title); a normalized title already present keeps its oldest movie
+        with self.lock:
+            new = []
+            for pk, title, key in rows:
+                self.max_pk = max(self.max_pk, pk)
+                current = self.titles.get(key)
+                if current is None:
+                    new.extend((search_key, key) for search_key in _search_keys(key))
+                if current is None or pk < current[0]:
+                    self.titles[key] = (pk, title)
+            if new:
+                # A new list, so a concurrent autocomplete keeps walking the one it started on
+                self.prefixes = sorted(self.prefixes + new)
+
+    def complete(self, prefix, limit):
+        prefixes = self.prefixes
+        results, seen = [], set()
+        for position in range(bisect.bisect_left(prefixes, (prefix,)), len(prefixes)):
+            search_key, key = prefixes[position]
+            if len(results) >= limit or not search_key.startswith(prefix):
+                break
+            if key not in seen:
+                seen.add(key)
+                results.append(self.titles[key])
+        return results
+
+
+def _search_keys(key):
+    yield key
+    for article in config('ARTICLES'):
+        if key.startswith(article + ' '):
+            yield key[len(article) + 1:]
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _due():
+    return _index is None or time.monotonic() - _checked_at >= config('REFRESH_INTERVAL')
+
+
+def current():
+    # This process's index, brought up to date when due; None while it has never been loaded and
+    # the caller is inside a transaction
+    global _index, _checked_at
+    if not _due() or connection.in_atomic_block:
+        return _index
+    with _lock:
+        if _due():
+            versions, _ = cache.stamp(('titles', 'added'), ('titles', 'changed'))
+            expired = _index is not None and time.monotonic() - _index.loaded_at >= config('MAX_AGE')
+            if _index is None or expired or _index.versions[1] != versions[1]:
+                _index = _load(TitleIndex(versions), Movie.objects.all())
+            elif _index.versions[0] != versions[0]:
+                _load(_index, Movie.objects.filter(pk__gt=_index.max_pk))
+                _index.versions = versions
+            _checked_at = time.monotonic()
+        return _index
+
+
+def _load(index, queryset):
+    last_pk, chunk_size = 0, config('CHUNK_SIZE')
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'title', 'normalized_title')[:chunk_size])
+        if not rows:
+            return index
+        index.add(rows)
+        last_pk = rows[-1][0]
+
+
+def clear():
+    # Drops this process's index; the next use reloads it
+    global _index
+    _index = None
+
+
+def _remember(rows):
+    # Adds database rows to the index once the surrounding transaction, if any, commits
+    if rows:
+        transaction.on_commit(lambda: _index is not None and _index.add(rows))
+
+
+def _find(keys):
+    # {normalized title: (id, title)} from the database, oldest movie per title
+    found = {}
+    for pk, title, key in (Movie.objects.filter(normalized_title__in=keys).order_by('-pk')
+                           .values_list('pk', 'title', 'normalized_title')):
+        found[key] = (pk, title)
+    _remember([(pk, title, key) for key, (pk, title) in found.items()])
+    return found
+
+
+def _create(titles_by_key):
+    # Creates a movie for each new normalized title in one INSERT; a concurrent insert of the same
+    # title is kept instead
+    Movie.objects.bulk_create([Movie(title=clean_title(title), normalized_title=key)
+                               for key, title in titles_by_key.items()], ignore_conflicts=True)
+    found = _find(list(titles_by_key))
+    for key in titles_by_key.keys() - found.keys():
+        # The database's collation matched an existing title the normalization does not (e.g. an
+        # accent-insensitive MySQL collation); that movie is the one meant
+        found[key] = Movie.objects.filter(title=clean_title(titles_by_key[key])).values_list('pk', 'title').get()
+    if search.backend() == 'index':
+        jobs.enqueue_many('search.index', [{'kind': 'movie', 'id': pk} for pk, _ in found.values()])
+    # bulk_create sends no signals, so the index and the cached movie listings are told here
+    cache.bump_on_commit(('titles', 'added'), ('movies',))
+    return found
+
+
+def lookup(title):
+    # (id, title) of the movie a title names, or None
+    key = normalize_title(title)
+    index = current()
+    if index is not None and key in index.titles and cache.shared():
+        return index.titles[key]
+    return _find([key]).get(key)
+
+
+def resolve_many(titles):
+    # {title: (id, canonical title)} for each title, creating movies for titles no movie has yet.
+    # Titles the index knows cost no query with a shared cache (one to confirm them otherwise); the
+    # rest cost one lookup, plus one INSERT if any are new.
+    keys = {title: normalize_title(title) for title in titles}
+    index = current()
+    known = index.titles if index is not None else {}
+    found = {key: known[key] for key in set(keys.values()) if key in known}
+    if found and not cache.shared():
+        found = _confirm(found)
+    missing = set(keys.values()) - found.keys()
+    if missing:
+        found.update(_find(list(missing)))
+        new = {key: title for title, key in keys.items() if key not in found}
+        if new:
+            found.update(_create(new))
+    return {title: found[key] for title, key in keys.items()}
+
+
+def _confirm(found):
+    # The index hits whose movie still has that normalized title, with its current title; a miss
+    # means another worker renamed or deleted it, so this index is dropped
+    rows = {pk: (title, key) for pk, title, key in Movie.objects.filter(pk__in=[pk for pk, _ in found.values()])
+            .values_list('pk', 'title', 'normalized_title')}
+    confirmed = {key: (pk, rows[pk][0]) for key, (pk, _) in found.items() if rows.get(pk, (None, None))[1] == key}
+    if len(confirmed) < len(found):
+        clear()
+    return confirmed
+
+
+def resolve(title):
+    # The Movie a title names, created if needed; only its id and title are loaded
+    pk, canonical = resolve_many([title])[title]
+    return Movie.from_db(router.db_for_write(Movie), ['id', 'title'], [pk, canonical])
+
+
+def autocomplete(prefix, limit=10):
+    # [(id, title)] of the movies whose title, or title without a leading article, starts with prefix
+    key = normalize_title(prefix)
+    if not key:
+        return []
+    index = current()
+    if index is None:
+        return list(Movie.objects.filter(normalized_title__startswith=key).order_by('normalized_title', 'pk')
+                    .values_list('pk', 'title')[:limit])
+    return index.complete(key, limit)
+
+
+def added(movie):
+    # A movie saved for the first time
+    _remember([(movie.pk, movie.title, movie.normalized_title)])
+    cache.bump_on_commit(('titles', 'added'))
+
+
+def changed():
+    # A movie renamed or deleted: every process reloads its index
+    def reload():
+        cache.bump('titles', 'changed')
+        clear()
+    transaction.on_commit(reload)
+
+
+# Catalog upsert
+
+@dataclass
+class UpsertResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: int = 0
+
+
+def upsert(movies, result=None):
+    # Creates or updates one batch of validated catalog rows ({'title'} plus any of UPSERT_FIELDS)
+    # in one transaction. A row updates the movie its title resolves to; fields it leaves out keep
+    # their current value. Counts are added to `result`, which is returned.
+    result = result or UpsertResult()
+    rows = {normalize_title(movie['title']): movie for movie in movies}  # The last row for a title wins
+    with transaction.atomic():
+        existing = {}
+        for pk, title, key, *values in (Movie.objects.filter(normalized_title__in=list(rows)).order_by('-pk')
+                                        .values_list('pk', 'title', 'normalized_title', *UPSERT_FIELDS)):
+            existing[key] = (pk, title, dict(zip(UPSERT_FIELDS, values)))
+
+        writes, updated = [], []
+        for key, row in rows.items():
+            given = {name: row[name] for name in UPSERT_FIELDS if name in row}
+            if key not in existing:
+                writes.append(Movie(title=clean_title(row['title']), normalized_title=key, **given))
+                continue
+            pk, title, values = existing[key]
+            if {**values, **given} == values:
+                result.unchanged += 1
+                continue
+            # Written under its stored title, so the row conflicts with (and updates) that movie
+            writes.append(Movie(title=title, normalized_title=key, **{**values, **given}))
+            updated.append(pk)
+        if writes:
+            target = {'unique_fields': ['title']} if connection.features.supports_update_conflicts_with_target else {}
+            Movie.objects.bulk_create(writes, update_conflicts=True, update_fields=list(UPSERT_FIELDS), **target)
+
+        created = _find([key for key in rows if key not in existing]) if len(writes) > len(updated) else {}
+        # bulk_create sends no signals, so the index and cached responses are told here
+        if created:
+            cache.bump_on_commit(('titles', 'added'))
+        if created or updated:
+            cache.bump_on_commit(('movies',), *[('movie', pk) for pk in updated])
+        if search.backend() == 'index':
+            jobs.enqueue_many('search.index', [{'kind': 'movie', 'id': pk}
+                                               for pk in [*updated, *(pk for pk, _ in created.values())]])
+    result.created += len(created)
+    result.updated += len(updated)
+    return result
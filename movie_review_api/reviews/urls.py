@@ -1,19 +1,41 @@
 from django.urls import path
-from . import views
-from .views import UserCreateView, ReviewListCreateView, ReviewDetailView, like_review, unlike_review, CommentListView, \
-    CommentDetailView, MovieDetailView, MovieCreateView, UserReviewListView
+from . import async_views, views
+from .views import UserCreateView, TokenView, ReviewListCreateView, ReviewDetailView, like_review, unlike_review, CommentListView, \
+    CommentDetailView, CommentTreeView, CommentThreadView, MovieDetailView, MovieCreateView, UserReviewListView, FeedView, NotificationListView, ReviewImportView, \
+    ExportView, CacheStatsView, MetricsView, SearchView, LeaderboardView, ModerationView, SimilarMoviesView, \
+    MovieUpsertView, MovieAutocompleteView
 
 urlpatterns = [
     path('register/', UserCreateView.as_view(), name='user_register'),
+    path('token/', TokenView.as_view(), name='token'),
     path('reviews/', ReviewListCreateView.as_view(), name='review_list_create'),
     path('movies/<int:movie_id>/', MovieDetailView.as_view(), name='movie_detail'),
+    path('movies/<int:movie_id>/similar/', SimilarMoviesView.as_view(), name='similar_movies'),
     path('movies/', MovieCreateView.as_view(), name='movie_create'),
+    path('movies/bulk/', MovieUpsertView.as_view(), name='movie_upsert'),
+    path('movies/autocomplete/', MovieAutocompleteView.as_view(), name='movie_autocomplete'),
     path('my-reviews/', UserReviewListView.as_view(), name='user_reviews'),
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('reviews/import/', ReviewImportView.as_view(), name='review_import'),
     path('reviews/<int:pk>/', ReviewDetailView.as_view(), name='review_detail'),
     path('reviews/<int:pk>/like/', like_review, name='like_review'),
     path('reviews/<int:pk>/unlike/', unlike_review, name='unlike_review'),
     path('reviews/<int:pk>/comments/', CommentListView.as_view(), name='comment_list'),
+    path('reviews/<int:pk>/comments/tree/', CommentTreeView.as_view(), name='comment_tree'),
     path('comments/<int:pk>/', CommentDetailView.as_view(), name='comment_detail'),
+    path('comments/<int:pk>/thread/', CommentThreadView.as_view(), name='comment_thread'),
+    path('export/<str:kind>/', ExportView.as_view(), name='export'),
+    path('moderation/<str:kind>/', ModerationView.as_view(), name='moderation'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('leaderboards/<str:board>/', LeaderboardView.as_view(), name='leaderboard'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/reviews/', async_views.review_list, name='async_review_list'),
+    path('async/movies/<int:movie_id>/', async_views.movie_detail, name='async_movie_detail'),
+    path('async/reviews/<int:pk>/like/', async_views.like_review, name='async_like_review'),
+    path('async/reviews/<int:pk>/unlike/', async_views.unlike_review, name='async_unlike_review'),
+    path('async/reviews/<int:pk>/comments/', async_views.comment_list, name='async_comment_list'),
     path('submit_review/', views.submit_review, name='submit_review'),
     path('login/', views.login_view, name='login'),
     path('', views.home_view, name='index'),  # Home page view
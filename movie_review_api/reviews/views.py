@@ -1,14 +1,32 @@
+import io
+import json
+
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse, HttpResponseForbidden
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F, Prefetch, Q
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, generics, permissions
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from .models import Review, Movie, Comment
-from .serializers import ReviewSerializer, MovieSerializer, UserSerializer, CommentSerializer
+from . import authentication, cache, conditional, feeds, leaderboards, metrics, moderation, ratings, search, \
+    similarity, threads, throttling, titles, writebehind
+from .filters import ReviewFilter
+from . import exporters
+from .importers import FORMATS, MovieImporter, ReviewImporter, format_for, read_rows
+from .models import Review, Movie, Comment, Like, Notification
+from .pagination import ReviewPagination, CommentPagination, CommentTreePagination, FeedPagination, \
+    NotificationPagination
+from .serializers import ReviewSerializer, MovieSerializer, UserSerializer, CommentSerializer, MovieRatingSerializer, \
+    MovieSummarySerializer, TopRatedSerializer, TrendingSerializer, ModerationSerializer, NotificationSerializer, \
+    SimilarMovieSerializer, parse_fields, values_columns
 
 
 # User Registration View
@@ -16,40 +34,235 @@ from .serializers import ReviewSerializer, MovieSerializer, UserSerializer, Comm
 class UserCreateView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    permission_classes = [permissions.AllowAny]  # Registering needs no account; the throttle limits it per IP
+    throttle_scope = 'register'
+
+
+# Token View
+# POST exchanges a username and password for the user's API token; PUT replaces the caller's token
+# with a new one and DELETE revokes it
+class TokenView(APIView):
+    throttle_scope = 'token'
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [permissions.AllowAny()]
+        return [permissions.IsAuthenticated()]
+
+    def post(self, request):
+        serializer = AuthTokenSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        return Response(self._body(authentication.issue(serializer.validated_data['user'])))
+
+    def put(self, request):
+        return Response(self._body(authentication.rotate(request.user)))
+
+    def delete(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _body(self, token):
+        return {'token': token.key, 'expires': authentication.expires_at(token)}
+
+
+# Columns ReviewSerializer reads, loaded with the author and movie in the same query
+REVIEW_LIST_FIELDS = ('id', 'rating', 'review_content', 'created_date', 'like_count', 'user__username', 'movie__title')
 
 
 # Review List and Create View
 # Allows authenticated users to list and create reviews
 class ReviewListCreateView(generics.ListCreateAPIView):
-    queryset = Review.objects.all()
+    queryset = Review.objects.filter(is_hidden=False).select_related('user', 'movie').only(*REVIEW_LIST_FIELDS)
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewPagination
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['movie_title', 'rating']  # Allows filtering by movie title and rating
+    filterset_class = ReviewFilter  # Allows filtering by movie, movie title and rating
+    throttle_scope = {'GET': 'review_list', 'POST': 'review_create'}
+
+    def get_queryset(self):
+        # Listed as plain rows (see ValuesListSerializer)
+        return super().get_queryset().values(*values_columns(ReviewSerializer))
+
+    def list(self, request, *args, **kwargs):
+        # A listing narrowed to one movie only goes stale when that movie's reviews change
+        movie = None
+        movie_title = request.query_params.get('movie_title')
+        if movie_title:
+            movie = Movie.objects.filter(title=movie_title).select_related('rating').first()
+        movie_id = movie.pk if movie else request.query_params.get('movie', '')
+        depends_on = [('movie', int(movie_id))] if str(movie_id).isdigit() else [('reviews',)]
+
+        def compute():
+            data = super(ReviewListCreateView, self).list(request, *args, **kwargs).data
+            if movie_title:
+                # When listing a single movie's reviews, attach its precomputed rating aggregate
+                stats = getattr(movie, 'rating', None) if movie else None
+                data['movie_rating'] = MovieRatingSerializer(stats).data if stats else None
+            return data
+
+        def build():
+            data = cache.fetch(request.build_absolute_uri(), depends_on, compute)
+            return Response({**data, 'results': writebehind.overlay(request.user, data['results'])})
+
+        if writebehind.enabled():
+            return build()  # Pending likes are overlaid per user, which the shared validators cannot see
+        return conditional.respond(request, request.build_absolute_uri(), depends_on, build)
 
 
 # Review Detail View (Retrieve, Update, Delete)
 # Allows users to view, update, or delete their own reviews
 class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related('user', 'movie')
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return visible_to(self.request.user, super().get_queryset())
+
     def get_object(self):
         review = super().get_object()
         # Restrict updates and deletions to the review author
-        if self.request.method in ['PUT', 'PATCH', 'DELETE'] and review.user != self.request.user:
+        if self.request.method in ['PUT', 'PATCH', 'DELETE'] and review.user_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to modify or delete this review.")
         return review
 
+    def retrieve(self, request, *args, **kwargs):
+        if writebehind.enabled():
+            response = super().retrieve(request, *args, **kwargs)
+            response.data = writebehind.overlay(request.user, [response.data])[0]
+            return response
+        # Any change to the review, its likes or its comments bumps ('review', pk); ('movies',)
+        # covers a rename of its movie
+        return conditional.respond(request, request.build_absolute_uri(), [('review', kwargs['pk']), ('movies',)],
+                                   lambda: super(ReviewDetailView, self).retrieve(request, *args, **kwargs))
+
+    def perform_destroy(self, instance):
+        # Deletes the review and removes its contribution from the movie's rating aggregate
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_hidden:  # Hidden reviews were already taken out
+                ratings.review_removed(instance)
+
+
+# Hidden reviews and comments are only shown to their authors and staff
+def visible_to(user, queryset):
+    if user.is_staff:
+        return queryset
+    return queryset.filter(Q(is_hidden=False) | Q(user_id=user.id))
+
+
+# Bulk Review Import View
+# Allows staff to upload a CSV or JSON Lines file of reviews; rows are streamed from the upload
+# and written in batches. Rejected rows are reported back, up to max_reported_errors of them.
+class ReviewImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+    max_reported_errors = 100
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['Upload the reviews as a file field.']})
+        fmt = request.query_params.get('format') or format_for(upload.name)
+        if fmt not in FORMATS:
+            raise ValidationError({'format': [f'Must be one of: {", ".join(FORMATS)}.']})
+        try:
+            batch_size = int(request.query_params.get('batch_size', 1000))
+        except ValueError:
+            raise ValidationError({'batch_size': ['Must be an integer.']})
+
+        errors = []
+
+        def report(line_number, row_errors, row):
+            if len(errors) < self.max_reported_errors:
+                errors.append({'line': line_number, 'errors': row_errors})
+
+        importer = ReviewImporter(batch_size=max(1, min(batch_size, 5000)), default_user=request.user,
+                                  on_error=report)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        result = importer.run(read_rows(stream, fmt))
+        return Response({'created': result.created, 'rejected': result.rejected, 'errors': errors},
+                        status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
+# Bulk Export View
+# Streams every review or comment matching the filters as NDJSON (default) or CSV (?output=csv).
+# Filters: movie and user ids, and a since/until created-date range.
+class ExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    content_types = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    def get(self, request, kind):
+        if kind not in exporters.KINDS:
+            raise Http404(f'Unknown export: {kind}')
+        params = request.query_params
+        fmt = params.get('output', 'ndjson')
+        if fmt not in exporters.FORMATS:
+            raise ValidationError({'output': [f'Must be one of: {", ".join(exporters.FORMATS)}.']})
+        filters = {}
+        try:
+            for name in ('movie', 'user'):
+                filters[name] = int(params[name]) if params.get(name) else None
+            filters['since'] = exporters.parse_bound(params.get('since'))
+            filters['until'] = exporters.parse_bound(params.get('until'))
+        except ValueError as exc:
+            raise ValidationError({'detail': [str(exc)]})
+
+        response = StreamingHttpResponse(exporters.export_lines(kind, fmt, **filters),
+                                         content_type=self.content_types[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
 
 # Movie Detail View
 # Allows users to retrieve details of a specific movie
 class MovieDetailView(APIView):
     def get(self, request, movie_id):
-        movie = get_object_or_404(Movie, pk=movie_id)
-        serializer = MovieSerializer(movie)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        fields, reviews_limit = movie_detail_options(request.query_params)
+        name = f'movie:{movie_id}:{reviews_limit}:{fields}'
+
+        def build():
+            data = cache.fetch(name, [('movie', movie_id)], lambda: self.serialize(movie_id, fields, reviews_limit))
+            return Response(data, status=status.HTTP_200_OK)
+
+        response = conditional.respond(request, name, [('movie', movie_id)], build)
+        if writebehind.enabled():
+            writebehind.record_view(movie_id)
+        return response
+
+    def serialize(self, movie_id, fields, reviews_limit):
+        movie = get_object_or_404(movie_detail_queryset(reviews_limit), pk=movie_id)
+        return MovieSerializer(movie, context={'fields': fields}).data
+
+
+# Movie detail embeds only its newest reviews: ?reviews_limit= (default 10, at most 100)
+MOVIE_REVIEWS_LIMIT = 10
+MOVIE_REVIEWS_MAX_LIMIT = 100
+
+
+def movie_detail_options(params):
+    # (fields, reviews_limit) from the query string; no reviews are loaded unless they are wanted
+    fields = parse_fields(params)
+    try:
+        reviews_limit = max(0, min(int(params.get('reviews_limit', MOVIE_REVIEWS_LIMIT)), MOVIE_REVIEWS_MAX_LIMIT))
+    except ValueError:
+        reviews_limit = MOVIE_REVIEWS_LIMIT
+    if fields is not None and 'reviews' not in fields:
+        reviews_limit = 0
+    elif not reviews_limit:
+        fields = tuple(name for name in fields or MovieSerializer.Meta.fields if name != 'reviews')
+    return fields, reviews_limit
+
+
+def movie_detail_queryset(reviews_limit):
+    # One query for the movie and its aggregate, one for its newest reviews with their authors
+    queryset = Movie.objects.select_related('rating')
+    if reviews_limit:
+        reviews = (Review.objects.filter(is_hidden=False).select_related('user').only(*REVIEW_LIST_FIELDS[:-1], 'movie_id')
+                   .order_by('-created_date', '-id')[:reviews_limit])
+        queryset = queryset.prefetch_related(Prefetch('reviews', queryset=reviews, to_attr='newest_reviews'))
+    return queryset
 
 
 # List Reviews by User
@@ -57,10 +270,37 @@ class MovieDetailView(APIView):
 class UserReviewListView(generics.ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewPagination
 
     def get_queryset(self):
-        # Returns only the reviews created by the authenticated user
-        return Review.objects.filter(user=self.request.user)
+        # Returns only the reviews created by the authenticated user, as plain rows (see ValuesListSerializer)
+        return Review.objects.filter(user=self.request.user).values(*values_columns(ReviewSerializer))
+
+
+# Notification List View
+# Likes of, comments on and replies about the user's reviews, newest first. Written by background
+# jobs, so a notification appears shortly after the write that caused it.
+class NotificationListView(generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user).select_related('actor')
+
+
+# Review Feed View
+# Recent reviews of the movies the user has reviewed or liked, newest first and cursor-paginated
+# (?cursor=, ?page_size=). Served from the user's precomputed timeline (see feeds.py).
+class FeedView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FeedPagination
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        reviews = paginator.paginate_feed(request.user, request, feeds.page)
+        data = writebehind.overlay(request.user, ReviewSerializer(reviews, many=True, context={'request': request}).data)
+        return paginator.get_paginated_response(data)
 
 
 # Create Movie View
@@ -75,62 +315,338 @@ class MovieCreateView(generics.CreateAPIView):
         serializer.save()
 
 
+# Bulk Movie Upsert View
+# Allows staff to sync the catalog: a JSON list of movies, or a CSV / JSON Lines upload, each row a
+# title plus optional description and release_date. A row updates the movie its title names (case
+# and spacing aside) and creates one otherwise, in batches (see titles.upsert).
+class MovieUpsertView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [JSONParser, MultiPartParser]
+    max_reported_errors = 100
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            fmt = request.query_params.get('format') or format_for(upload.name)
+            if fmt not in FORMATS:
+                raise ValidationError({'format': [f'Must be one of: {", ".join(FORMATS)}.']})
+            rows = read_rows(io.TextIOWrapper(upload.file, encoding='utf-8', newline=''), fmt)
+        elif isinstance(request.data, list):
+            rows = ((number, row if isinstance(row, dict) else None) for number, row in enumerate(request.data, 1))
+        else:
+            raise ValidationError({'detail': ['Send a JSON list of movies or upload them as a file field.']})
+        try:
+            batch_size = int(request.query_params.get('batch_size', 1000))
+        except ValueError:
+            raise ValidationError({'batch_size': ['Must be an integer.']})
+
+        errors = []
+
+        def report(line_number, row_errors, row):
+            if len(errors) < self.max_reported_errors:
+                errors.append({'line': line_number, 'errors': row_errors})
+
+        result = MovieImporter(batch_size=max(1, min(batch_size, 5000)), on_error=report).run(rows)
+        return Response({'created': result.created, 'updated': result.updated, 'unchanged': result.unchanged,
+                         'rejected': result.rejected, 'errors': errors})
+
+
+# Movie Autocomplete View
+# Movies whose title starts with ?q=, ignoring case, spacing and a leading article ('lion k' finds
+# 'The Lion King'), served from the in-process titles index (see titles.py); ?limit= defaults to 10
+class MovieAutocompleteView(APIView):
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            raise ValidationError({'limit': ['Must be an integer.']})
+        return Response([{'id': pk, 'title': title}
+                         for pk, title in titles.autocomplete(request.query_params.get('q', ''), limit)])
+
+
 # Views for liking and unliking reviews
+# Both are a single write against the Like table plus an F() update of Review.like_count in one
+# transaction; the unique (user, review) constraint settles concurrent clicks instead of a read.
+
 # Like a review
+@throttling.throttle('like')
 def like_review(request, pk):
     if not request.user.is_authenticated:
         return JsonResponse({'detail': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
-
-    review = get_object_or_404(Review, pk=pk)
-
-    if request.user in review.likes.all():
-        return JsonResponse({'detail': 'Already liked this review'}, status=status.HTTP_400_BAD_REQUEST)
-
-    # Add the like
-    review.likes.add(request.user)
-    return JsonResponse({'detail': 'Review liked'}, status=status.HTTP_200_OK)
+    body, code = add_like(request.user, pk)
+    return JsonResponse(body, status=code)
 
 
 # Unlike a review
+@throttling.throttle('like')
 def unlike_review(request, pk):
     if not request.user.is_authenticated:
         return JsonResponse({'detail': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    body, code = remove_like(request.user, pk)
+    return JsonResponse(body, status=code)
+
+
+# Shared by the sync views above and their async variants; return (body, status) or raise Http404
+def add_like(user, pk):
+    if writebehind.enabled():
+        liked = writebehind.is_liked(user.id, pk)
+        if liked is None:
+            raise Http404('No Review matches the given query.')
+        if liked:
+            return {'detail': 'Already liked this review'}, status.HTTP_400_BAD_REQUEST
+        writebehind.record_like(user.id, pk, True)
+        return {'detail': 'Review liked'}, status.HTTP_200_OK
+
+    try:
+        with transaction.atomic():
+            if not Review.objects.filter(pk=pk).update(like_count=F('like_count') + 1):
+                raise Http404('No Review matches the given query.')
+            # Add the like; a duplicate violates the unique constraint and rolls back the count
+            Like.objects.create(user=user, review_id=pk)
+    except IntegrityError:
+        return {'detail': 'Already liked this review'}, status.HTTP_400_BAD_REQUEST
+
+    return {'detail': 'Review liked'}, status.HTTP_200_OK
+
+
+def remove_like(user, pk):
+    if writebehind.enabled():
+        liked = writebehind.is_liked(user.id, pk)
+        if liked is None:
+            raise Http404('No Review matches the given query.')
+        if not liked:
+            return {'detail': 'Not yet liked this review'}, status.HTTP_400_BAD_REQUEST
+        writebehind.record_like(user.id, pk, False)
+        return {'detail': 'Review unliked'}, status.HTTP_200_OK
 
-    review = get_object_or_404(Review, pk=pk)
+    # Remove the like
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, review_id=pk).delete()
+        if deleted:
+            Review.objects.filter(pk=pk).update(like_count=F('like_count') - 1)
 
-    if request.user not in review.likes.all():
-        return JsonResponse({'detail': 'Not yet liked this review'}, status=status.HTTP_400_BAD_REQUEST)
+    if not deleted:
+        # Only the failure path needs to tell a missing review from one that was not liked
+        get_object_or_404(Review.objects.only('pk'), pk=pk)
+        return {'detail': 'Not yet liked this review'}, status.HTTP_400_BAD_REQUEST
 
-    # Remove the like
-    review.likes.remove(request.user)
-    return JsonResponse({'detail': 'Review unliked'}, status=status.HTTP_200_OK)
+    return {'detail': 'Review unliked'}, status.HTTP_200_OK
 
 
 # Comment List Create View
-# Allows users to list all comments and create new ones
+# Allows users to list a review's comments, newest first, and to comment on it or reply to one
+# of its comments (parent)
 class CommentListView(generics.ListCreateAPIView):
-    queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    pagination_class = CommentPagination
+    throttle_scope = {'POST': 'comment_create'}
+
+    def get_queryset(self):
+        return (Comment.objects.filter(review_id=self.kwargs['pk'], is_hidden=False)
+                .values(*values_columns(CommentSerializer)))
+
+    def list(self, request, *args, **kwargs):
+        return Response(cache.fetch(request.build_absolute_uri(), [('comments', kwargs['pk'])],
+                                    lambda: super(CommentListView, self).list(request, *args, **kwargs).data))
 
     def perform_create(self, serializer):
         # Automatically set the user to the current user when creating a comment
-        serializer.save(user=self.request.user)
+        review = get_object_or_404(Review.objects.only('pk'), pk=self.kwargs['pk'])
+        serializer.save(user=self.request.user, review_id=review.pk)
+
+
+# Comment trees are returned flat in thread order (each comment followed by its replies), with
+# depth and parent for nesting. ?depth= limits how many levels are returned (default 3).
+def thread_depth(params, default=3):
+    try:
+        return max(1, min(int(params.get('depth', default)), threads.MAX_DEPTH + 1))
+    except ValueError:
+        raise ValidationError({'depth': ['Must be an integer.']})
+
+
+# Comment Tree View
+# Allows users to read a review's comment tree to the requested depth
+class CommentTreeView(generics.ListAPIView):
+    serializer_class = CommentSerializer
+    pagination_class = CommentTreePagination
+
+    def get_queryset(self):
+        return threads.review_tree(self.kwargs['pk'], thread_depth(self.request.query_params)).select_related('user')
+
+    def list(self, request, *args, **kwargs):
+        return Response(cache.fetch(request.build_absolute_uri(), [('comments', kwargs['pk'])],
+                                    lambda: super(CommentTreeView, self).list(request, *args, **kwargs).data))
+
+
+# Comment Thread View
+# Allows users to read one comment and its replies to the requested depth
+class CommentThreadView(generics.ListAPIView):
+    serializer_class = CommentSerializer
+    pagination_class = CommentTreePagination
+
+    def get_queryset(self):
+        return threads.subtree(self.kwargs['pk'], thread_depth(self.request.query_params) - 1).select_related('user')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data['results'] and not request.query_params.get('cursor'):
+            raise Http404('No Comment matches the given query.')
+        return response
 
 
 # Comment Detail View (Retrieve, Update, Delete)
 # Allows users to retrieve, update, or delete a specific comment
 class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('user')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return visible_to(self.request.user, super().get_queryset())
+
     def get_object(self):
         comment = super().get_object()
         # Allow the comment owner to delete or update their comment, but anyone can view it.
-        if self.request.method in ['PUT', 'PATCH', 'DELETE'] and comment.user != self.request.user:
+        if self.request.method in ['PUT', 'PATCH', 'DELETE'] and comment.user_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to modify or delete this comment.")
         return comment
 
+    def perform_destroy(self, instance):
+        # Deletes the comment with its replies and uncounts it from the comment it answered
+        with transaction.atomic():
+            instance.delete()
+            threads.comment_removed(instance)
+
+
+# Bulk Moderation View
+# Allows staff to delete, hide or unhide every review or comment matching a filter (or a list of
+# ids). The work runs in chunked transactions and streams one NDJSON progress line per chunk.
+class ModerationView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, kind):
+        if kind not in moderation.KINDS:
+            raise Http404(f'Unknown moderation target: {kind}')
+        serializer = ModerationSerializer(data=request.data, context={'kind': kind})
+        serializer.is_valid(raise_exception=True)
+        options = dict(serializer.validated_data)
+        action, chunk_size = options.pop('action'), options.pop('chunk_size')
+        queryset = moderation.matching(kind, **options)
+        return StreamingHttpResponse(self.progress(kind, action, queryset, chunk_size),
+                                     content_type='application/x-ndjson')
+
+    def progress(self, kind, action, queryset, chunk_size):
+        # Chunks already committed stay committed if a later one fails
+        try:
+            for report in moderation.run(kind, action, queryset, chunk_size):
+                yield json.dumps(report) + '\n'
+        except DatabaseError as exc:
+            yield json.dumps({'error': str(exc)}) + '\n'
+            return
+        yield json.dumps({'done': True}) + '\n'
+
+
+# Search View
+# Relevance-ranked search over review content (?type=reviews, the default) or movie titles and
+# descriptions (?type=movies). Results are keyset-paginated on (score, id) via ?cursor=.
+class SearchView(APIView):
+    types = {
+        'reviews': ('review', Review.objects.filter(is_hidden=False).select_related('user', 'movie')
+                    .only(*REVIEW_LIST_FIELDS),
+                    ReviewSerializer),
+        'movies': ('movie', Movie.objects.all(), MovieSummarySerializer),
+    }
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['A search query is required.']})
+        if params.get('type', 'reviews') not in self.types:
+            raise ValidationError({'type': [f'Must be one of: {", ".join(self.types)}.']})
+        kind, queryset, serializer_class = self.types[params.get('type', 'reviews')]
+        try:
+            page_size = min(int(params.get('page_size', self.page_size)), self.max_page_size)
+            after = search.decode_cursor(params['cursor']) if params.get('cursor') else None
+        except (TypeError, ValueError):
+            raise ValidationError({'detail': ['Invalid page_size or cursor.']})
+
+        ranked = search.search(kind, query, limit=page_size + 1, after=after)
+        has_next = len(ranked) > page_size
+        ranked = ranked[:page_size]
+        objects = queryset.in_bulk([object_id for object_id, _ in ranked])
+
+        results = []
+        for object_id, score in ranked:
+            if object_id in objects:
+                results.append({'score': round(score, 4), **serializer_class(objects[object_id]).data})
+        next_link = None
+        if has_next:
+            last_id, last_score = ranked[-1]
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                            search.encode_cursor(last_score, last_id))
+        return Response({'next': next_link, 'results': results})
+
+
+# Leaderboard View
+# Serves the precomputed top-rated (Bayesian average) and trending (time-decayed activity) lists
+class LeaderboardView(APIView):
+    boards = {
+        'top-rated': (leaderboards.top_rated, TopRatedSerializer),
+        'trending': (leaderboards.trending, TrendingSerializer),
+    }
+    default_limit = 10
+    max_limit = 100
+
+    def get(self, request, board):
+        if board not in self.boards:
+            raise Http404(f'Unknown leaderboard: {board}')
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': ['Must be an integer.']})
+        entries, serializer_class = self.boards[board]
+        return Response(serializer_class(entries(limit), many=True).data)
+
+
+# Similar Movies View
+# "Users who liked this also liked": the movie's precomputed neighbours, best first (?limit=,
+# default 10), read in one query (see similarity.py)
+class SimilarMoviesView(APIView):
+    default_limit = 10
+
+    def get(self, request, movie_id):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), similarity.config('TOP_K')))
+        except ValueError:
+            raise ValidationError({'limit': ['Must be an integer.']})
+        return Response(cache.fetch(f'similar:{movie_id}:{limit}', [('similar',)],
+                                    lambda: SimilarMovieSerializer(similarity.similar(movie_id, limit), many=True).data))
+
+
+# Cache Stats View
+# Allows staff to read the response cache's hit, stale and miss counters
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(cache.stats())
+
+
+# Metrics View
+# Allows staff (or a scraper holding a staff token) to read this process's request metrics in the
+# Prometheus text format
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 # HTML
 def login_view(request):
@@ -138,12 +654,15 @@ def login_view(request):
 
 
 def home_view(request):
-    return render(request, 'reviews/index.html')
+    return render(request, 'reviews/index.html', {
+        'top_rated': leaderboards.top_rated(10),
+        'trending': leaderboards.trending(10),
+    })
 
 
 def movie_detail_view(request, movie_id):
     movie = Movie.objects.get(pk=movie_id)
-    reviews = Review.objects.filter(movie_title=movie)
+    reviews = Review.objects.filter(movie=movie, is_hidden=False).select_related('user')
     return render(request, 'reviews/movie_detail.html', {'movie': movie, 'reviews': reviews})
 
 
@@ -159,13 +678,27 @@ def submit_review(request):
         rating = request.POST.get('rating')
         review_content = request.POST.get('review_content')
 
+        try:
+            rating = int(rating)
+        except (TypeError, ValueError):
+            rating = None
+        if rating not in ratings.RATING_CHOICES:
+            messages.error(request, 'Rating must be between 1 and 5.')
+            return render(request, 'reviews/submit_review.html')
+        if not movie_title:
+            messages.error(request, 'A movie title is required.')
+            return render(request, 'reviews/submit_review.html')
+
         # Create a new review and associate it with the current user
-        review = Review.objects.create(
-            user=request.user,
-            movie_title=movie_title,
-            rating=rating,
-            review_content=review_content,
-        )
+        movie = titles.resolve(movie_title)
+        with transaction.atomic():
+            review = Review.objects.create(
+                user=request.user,
+                movie=movie,
+                rating=rating,
+                review_content=review_content,
+            )
+            ratings.review_added(review)
 
         # Add a success message
         messages.success(request, 'Review submitted successfully!')
@@ -0,0 +1,358 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import cache, feeds, jobs, leaderboards
+from .models import Like, Movie, Review, raw_delete
+
+logger = logging.getLogger(__name__)
+
+# Write-behind buffering for likes and movie views
+#
+# With REVIEWS_WRITE_BEHIND['ENABLED'], like/unlike requests only record the (user, review) pair's
+# new state in a buffer, coalescing repeated clicks, and movie detail views bump a counter. flush()
+# applies everything pending in one transaction: a bulk_create and a delete for the likes, one
+# like_count update per touched review and one view_count update per viewed movie. It runs from a
+# daemon thread every FLUSH_INTERVAL seconds and from the flush_write_behind command.
+#
+# Each buffered pair keeps (base, liked): its state before the first pending click and after the
+# last one. Requests read through the buffer, so users see their own likes (and the like_count
+# they imply) before the flush.
+#
+# BACKEND decides what a crash can lose:
+#   'memory' - a per-process dict. Cheapest; a killed process loses up to FLUSH_INTERVAL seconds of
+#              clicks (a clean shutdown flushes), and the overlay is only seen by the same process.
+#   'cache'  - the shared cache (use Redis). Pending clicks survive worker crashes, any process or
+#              the command can flush them, and the overlay is seen by every worker.
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BACKEND': 'memory',
+    'FLUSH_INTERVAL': 1.0,  # Seconds between background flushes
+    'FLUSH_THREAD': True,  # Flush from a daemon thread in every process (else only via the command)
+    'MAX_PENDING': 10000,  # Flush inline once this many pairs are pending (memory backend)
+    'CACHE_ALIAS': 'default',
+    'STATE_TIMEOUT': 3600,  # Seconds a pending pair survives in the cache if flushing stops
+    'GAP_TIMEOUT': 30,  # Seconds before a cache event slot that never arrived is skipped
+}
+
+LOOKUP_CHUNK_SIZE = 500  # Reviews per query when reading which pending pairs are already liked
+
+
+def config(name):
+    return getattr(settings, 'REVIEWS_WRITE_BEHIND', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return config('ENABLED')
+
+
+class Batch:
+    def __init__(self, likes, views, mark=None):
+        self.likes = likes  # (user_id, review_id) -> (base, liked)
+        self.views = views  # movie_id -> views
+        self.mark = mark  # Backend bookkeeping
+
+
+class MemoryBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.likes = {}
+        self.flushing = {}  # Drained but not yet committed; still visible to reads
+        self.views = Counter()
+
+    def state(self, user_id, review_id):
+        key = (user_id, review_id)
+        with self.lock:
+            return self.likes.get(key) or self.flushing.get(key)
+
+    def states(self, user_id, review_ids):
+        with self.lock:
+            return {review_id: state for review_id in review_ids
+                    if (state := self.likes.get((user_id, review_id)) or self.flushing.get((user_id, review_id)))}
+
+    def record(self, user_id, review_id, base, liked):
+        key = (user_id, review_id)
+        with self.lock:
+            self.likes[key] = (self.likes[key][0] if key in self.likes else base, liked)
+            return len(self.likes)
+
+    def view(self, movie_id):
+        with self.lock:
+            self.views[movie_id] += 1
+
+    def drain(self):
+        with self.lock:
+            if self.flushing:
+                return None  # Another thread is flushing
+            self.flushing, self.likes = self.likes, {}
+            views, self.views = self.views, Counter()
+            return Batch(dict(self.flushing), views)
+
+    def done(self, batch):
+        with self.lock:
+            self.flushing = {}
+
+    def restore(self, batch):
+        # Put a failed batch back underneath anything recorded since
+        with self.lock:
+            for key, (base, liked) in batch.likes.items():
+                self.likes[key] = (base, self.likes[key][1]) if key in self.likes else (base, liked)
+            self.views.update(batch.views)
+            self.flushing = {}
+
+    def clear(self):
+        with self.lock:
+            self.likes, self.flushing, self.views = {}, {}, Counter()
+
+
+class CacheBuffer:
+    # Pair states live under their own keys; every click also appends the pair to an event log of
+    # numbered slots so a flusher can find what changed. View counters log their movie when they
+    # go from 0 to 1.
+
+    def __init__(self):
+        self.gap_seen = None  # (slot, first time it was found missing)
+
+    def _cache(self):
+        return caches[config('CACHE_ALIAS')]
+
+    def _key(self, *parts):
+        return ':'.join(['reviews', 'wb', *map(str, parts)])
+
+    def _incr(self, key, delta=1):
+        try:
+            return self._cache().incr(key, delta)
+        except ValueError:
+            if self._cache().add(key, delta, timeout=None):
+                return delta
+            return self._cache().incr(key, delta)
+
+    def _log(self, event):
+        self._cache().set(self._key('event', self._incr(self._key('seq'))), event, timeout=None)
+
+    def state(self, user_id, review_id):
+        return self._cache().get(self._key('like', user_id, review_id))
+
+    def states(self, user_id, review_ids):
+        keys = {self._key('like', user_id, review_id): review_id for review_id in review_ids}
+        return {keys[key]: state for key, state in self._cache().get_many(keys).items()}
+
+    def record(self, user_id, review_id, base, liked):
+        key = self._key('like', user_id, review_id)
+        previous = self._cache().get(key)
+        self._cache().set(key, (previous[0] if previous else base, liked), timeout=config('STATE_TIMEOUT'))
+        self._log(('like', user_id, review_id))
+        return 0  # Pending size is unknown; the background flush keeps it bounded
+
+    def view(self, movie_id):
+        if self._incr(self._key('views', movie_id)) == 1:
+            self._log(('view', movie_id))
+
+    def drain(self):
+        cache_ = self._cache()
+        if not cache_.add(self._key('flush-lock'), 1, timeout=60):
+            return None
+        start = cache_.get(self._key('flushed'), 0)
+        end = cache_.get(self._key('seq'), 0)
+        slots = list(range(start + 1, end + 1))
+        events = cache_.get_many([self._key('event', slot) for slot in slots])
+
+        # Only a contiguous run of slots is taken: a missing one is usually a click still being
+        # written, unless it stays missing past GAP_TIMEOUT (its writer died)
+        last = start
+        for slot in slots:
+            if self._key('event', slot) not in events:
+                if self.gap_seen and self.gap_seen[0] == slot and time.monotonic() - self.gap_seen[1] > config('GAP_TIMEOUT'):
+                    logger.warning('Skipping write-behind event slot %s that was never written', slot)
+                    last = slot
+                    continue
+                if not self.gap_seen or self.gap_seen[0] != slot:
+                    self.gap_seen = (slot, time.monotonic())
+                break
+            last = slot
+
+        pairs, movies = set(), set()
+        for slot in range(start + 1, last + 1):
+            event = events.get(self._key('event', slot))
+            if event and event[0] == 'like':
+                pairs.add(event[1:])
+            elif event:
+                movies.add(event[1])
+        states = cache_.get_many([self._key('like', *pair) for pair in pairs])
+        likes = {pair: states[self._key('like', *pair)] for pair in pairs if self._key('like', *pair) in states}
+        counts = cache_.get_many([self._key('views', movie_id) for movie_id in movies])
+        views = Counter({movie_id: counts.get(self._key('views', movie_id), 0) for movie_id in movies})
+        return Batch(likes, +views, mark=(start, last))
+
+    def done(self, batch):
+        cache_ = self._cache()
+        start, last = batch.mark
+        # Drop pair states that have not changed since they were drained
+        keys = {self._key('like', *pair): pair for pair in batch.likes}
+        cache_.delete_many([key for key, state in cache_.get_many(keys).items() if state == batch.likes[keys[key]]])
+        for movie_id, views in batch.views.items():
+            if self._incr(self._key('views', movie_id), -views) > 0:
+                self._log(('view', movie_id))  # Views that arrived during the flush
+        cache_.set(self._key('flushed'), last, timeout=None)
+        cache_.delete_many([self._key('event', slot) for slot in range(start + 1, last + 1)])
+        cache_.delete(self._key('flush-lock'))
+
+    def restore(self, batch):
+        # Nothing was consumed; the same slots are retried on the next flush
+        self._cache().delete(self._key('flush-lock'))
+
+    def clear(self):
+        self._cache().delete_many([self._key(name) for name in ('seq', 'flushed', 'flush-lock')])
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def buffer():
+    backend = config('BACKEND')
+    with _buffers_lock:
+        if backend not in _buffers:
+            _buffers[backend] = {'memory': MemoryBuffer, 'cache': CacheBuffer}[backend]()
+        return _buffers[backend]
+
+
+# Request side
+
+def is_liked(user_id, review_id):
+    # The user's current like state including pending clicks; None if the review does not exist
+    state = buffer().state(user_id, review_id)
+    if state is not None:
+        return state[1]
+    return (Review.objects.filter(pk=review_id)
+            .values_list(Exists(Like.objects.filter(user_id=user_id, review_id=OuterRef('pk'))), flat=True)
+            .first())
+
+
+def record_like(user_id, review_id, liked):
+    pending = buffer().record(user_id, review_id, not liked, liked)
+    _start_flusher()
+    if pending >= config('MAX_PENDING'):
+        flush()
+
+
+def record_view(movie_id):
+    buffer().view(movie_id)
+    _start_flusher()
+
+
+def overlay(user, reviews):
+    # Adds the user's own pending likes to serialized reviews' like_count
+    if not enabled() or not user.is_authenticated or not reviews:
+        return reviews
+    states = buffer().states(user.id, [review['id'] for review in reviews])
+    if not states:
+        return reviews
+    return [{**review, 'like_count': review['like_count'] + states[review['id']][1] - states[review['id']][0]}
+            if review['id'] in states else review for review in reviews]
+
+
+# Flush side
+
+def flush():
+    # Applies everything pending; returns (likes added, likes removed, views counted)
+    pending = buffer()
+    batch = pending.drain()
+    if batch is None:
+        return 0, 0, 0
+    try:
+        with transaction.atomic():
+            added, removed = _apply_likes(batch.likes)
+            for movie_id, views in batch.views.items():
+                Movie.objects.filter(pk=movie_id).update(view_count=F('view_count') + views)
+    except Exception:
+        pending.restore(batch)
+        raise
+    pending.done(batch)
+    return added, removed, sum(batch.views.values())
+
+
+def _apply_likes(likes):
+    if not likes:
+        return 0, 0
+    movies = dict(Review.objects.filter(pk__in={review_id for _, review_id in likes}).values_list('pk', 'movie_id'))
+    existing = _existing_likes(likes)
+
+    # Pairs whose review has been deleted since the click are dropped
+    created = [pair for pair, (_, liked) in likes.items() if liked and pair not in existing and pair[1] in movies]
+    deleted = [pair for pair, (_, liked) in likes.items() if not liked and pair in existing]
+    Like.objects.bulk_create([Like(user_id=user_id, review_id=review_id) for user_id, review_id in created])
+    if deleted:
+        # Raw delete: nothing cascades from likes, and the per-row signals are replaced below
+        raw_delete(Like.objects.filter(pk__in=[existing[pair] for pair in deleted]))
+
+    deltas = Counter(review_id for _, review_id in created)
+    deltas.subtract(review_id for _, review_id in deleted)
+    for review_id, delta in deltas.items():
+        if delta:
+            Review.objects.filter(pk=review_id).update(like_count=F('like_count') + delta)
+
+    touched = {movies[review_id] for review_id in deltas}
+    cache.bump_on_commit(('reviews',), *(('review', review_id) for review_id in deltas),
+                         *(('movie', movie_id) for movie_id in touched))
+    leaderboards.likes_added(Counter(movies[review_id] for _, review_id in created))
+    feeds.follow((user_id, movies[review_id]) for user_id, review_id in created)
+    jobs.enqueue_many('notifications.like', ({'user': user_id, 'review': review_id} for user_id, review_id in created))
+    return len(created), len(deleted)
+
+
+def _existing_likes(pairs):
+    # {(user_id, review_id): like pk} for the pairs already liked. Read a chunk of reviews at a time
+    # with plain IN lists; the rows for other pairs of the same users and reviews are dropped here.
+    existing = {}
+    review_ids = sorted({review_id for _, review_id in pairs})
+    for start in range(0, len(review_ids), LOOKUP_CHUNK_SIZE):
+        chunk = set(review_ids[start:start + LOOKUP_CHUNK_SIZE])
+        users = {user_id for user_id, review_id in pairs if review_id in chunk}
+        for user_id, review_id, pk in (Like.objects.filter(review_id__in=chunk, user_id__in=users)
+                                       .values_list('user_id', 'review_id', 'pk')):
+            if (user_id, review_id) in pairs:
+                existing[user_id, review_id] = pk
+    return existing
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _start_flusher():
+    global _flusher
+    if not config('FLUSH_THREAD') or (_flusher and _flusher.is_alive()):
+        return
+    with _flusher_lock:
+        if not (_flusher and _flusher.is_alive()):
+            _flusher = threading.Thread(target=_flush_forever, name='write-behind-flusher', daemon=True)
+            _flusher.start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(config('FLUSH_INTERVAL'))
+        try:
+            flush()
+        except Exception:
+            logger.exception('Write-behind flush failed; retrying in %ss', config('FLUSH_INTERVAL'))
+        finally:
+            connection.close()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _flusher is not None:
+        try:
+            flush()
+        except Exception:
+            logger.exception('Write-behind flush at exit failed')